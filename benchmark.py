@@ -0,0 +1,85 @@
+import argparse
+import os
+import tempfile
+import time
+import pandas as pd
+import pyarrow.parquet as pq
+
+# (codec, level) pairs compared by default; None keeps the codec's own default level
+CODECS = [
+    ("none", None),
+    ("snappy", None),
+    ("lz4", None),
+    ("gzip", None),
+    ("zstd", 1),
+    ("zstd", 3),
+    ("zstd", 9),
+]
+
+
+def timed(function, *args, **kwargs):
+    """Runs `function` and returns its result with the elapsed wall time in seconds."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_codecs(file_path, row_group_size, scan_days=7, codecs=CODECS):
+    """
+    Rewrites a pruned month with each codec and measures write time, file size, a full scan
+    and a date-range scan that can skip row groups by their `pickup_datetime` statistics.
+
+    Parameters:
+    - file_path (str): A pruned Parquet file written by the transformation stage.
+    - row_group_size (int): Rows per row group of the rewritten files.
+    - scan_days (int): Length of the date-range scan, from the first pickup day.
+    - codecs (list): (codec, level) pairs to compare.
+
+    Returns:
+    - DataFrame: One row per codec.
+    """
+    table = pq.read_table(file_path).sort_by("pickup_datetime")
+    start = pd.Timestamp(table["pickup_datetime"][0].as_py()).normalize()
+    end = start + pd.Timedelta(days=scan_days)
+    date_range = [("pickup_datetime", ">=", start), ("pickup_datetime", "<", end)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for codec, level in codecs:
+            path = os.path.join(tmp_dir, f"{codec}-{level}.parquet")
+            _, write_seconds = timed(
+                pq.write_table,
+                table,
+                path,
+                row_group_size=row_group_size,
+                compression=codec,
+                compression_level=level,
+            )
+            _, scan_seconds = timed(pq.read_table, path)
+            _, range_seconds = timed(pq.read_table, path, filters=date_range)
+            results.append(
+                {
+                    "codec": codec if level is None else f"{codec}({level})",
+                    "size_mb": os.path.getsize(path) / 1024 / 1024,
+                    "write_s": write_seconds,
+                    "scan_s": scan_seconds,
+                    f"scan_{scan_days}d_s": range_seconds,
+                }
+            )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare Parquet codecs on a pruned month of taxi trips."
+    )
+    parser.add_argument("file_path", help="pruned Parquet file to rewrite")
+    parser.add_argument("--row-group-size", type=int, default=262144)
+    parser.add_argument("--scan-days", type=int, default=7)
+    args = parser.parse_args()
+
+    print(
+        benchmark_codecs(args.file_path, args.row_group_size, args.scan_days)
+        .round(3)
+        .to_string(index=False)
+    )
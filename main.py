@@ -1,31 +1,46 @@
 from src.pipeline.stage_data_ingestion import DataIngestionTrainingPipeline
 from src.pipeline.stage_data_transformation import DataTransformationTrainingPipeline
 from src.pipeline.stage_data_visualization import DataVisualizationTrainingPipeline
+from src.pipeline.stage_streaming import StreamingIngestionTransformationPipeline
+from src.config.config import ConfigurationManager
 from src.utils.logger import logger
 from src.utils.exception import CustomException
 import sys
 
 
-STAGE_NAME = "Data Ingestion"
-try:
-    logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<<")
-    data_ingestion = DataIngestionTrainingPipeline()
-    data_ingestion.main()
-    logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<<")
-except Exception as e:
-    logger.exception(e)
-    raise CustomException(e, sys)
+PIPELINE_MODE = ConfigurationManager().get_pipeline_config().mode
 
+if PIPELINE_MODE == "streaming":
+    STAGE_NAME = "Data Ingestion and Transformation"
+    try:
+        logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<<")
+        streaming_pipeline = StreamingIngestionTransformationPipeline()
+        streaming_pipeline.main()
+        logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<<")
+    except Exception as e:
+        logger.exception(e)
+        raise CustomException(e, sys)
 
-STAGE_NAME = "Data Transformation"
-try:
-    logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<<")
-    data_transformation = DataTransformationTrainingPipeline()
-    data_transformation.main()
-    logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<<")
-except Exception as e:
-    logger.exception(e)
-    raise CustomException(e, sys)
+else:
+    STAGE_NAME = "Data Ingestion"
+    try:
+        logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<<")
+        data_ingestion = DataIngestionTrainingPipeline()
+        data_ingestion.main()
+        logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<<")
+    except Exception as e:
+        logger.exception(e)
+        raise CustomException(e, sys)
+
+    STAGE_NAME = "Data Transformation"
+    try:
+        logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<<")
+        data_transformation = DataTransformationTrainingPipeline()
+        data_transformation.main()
+        logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<<")
+    except Exception as e:
+        logger.exception(e)
+        raise CustomException(e, sys)
 
 
 STAGE_NAME = "Data Visualization"
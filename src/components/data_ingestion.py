@@ -3,62 +3,478 @@ from src.utils.logger import logger
 from src.utils.utils import *
 from src.constants import *
 from src.entity import DataIngestionConfig
+from src.utils.parquet_catalog import ParquetCatalog
 
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+import pyarrow.parquet as pq
+import threading
 import requests
+import yaml
+import random
 import time
 import sys
 
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class MonthNotPublished(CustomException):
+    """Raised when the server answers 404 for a month that is not published yet."""
+
+
+class CircuitOpen(CustomException):
+    """Raised when the circuit breaker refuses a request to a degraded server."""
+
+
+class CircuitBreaker:
+    """
+    Shared failure counter that stops every download thread from hammering a degraded server.
+
+    After `failure_threshold` consecutive failures the breaker opens and refuses requests for
+    `cooldown` seconds. It then lets a single trial request through: a success closes it again,
+    a failure re-opens it for another cooldown.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns True if a request may be sent now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if (
+                self.trial_in_flight
+                or time.monotonic() - self.opened_at < self.cooldown
+            ):
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(
+                        f"Circuit breaker opened after {self.failures} consecutive failures"
+                    )
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
 
 class DataIngestion:
     def __init__(self, config: DataIngestionConfig):
         self.config = config
+        self.session = self.create_session()
+        self.breaker = CircuitBreaker(
+            config.breaker_failure_threshold, config.breaker_cooldown
+        )
+        self.manifest_path = os.path.join(config.root_dir, config.manifest_file_name)
+        self.manifest = self.load_manifest()
+        self._manifest_lock = threading.Lock()
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+
+    def create_session(self):
+        """
+        Creates one pooled HTTP session shared by every download.
+
+        Returns:
+            - requests.Session: Session whose connection pool is sized to the per-host cap.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.config.max_connections_per_host,
+            pool_block=True,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def host_slot(self, url):
+        """
+        Returns the semaphore that caps concurrent requests to the host of a URL.
+
+        Parameters:
+            - url (str): The URL about to be requested.
+
+        Returns:
+            - threading.BoundedSemaphore: The semaphore for the URL's host.
+        """
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.config.max_connections_per_host
+                )
+            return self._host_slots[host]
+
+    def load_manifest(self):
+        """
+        Loads the ingestion manifest recording what was downloaded for each month.
+
+        Returns:
+            - dict: Entries keyed by "YYYY-MM" with the ETag, Last-Modified, size and SHA-256 of the file.
+        """
+        if not os.path.exists(self.manifest_path):
+            return {}
+        return load_yaml(self.manifest_path) or {}
+
+    def update_manifest(self, year, month, response, file_path):
+        """
+        Records the validators and content hash of a freshly downloaded month and persists the manifest.
+
+        Parameters:
+            - year (int): The year of the downloaded file.
+            - month (int): The month of the downloaded file.
+            - response (requests.Response): The response the file was downloaded with.
+            - file_path (str): The downloaded file.
+        """
+        entry = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": os.path.getsize(file_path),
+            "sha256": get_file_hash(file_path),
+        }
+        with self._manifest_lock:
+            self.manifest[f"{year:04d}-{month:02d}"] = entry
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w") as file:
+                yaml.safe_dump(self.manifest, file)
+            os.replace(tmp_path, self.manifest_path)
+
+    def conditional_headers(self, year, month, file_path):
+        """
+        Builds the If-None-Match / If-Modified-Since headers to revalidate a downloaded month.
+
+        Files downloaded before the manifest existed are revalidated against their modification time.
+
+        Parameters:
+            - year (int): The year of the file.
+            - month (int): The month of the file.
+            - file_path (str): The local copy of the file.
+
+        Returns:
+            - dict: The conditional request headers, empty if the file is not on disk.
+        """
+        if not os.path.exists(file_path):
+            return {}
+        entry = self.manifest.get(f"{year:04d}-{month:02d}", {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        if not headers:
+            headers["If-Modified-Since"] = formatdate(
+                os.path.getmtime(file_path), usegmt=True
+            )
+        return headers
+
+    def expected_size(self, response, offset):
+        """
+        Works out the full size of the remote file from the response headers.
+
+        Parameters:
+            - response (requests.Response): The response of a (ranged) GET request.
+            - offset (int): The number of bytes already on disk when the request was sent.
+
+        Returns:
+            - int or None: The full file size in bytes, or None if the server did not say.
+        """
+        content_range = response.headers.get("Content-Range")
+        if content_range and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            if total.isdigit():
+                return int(total)
+        content_length = response.headers.get("Content-Length")
+        if response.status_code == 200 and content_length is not None:
+            return int(content_length)
+        if response.status_code == 206 and content_length is not None:
+            return offset + int(content_length)
+        return None
+
+    def range_validator(self, response):
+        """
+        Picks the validator a resumed request sends in If-Range.
+
+        Weak ETags are not allowed in If-Range, so Last-Modified is used instead of them.
+
+        Parameters:
+            - response (requests.Response): The response the partial file was started from.
+
+        Returns:
+            - str or None: A strong ETag or the Last-Modified date, or None if the server sent neither.
+        """
+        etag = response.headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return response.headers.get("Last-Modified")
+
+    def stream_to_part(self, url, part_path, headers=None):
+        """
+        Streams a URL into a partial file in chunks, resuming from the bytes already on disk.
+
+        The validator of the response a partial file was started from is kept next to it in a
+        ".validator" file. A resumed request sends it in If-Range, so the server only answers
+        206 with the missing bytes if the remote file is unchanged, and the whole new file
+        otherwise. A partial file without a validator is downloaded again from the start.
+
+        Parameters:
+            - url (str): The URL of the Parquet file.
+            - part_path (str): The temporary file receiving the download.
+            - headers (dict, optional): Extra request headers, e.g. conditional ones.
+
+        Returns:
+            - tuple: The response and the expected full file size (None if unknown).
+        """
+        validator_path = part_path + ".validator"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = dict(headers or {})
+        if offset and os.path.exists(validator_path):
+            with open(validator_path) as file:
+                headers["If-Range"] = file.read()
+            headers["Range"] = f"bytes={offset}-"
+        else:
+            offset = 0
+
+        with self.host_slot(url):
+            with self.session.get(
+                url, headers=headers, stream=True, timeout=self.config.request_timeout
+            ) as response:
+                if response.status_code not in (200, 206):
+                    return response, self.expected_size(response, offset)
+
+                # A 200 means the file changed or the server ignored the Range header,
+                # so start over and keep the validator of the new file
+                mode = "ab" if response.status_code == 206 else "wb"
+                if mode == "wb":
+                    offset = 0
+                    validator = self.range_validator(response)
+                    if validator:
+                        with open(validator_path, "w") as file:
+                            file.write(validator)
+                    elif os.path.exists(validator_path):
+                        os.remove(validator_path)
+                expected = self.expected_size(response, offset)
+                with open(part_path, mode) as file:
+                    for chunk in response.iter_content(
+                        chunk_size=self.config.chunk_size
+                    ):
+                        file.write(chunk)
+                return response, expected
+
+    def discard_part(self, part_path):
+        """Removes a partial file and its validator."""
+        for path in (part_path, part_path + ".validator"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def is_valid_parquet(self, file_path, expected_size=None):
+        """
+        Checks that a file is a complete Parquet file without reading its data pages.
+
+        The size is compared with the expected size when known, the file must start and end
+        with the Parquet magic bytes, which a truncated download never does, and its footer
+        must parse.
+
+        Parameters:
+            - file_path (str): The file to check.
+            - expected_size (int, optional): The size announced by the server.
+
+        Returns:
+            - bool: True if the file looks complete.
+        """
+        size = os.path.getsize(file_path)
+        if expected_size is not None and size != expected_size:
+            return False
+        if size < 12:
+            return False
+        with open(file_path, "rb") as file:
+            head = file.read(4)
+            file.seek(-4, os.SEEK_END)
+            tail = file.read(4)
+        if head != PARQUET_MAGIC or tail != PARQUET_MAGIC:
+            return False
+        try:
+            pq.read_metadata(file_path)
+        except Exception:
+            return False
+        return True
+
+    def backoff_delay(self, attempt):
+        """
+        Computes an exponential backoff delay with full jitter.
+
+        Parameters:
+            - attempt (int): The zero-based number of the failed attempt.
+
+        Returns:
+            - float: Seconds to wait before the next attempt.
+        """
+        cap = min(self.config.max_backoff, self.config.backoff_factor * (2**attempt))
+        return random.uniform(0, cap)
+
+    def retry_after(self, response):
+        """
+        Reads the Retry-After header of a 429/503 response, capped at `max_backoff`.
+
+        Parameters:
+            - response (requests.Response): The throttled response.
+
+        Returns:
+            - float or None: Seconds to wait, or None if the server did not say.
+        """
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        if value.strip().isdigit():
+            delay = float(value)
+        else:
+            try:
+                retry_at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        return min(max(0.0, delay), self.config.max_backoff)
 
     def download_parquet_file(self, year: int, month: int, max_retries):
         """
         Downloads a Parquet file for a specific year and month.
 
+        The file is streamed in chunks to a ".part" file next to its target, resumed with
+        an HTTP Range / If-Range request after an interruption, checked against Content-Length and
+        the Parquet footer, and only then renamed into place.
+
+        Attempts stop at the first verified download. Connection errors and 429/5xx replies
+        are retried with jittered exponential backoff, or after the server's Retry-After
+        delay when it sends one. A 404 fails at once since the month is not published yet.
+
+        If a valid copy of the month is already on disk the request is conditional on the
+        ETag / Last-Modified recorded in the manifest, so an unchanged month costs a single 304
+        reply. A revised file replaces the old one with a fresh modification time, which marks
+        the downstream pruned file stale. An invalid copy is discarded and fetched again.
+
         Parameters:
             - year (int): The year for which to download the Parquet file.
             - month (int): The month for which to download the Parquet file.
-            - target_directory (str): The directory where the file should be saved.
+            - max_retries (int): The maximum number of download attempts.
+
+        Returns:
+            - str: "downloaded" for a new month, "revised" for a changed one, "not_modified" on a 304.
 
         Raises:
+            - MonthNotPublished: If the server answers 404.
+            - CircuitOpen: If the circuit breaker refuses the request.
             - CustomException: If an error occurs during the download.
         """
         parquet_url = self.config.source_URL.format(year, month)
+        file_name = self.config.local_data_name.format(year, month)
+        file_path = os.path.join(self.config.root_dir, file_name)
+        part_path = file_path + ".part"
+        # A truncated or corrupt local copy must not be revalidated, or a 304 would keep it
+        if os.path.exists(file_path) and not self.is_valid_parquet(file_path):
+            logger.warning(f"Discarding invalid local file {file_name}")
+            os.remove(file_path)
+        headers = self.conditional_headers(year, month, file_path)
+
+        status_code = None
+        for attempt in range(max_retries):
+            if not self.breaker.allow():
+                raise CircuitOpen(
+                    f"Circuit breaker open, skipping yellow_tripdata_{year}-{month:02d}.parquet",
+                    sys,
+                )
 
-        for i in range(max_retries):
+            wait_time = None
             try:
-                response = requests.get(parquet_url)
+                response, expected = self.stream_to_part(
+                    parquet_url, part_path, headers
+                )
             except Exception as e:
-                backoff_factor = 0.3
-                wait_time = backoff_factor * (2**i)
-                time.sleep(wait_time)
+                self.breaker.record_failure()
                 logger.error(
                     f"Connection error with yellow_tripdata_{year}-{month:02d}.parquet: {str(e)}"
                 )
+            else:
+                status_code = response.status_code
+                # 416 means the partial file already holds every byte
+                if status_code in (200, 206, 416):
+                    if self.is_valid_parquet(part_path, expected):
+                        self.breaker.record_success()
+                        os.replace(part_path, file_path)
+                        self.discard_part(part_path)
+                        self.update_manifest(year, month, response, file_path)
+                        if headers:
+                            logger.info(
+                                f"File {file_name} was revised upstream, its pruned file is now stale"
+                            )
+                            return "revised"
+                        logger.info(
+                            "File {} successfully downloaded to {}".format(
+                                file_name, self.config.root_dir
+                            )
+                        )
+                        return "downloaded"
+                    # Keep a short file for resuming, drop a full-length corrupt one
+                    if expected is None or os.path.getsize(part_path) >= expected:
+                        self.discard_part(part_path)
+                    self.breaker.record_failure()
+                    logger.error(
+                        f"Incomplete or corrupt download of yellow_tripdata_{year}-{month:02d}.parquet"
+                    )
+                elif status_code == 304:
+                    self.breaker.record_success()
+                    return "not_modified"
+                elif status_code == 404:
+                    self.breaker.record_success()
+                    raise MonthNotPublished(
+                        f"yellow_tripdata_{year}-{month:02d}.parquet is not published yet. Status code: 404",
+                        sys,
+                    )
+                elif status_code in RETRYABLE_STATUS_CODES:
+                    self.breaker.record_failure()
+                    wait_time = self.retry_after(response)
+                    logger.error(
+                        f"Server busy for yellow_tripdata_{year}-{month:02d}.parquet. Status code: {status_code}"
+                    )
+                else:
+                    # The server answered, so it is healthy even if the request is refused
+                    self.breaker.record_success()
+                    logger.error(
+                        f"Request for yellow_tripdata_{year}-{month:02d}.parquet refused. Status code: {status_code}"
+                    )
+                    break
 
-        if response.status_code == 200:
-            file_name = self.config.local_data_name.format(year, month)
-            file_path = os.path.join(self.config.root_dir, file_name)
-
-            with open(file_path, "wb") as file:
-                file.write(response.content)
-
-            logger.info(
-                "File {} successfully downloaded to {}".format(
-                    file_name, self.config.root_dir
+            if attempt < max_retries - 1:
+                time.sleep(
+                    wait_time if wait_time is not None else self.backoff_delay(attempt)
                 )
-            )
-        else:
-            logger.info(
-                f"Failed to download yellow_tripdata_{year}-{month:02d}.parquet. Status code: {response.status_code}"
-            )
-            raise CustomException(
-                f"Failed to download yellow_tripdata_{year}-{month:02d}.parquet. Status code: {response.status_code}",
-                sys,
-            )
+
+        logger.info(
+            f"Failed to download yellow_tripdata_{year}-{month:02d}.parquet. Status code: {status_code}"
+        )
+        raise CustomException(
+            f"Failed to download yellow_tripdata_{year}-{month:02d}.parquet. Status code: {status_code}",
+            sys,
+        )
 
     def extract_date(self, filename):
         """
@@ -75,30 +491,135 @@ class DataIngestion:
         month = int(year_month.split("-")[1])
         return year, month
 
-    def download_missing_parquet_files(self):
-        """
-        download_missing_parquet_files function to manage the download process for missing Parquet files.
+    def get_full_dates(self):
         """
+        Lists every (year, month) published since January 2009 up to the previous month.
 
-        # Get the list of existing files and their corresponding dates
-        files = os.listdir(self.config.root_dir)
-        existing_dates = set(map(self.extract_date, files))
-
-        # Generate a list of all possible dates up to the current month
+        Returns:
+            - list: A list of (year, month) tuples in chronological order.
+        """
         start_year = 2009
-        full_dates = [
+        now = datetime.now()
+        return [
             (year, month)
-            for year in range(start_year, datetime.now().year + 1)
+            for year in range(start_year, now.year + 1)
             for month in range(1, 13)
-            if (year, month) < (datetime.now().year, datetime.now().month)
+            if (year, month) < (now.year, now.month)
         ]
 
+    def download_month(self, date, on_downloaded=None):
+        """
+        Downloads or revalidates a single month and reports the outcome instead of raising.
+
+        Parameters:
+            - date (tuple): The (year, month) to download.
+            - on_downloaded (callable, optional): Called with the file name once a new or revised file has landed.
+
+        Returns:
+            - dict: The month's result with its "status" and, on failure, the "error".
+        """
+        try:
+            status = self.download_parquet_file(
+                date[0], date[1], self.config.max_retries
+            )
+            if on_downloaded is not None and status in ("downloaded", "revised"):
+                on_downloaded(self.config.local_data_name.format(*date))
+            return {"status": status}
+        except MonthNotPublished as e:
+            logger.info(str(e))
+            return {"status": "not_published", "error": str(e)}
+        except CircuitOpen as e:
+            return {"status": "skipped", "error": str(e)}
+        except Exception as e:
+            logger.error(str(e))
+            return {"status": "failed", "error": str(e)}
+
+    def download_missing_parquet_files(self, on_downloaded=None):
+        """
+        download_missing_parquet_files function to manage the download process for missing Parquet files.
+
+        Months are fetched by a thread pool of `max_workers` threads sharing one pooled session.
+        With `max_workers: 1` they are fetched one after another. With `revalidate: true` the
+        months already on disk are also revalidated with conditional requests. The months on disk
+        are looked up in the footer catalog, see `catalog`.
+
+        Parameters:
+            - on_downloaded (callable, optional): Called with the file name of every month that lands,
+              from the download thread. A blocking callback throttles the downloads.
+
+        Returns:
+            - dict: Per-month results keyed by "YYYY-MM", each with a "status" and an optional "error".
+        """
+
+        # Months with a readable file, from the catalog, which only reads new or changed footers
+        existing_months = self.catalog().months()
+
         # Check for missing files and download them
-        for date in full_dates:
-            if date not in existing_dates:
-                try:
-                    self.download_parquet_file(
-                        date[0], date[1], self.config.max_retries
-                    )
-                except Exception as e:
-                    logger.error(str(e))
+        missing_dates = [
+            (year, month)
+            for year, month in self.get_full_dates()
+            if self.config.revalidate
+            or f"{year:04d}-{month:02d}" not in existing_months
+        ]
+
+        results = {}
+        if self.config.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.config.max_workers) as executor:
+                futures = {
+                    executor.submit(self.download_month, date, on_downloaded): date
+                    for date in missing_dates
+                }
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+        else:
+            for date in missing_dates:
+                results[date] = self.download_month(date, on_downloaded)
+
+        summary = {
+            f"{year:04d}-{month:02d}": results[(year, month)]
+            for year, month in sorted(results)
+        }
+        counts = Counter(result["status"] for result in summary.values())
+        failed = [
+            key for key, result in summary.items() if result["status"] == "failed"
+        ]
+        logger.info(
+            f"Ingestion summary: {', '.join(f'{count} {status}' for status, count in sorted(counts.items()))}"
+        )
+        if failed:
+            logger.error(f"Failed months: {', '.join(failed)}")
+        return summary
+
+    def catalog(self):
+        """
+        Refreshes the footer catalog of the downloaded months, `catalog.json` beside them, see
+        `ParquetCatalog`. Only the footers of files that are new or changed in size or mtime
+        are read. A file whose footer cannot be read is cataloged with its error.
+
+        Returns:
+            - ParquetCatalog: The catalog, keyed by the file names in the root directory.
+        """
+        catalog = ParquetCatalog(os.path.join(self.config.root_dir, CATALOG_FILE_NAME))
+        changed, removed = catalog.refresh(self.config.root_dir)
+        for file_name, error in catalog.unreadable().items():
+            logger.error(f"Unreadable Parquet footer in {file_name}: {error}")
+        logger.info(
+            f"Catalog of {len(catalog.entries)} files updated ({len(changed)} read, {len(removed)} removed), {catalog.num_rows()} rows"
+        )
+        return catalog
+
+    def update_catalog(self):
+        """
+        Refreshes the footer catalog of the downloaded months, see `catalog`, and reports the
+        published months that are still missing.
+
+        Returns:
+            - list: The missing months as "YYYY-MM", including months whose file is unreadable.
+        """
+        catalog = self.catalog()
+        missing = catalog.missing_months(
+            f"{year:04d}-{month:02d}" for year, month in self.get_full_dates()
+        )
+        if missing:
+            logger.warning(f"Missing months: {', '.join(missing)}")
+        return missing
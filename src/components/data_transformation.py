@@ -1,31 +1,957 @@
+import dataclasses
+import hashlib
+import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
+import numpy as np
+import yaml
 from src.utils.exception import CustomException
 from src.utils.logger import logger
 from src.constants import *
+from src.utils.utils import load_yaml
+from src.utils.quantile_sketch import QuantileSketch
+from src.utils.schema_registry import canonical_name, canonical_schema, to_canonical
+from src.utils.zone_index import ZoneIndex
+from src.utils.parquet_catalog import ParquetCatalog
 from src.entity import DataTransformationConfig
 from dateutil.relativedelta import relativedelta
 
+# Canonical name of each column the cleaning needs, and the keyword that finds it in eras
+# the schema registry does not know yet
+REQUIRED_COLUMNS = {
+    "pickup_datetime": "pickup",
+    "dropoff_datetime": "dropoff",
+    "total_amount": "total",
+    "trip_distance": "trip_distance",
+}
+
+# Streaming mode: decoded pandas working set relative to the uncompressed column size,
+# covering object-dtype strings and the copies made by dropna/query
+WORKING_SET_FACTOR = 8
+MIN_BATCH_SIZE = 1024
+
+# 2009-2010 files store both timestamps as strings in this format; later eras store timestamps
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATETIME_TYPE = pa.timestamp("us")
+
+# Columns added by the cleaning
+DERIVED_COLUMNS = ("trip_duration", "speed", "date")
+
+# Coordinates of the 2009-2010 eras, read to assign taxi zones when a zone file is configured,
+# and the zone columns they are assigned to
+COORDINATE_COLUMNS = {
+    "pulocationid": ("pickup_longitude", "pickup_latitude"),
+    "dolocationid": ("dropoff_longitude", "dropoff_latitude"),
+}
+
+DTYPE_REPORT_FILE_NAME = "dtype_report.yaml"
+CACHE_INDEX_FILE_NAME = "cache_index.yaml"
+
+# Bump whenever a change to the cleaning alters the pruned output, so every month is rebuilt
+CODE_VERSION = 2
+
+# Settings that change how a month is cleaned but not what is written, left out of the cache key
+CACHE_NEUTRAL_FIELDS = (
+    "root_dir",
+    "data_path",
+    "mode",
+    "memory_budget_mb",
+    "max_workers",
+    "engine",
+    # The zone file is keyed by its fingerprint, for the months that use it only, and the
+    # grid size only changes how fast zones are assigned
+    "zone_file",
+    "zone_grid_size",
+)
+
+
+def temporary_path(output_path):
+    """Returns a dot-prefixed sibling of `output_path`, which dataset discovery ignores."""
+    folder, file_name = os.path.split(output_path)
+    return os.path.join(folder, f".{file_name}.tmp")
+
 
 class DataTransformation:
     def __init__(self, config: DataTransformationConfig):
         self.config = config
+        # In-memory bytes before/after the canonical cast for each month cleaned by this instance
+        self.dtype_savings = {}
+        # Cache key of each month cleaned by this instance, moved into its report
+        self.cache_keys = {}
+        self.cache_index_path = os.path.join(
+            self.config.root_dir, CACHE_INDEX_FILE_NAME
+        )
+        self.cache_index = self.load_cache_index()
+        # Footer catalog of the raw months, shared with the ingestion stage, see `raw_entry`
+        self.raw_catalog = ParquetCatalog(
+            os.path.join(self.config.data_path, CATALOG_FILE_NAME)
+        )
+        self.sketch = QuantileSketch(self.config.sketch_relative_accuracy)
+        self.zone_index = self.load_zone_index()
+        # Every month is cast to this schema, so pruned months concatenate without promotion
+        self.output_schema = canonical_schema(
+            [*REQUIRED_COLUMNS, *self.config.extra_columns, *DERIVED_COLUMNS],
+            self.config.dtype_plan,
+        )
+
+    def load_cache_index(self):
+        """
+        Loads the cache index kept beside the pruned outputs.
+
+        Returns:
+        - dict: File name -> {"key": cache key, "output": pruned output path} of every month
+          cleaned so far, or an empty dict on the first run.
+        """
+        if not os.path.exists(self.cache_index_path):
+            return {}
+        return load_yaml(self.cache_index_path) or {}
+
+    def load_zone_index(self):
+        """
+        Builds the zone index of `zone_file`, see `ZoneIndex`.
+
+        Returns:
+        - ZoneIndex or None: The index, or None when no zone file is configured or it does not
+          exist, in which case trips without zone columns keep null zones.
+        """
+        if not self.config.zone_file:
+            return None
+        if not os.path.exists(self.config.zone_file):
+            logger.warning(
+                f"Zone file {self.config.zone_file} not found, zones are not assigned"
+            )
+            return None
+        return ZoneIndex.from_geojson(self.config.zone_file, self.config.zone_grid_size)
+
+    def raw_entry(self, filename):
+        """
+        Returns the footer catalog entry of a raw file, see `ParquetCatalog`. The cataloged
+        entry is used while the file's size and mtime still match it, so only the footers of
+        new or revised files are read.
+
+        Parameters:
+        - filename (str): Name of the raw Parquet file inside the data directory.
+
+        Returns:
+        - dict: The entry, with the file's size, mtime_ns and columns (name -> Arrow type).
+
+        Raises:
+        - ValueError: If the file's footer cannot be read.
+        """
+        entry, _ = self.raw_catalog.lookup(self.config.data_path, filename)
+        if "error" in entry:
+            raise ValueError(
+                f"Unreadable Parquet footer in {filename}: {entry['error']}"
+            )
+        return entry
+
+    def cache_key(self, entry):
+        """
+        Derives the cache key of a month from the fingerprint of its raw file (size and
+        modification time), the settings that shape the pruned output, CODE_VERSION and, for
+        the months whose zones are assigned from coordinates (see `assigns_zones`), the
+        fingerprint of the zone file in use. Only those months are rebuilt when it changes.
+
+        Parameters:
+        - entry (dict): The raw file's catalog entry, from `raw_entry`.
+
+        Returns:
+        - str: Hex digest that changes whenever the pruned output would.
+        """
+        payload = {
+            "code_version": CODE_VERSION,
+            "input": {"size": entry["size"], "mtime_ns": entry["mtime_ns"]},
+            "config": {
+                name: value
+                for name, value in dataclasses.asdict(self.config).items()
+                if name not in CACHE_NEUTRAL_FIELDS
+            },
+        }
+        if self.zone_index is not None and self.assigns_zones(list(entry["columns"])):
+            zone_stat = os.stat(self.config.zone_file)
+            payload["zones"] = {
+                "path": os.path.abspath(self.config.zone_file),
+                "size": zone_stat.st_size,
+                "mtime_ns": zone_stat.st_mtime_ns,
+            }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def assigns_zones(self, schema_names):
+        """
+        Tells from a file's schema whether `assign_zones` adds zones to its months: a zone
+        column of COORDINATE_COLUMNS is missing and its coordinates are present.
+
+        Parameters:
+        - schema_names (list): Column names from the file footer.
+
+        Returns:
+        - bool: True if a zone column is assigned from coordinates.
+        """
+        canonical = {canonical_name(name) or name.lower() for name in schema_names}
+        return any(
+            zone_column not in canonical and {longitude, latitude} <= canonical
+            for zone_column, (longitude, latitude) in COORDINATE_COLUMNS.items()
+        )
 
     def find_column_name(self, columns, keyword):
         """Find a column name containing a specific keyword."""
         return next((col for col in columns if keyword in col), None)
 
+    def resolve_columns(self, schema_names):
+        """
+        Resolve the era-specific source columns to read from the Parquet schema alone.
+
+        Source columns are looked up in the schema registry. A required column no era knows
+        is still found by its keyword in REQUIRED_COLUMNS. With a zone index, the coordinates
+        of COORDINATE_COLUMNS are read as well, see `assign_zones`.
+
+        Parameters:
+        - schema_names (list): Column names from the file footer, e.g. `pq.read_schema(path).names`.
+
+        Returns:
+        - dict: Source column name -> canonical column name, for the required columns and any
+          `extra_columns` present in this era.
+
+        Raises:
+        - ValueError: If a required column cannot be found.
+        """
+        wanted = {*REQUIRED_COLUMNS, *self.config.extra_columns}
+        if self.zone_index is not None:
+            wanted.update(name for pair in COORDINATE_COLUMNS.values() for name in pair)
+        mapping = {}
+        for name in schema_names:
+            canonical = canonical_name(name)
+            if canonical in wanted and canonical not in mapping.values():
+                mapping[name] = canonical
+
+        lowered = [name.lower() for name in schema_names]
+        by_lower = dict(zip(lowered, schema_names))
+        for canonical, keyword in REQUIRED_COLUMNS.items():
+            if canonical in mapping.values():
+                continue
+            found = self.find_column_name(lowered, keyword)
+            if found is None:
+                raise ValueError(f"No column matching '{keyword}' in {schema_names}")
+            mapping[by_lower[found]] = canonical
+        return mapping
+
+    def normalize_datetimes(self, table):
+        """
+        Parses the pickup and dropoff columns once into timestamp[us].
+
+        String columns are parsed with the fixed DATETIME_FORMAT instead of per-row format
+        inference, unparsable values become null. Timestamp columns are only cast to microseconds.
+
+        Parameters:
+        - table (pa.Table): Trips with renamed pickup_datetime and dropoff_datetime columns.
+
+        Returns:
+        - pa.Table: The same table with both columns as timestamp[us].
+        """
+        for name in ("pickup_datetime", "dropoff_datetime"):
+            column = table[name]
+            if pa.types.is_timestamp(column.type):
+                parsed = pc.cast(column, DATETIME_TYPE, safe=False)
+            else:
+                parsed = pc.strptime(
+                    column.cast(pa.string()),
+                    format=DATETIME_FORMAT,
+                    unit="us",
+                    error_is_null=True,
+                )
+            table = table.set_column(table.schema.get_field_index(name), name, parsed)
+        return table
+
+    def prepare_table(self, table, columns):
+        """Renames the source columns to their output names and normalizes the timestamps."""
+        table = table.rename_columns([columns[name] for name in table.column_names])
+        return self.normalize_datetimes(table)
+
     def calculate_trip_duration_and_speed(self, df):
         """Calculate trip duration in seconds and speed in miles per hour."""
-        df["trip_duration"] = (
-            pd.to_datetime(df["dropoff_datetime"], errors="coerce")
-            - pd.to_datetime(df["pickup_datetime"], errors="coerce")
-        ).dt.total_seconds()
+        pickup, dropoff = df["pickup_datetime"], df["dropoff_datetime"]
+        # Normalized frames are already datetime64, raw strings are parsed with the known format
+        if not pd.api.types.is_datetime64_any_dtype(pickup):
+            pickup = pd.to_datetime(pickup, format=DATETIME_FORMAT, errors="coerce")
+        if not pd.api.types.is_datetime64_any_dtype(dropoff):
+            dropoff = pd.to_datetime(dropoff, format=DATETIME_FORMAT, errors="coerce")
+        df["trip_duration"] = (dropoff - pickup).dt.total_seconds()
         df["speed"] = df["trip_distance"] / (df["trip_duration"] / 3600)
         return df
 
+    def clean_frame(self, df, start_date_str, end_date_str):
+        """
+        Applies the cleaning rules to a DataFrame whose columns have already been renamed.
+
+        Parameters:
+        - df (DataFrame): Trips with pickup_datetime, dropoff_datetime, total_amount and trip_distance.
+        - start_date_str (str): First day of the file's month, "YYYY-MM-DD".
+        - end_date_str (str): First day of the following month, "YYYY-MM-DD".
+
+        Returns:
+        - DataFrame: The pruned trips with trip_duration, speed and date columns added.
+        """
+        df = df.dropna(
+            subset=[
+                "pickup_datetime",
+                "dropoff_datetime",
+                "total_amount",
+                "trip_distance",
+            ]
+        )
+        df = self.calculate_trip_duration_and_speed(df)
+
+        pruned_df = df.query(
+            f"{self.config.lowest_speed} < speed < {self.config.highest_speed} and "
+            f"trip_distance > {self.config.shortest_trip_distance} and "
+            f"trip_duration > {self.config.shortest_trip_duration} and "
+            f"total_amount > {self.config.least_cost} and "
+            f"'{start_date_str}' <= pickup_datetime < '{end_date_str}'"
+        ).copy()
+
+        pruned_df["date"] = pruned_df["pickup_datetime"].dt.date
+        return pruned_df
+
+    def clean_table(self, table, start_date_str, end_date_str):
+        """
+        Arrow engine: applies the same cleaning rules as `clean_frame` with pyarrow.compute,
+        without converting to pandas.
+
+        Parameters:
+        - table (pa.Table): Trips prepared by `prepare_table`.
+        - start_date_str (str): First day of the file's month, "YYYY-MM-DD".
+        - end_date_str (str): First day of the following month, "YYYY-MM-DD".
+
+        Returns:
+        - pa.Table: The pruned trips with trip_duration, speed and date columns added.
+        """
+        pickup = table["pickup_datetime"]
+        dropoff = table["dropoff_datetime"]
+
+        trip_duration = pc.divide(
+            pc.cast(pc.subtract(dropoff, pickup), pa.int64()).cast(pa.float64()), 1e6
+        )
+        trip_distance = table["trip_distance"].cast(pa.float64())
+        speed = pc.divide(trip_distance, pc.divide(trip_duration, 3600.0))
+        table = table.append_column("trip_duration", trip_duration).append_column(
+            "speed", speed
+        )
+
+        start = pa.scalar(pd.Timestamp(start_date_str), type=DATETIME_TYPE)
+        end = pa.scalar(pd.Timestamp(end_date_str), type=DATETIME_TYPE)
+        mask = pc.and_kleene(
+            pc.and_kleene(
+                pc.and_kleene(
+                    pc.greater(speed, self.config.lowest_speed),
+                    pc.less(speed, self.config.highest_speed),
+                ),
+                pc.and_kleene(
+                    pc.greater(trip_distance, self.config.shortest_trip_distance),
+                    pc.greater(trip_duration, self.config.shortest_trip_duration),
+                ),
+            ),
+            pc.and_kleene(
+                pc.and_kleene(
+                    pc.greater(table["total_amount"], self.config.least_cost),
+                    pc.greater_equal(pickup, start),
+                ),
+                pc.less(pickup, end),
+            ),
+        )
+        mask = pc.and_kleene(mask, pc.is_valid(dropoff))
+        pruned = table.filter(mask)
+        date = pc.cast(pruned["pickup_datetime"], pa.date32())
+        return pruned.append_column("date", date)
+
+    def clean_prepared(self, table, start_date_str, end_date_str):
+        """
+        Cleans a prepared table with the configured engine and assigns the zones of eras
+        that only have coordinates, see `assign_zones`.
+
+        The pandas engine's result is converted back with the source column types, so both
+        engines hand the same Arrow types to `cast_to_canonical`.
+
+        Parameters:
+        - table (pa.Table): Trips prepared by `prepare_table`.
+        - start_date_str (str): First day of the file's month, "YYYY-MM-DD".
+        - end_date_str (str): First day of the following month, "YYYY-MM-DD".
+
+        Returns:
+        - pa.Table: The pruned trips.
+        """
+        if self.config.engine == "arrow":
+            return self.assign_zones(
+                self.clean_table(table, start_date_str, end_date_str)
+            )
+
+        pruned_df = self.clean_frame(table.to_pandas(), start_date_str, end_date_str)
+        schema = (
+            table.schema.remove_metadata()
+            .append(pa.field("trip_duration", pa.float64()))
+            .append(pa.field("speed", pa.float64()))
+            .append(pa.field("date", pa.date32()))
+        )
+        return self.assign_zones(
+            pa.Table.from_pandas(pruned_df, schema=schema, preserve_index=False)
+        )
+
+    def assign_zones(self, table):
+        """
+        Assigns the pickup and dropoff zones of trips that have coordinates instead of zone
+        ids (2009-2010) with the zone index, so these months can be analysed by zone like the
+        later ones.
+
+        Parameters:
+        - table (pa.Table): The pruned trips.
+
+        Returns:
+        - pa.Table: The table with pulocationid and dolocationid added, null for points outside
+          every zone, or the table unchanged without a zone index or coordinates.
+        """
+        if self.zone_index is None:
+            return table
+        for zone_column, (longitude, latitude) in COORDINATE_COLUMNS.items():
+            if zone_column in table.column_names or not {longitude, latitude} <= set(
+                table.column_names
+            ):
+                continue
+            zones = self.zone_index.lookup(
+                pc.cast(table[longitude], pa.float64()).to_numpy(zero_copy_only=False),
+                pc.cast(table[latitude], pa.float64()).to_numpy(zero_copy_only=False),
+            )
+            table = table.append_column(
+                zone_column, pa.array(zones, mask=zones == 0).cast(pa.int16())
+            )
+        return table
+
+    def clean_batch(self, batch, columns, start_date_str, end_date_str):
+        """
+        Cleans one record batch with the configured engine.
+
+        Parameters:
+        - batch (pa.RecordBatch): Raw trips holding the source columns.
+        - columns (dict): Source column name -> output column name, from `resolve_columns`.
+        - start_date_str (str): First day of the file's month, "YYYY-MM-DD".
+        - end_date_str (str): First day of the following month, "YYYY-MM-DD".
+
+        Returns:
+        - pa.Table: The pruned batch.
+        """
+        table = self.prepare_table(pa.Table.from_batches([batch]), columns)
+        return self.clean_prepared(table, start_date_str, end_date_str)
+
+    def cast_to_canonical(self, table):
+        """
+        Casts the pruned columns once to the canonical schema of the schema registry, with the
+        compact types of `dtype_plan` where it overrides them, before writing.
+
+        Columns are put in canonical order and `extra_columns` this era does not have are added
+        as nulls, so every month has exactly `output_schema`.
+
+        Parameters:
+        - table (pa.Table): The pruned trips.
+
+        Returns:
+        - pa.Table: The table with `output_schema`.
+
+        Raises:
+        - ValueError: If the values of a column do not fit its planned type.
+        """
+        return to_canonical(table, self.output_schema)
+
+    def pushdown_filter(self, schema, columns, start_date_str, end_date_str):
+        """
+        Builds the month-window and threshold predicates as a dataset filter on the source columns,
+        so the Parquet reader skips row groups whose statistics rule them out and drops the
+        remaining rows before they reach the cleaning engine.
+
+        Only predicates on stored columns can be pushed down; speed and duration are derived
+        and are still checked by the engine.
+
+        Parameters:
+        - schema (pa.Schema): Schema of the raw file.
+        - columns (dict): Source column name -> output column name, from `resolve_columns`.
+        - start_date_str (str): First day of the file's month, "YYYY-MM-DD".
+        - end_date_str (str): First day of the following month, "YYYY-MM-DD".
+
+        Returns:
+        - ds.Expression: The filter expression.
+        """
+        source = {canonical: name for name, canonical in columns.items()}
+        pickup = ds.field(source["pickup_datetime"])
+        pickup_type = schema.field(source["pickup_datetime"]).type
+
+        # 2009-2010 strings are in DATETIME_FORMAT, which sorts like the timestamps it holds
+        if pa.types.is_timestamp(pickup_type):
+            start = pa.scalar(pd.Timestamp(start_date_str), type=pickup_type)
+            end = pa.scalar(pd.Timestamp(end_date_str), type=pickup_type)
+        else:
+            start, end = start_date_str, end_date_str
+
+        return (
+            (pickup >= start)
+            & (pickup < end)
+            & (ds.field(source["trip_distance"]) > self.config.shortest_trip_distance)
+            & (ds.field(source["total_amount"]) > self.config.least_cost)
+        )
+
+    def streaming_batch_size(self, parquet_file, columns):
+        """
+        Derives the number of rows per batch that keeps a batch's working set within `memory_budget_mb`.
+
+        The per-row size of the selected columns is estimated from the uncompressed sizes in the
+        file footer and multiplied by WORKING_SET_FACTOR to cover decoding and the pandas copies.
+
+        Parameters:
+        - parquet_file (ParquetFile): The opened input file.
+        - columns (list): The source columns that will be read.
+
+        Returns:
+        - int: Rows per batch.
+        """
+        metadata = parquet_file.metadata
+        if metadata.num_rows == 0:
+            return MIN_BATCH_SIZE
+
+        selected = set(columns)
+        uncompressed = 0
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                column = row_group.column(j)
+                if column.path_in_schema in selected:
+                    uncompressed += column.total_uncompressed_size
+
+        row_bytes = max(1.0, uncompressed / metadata.num_rows) * WORKING_SET_FACTOR
+        budget_bytes = self.config.memory_budget_mb * 1024 * 1024
+        return max(MIN_BATCH_SIZE, int(budget_bytes / row_bytes))
+
+    def output_path(self, filename, start_date):
+        """
+        Returns where the pruned data of a month is written for the configured `output_layout`.
+
+        Parameters:
+        - filename (str): Name of the raw Parquet file inside the data directory.
+        - start_date (Timestamp): First day of the file's month.
+
+        Returns:
+        - str: `pruned-<filename>` in the output directory for the flat layout, or the month's
+          `year=YYYY/month=MM` partition of the dataset for the partitioned layout.
+        """
+        if self.config.output_layout == "partitioned":
+            return os.path.join(
+                self.config.root_dir,
+                PARTITIONED_DATASET_DIR,
+                f"year={start_date.year}",
+                f"month={start_date.month:02d}",
+                PARTITION_FILE_NAME,
+            )
+        return os.path.join(self.config.root_dir, f"pruned-{filename}")
+
+    def sidecar_path(self, start_date):
+        """Returns the path of a month's daily aggregate sidecar, `sidecars/YYYY-MM.parquet`."""
+        return os.path.join(
+            self.config.root_dir, SIDECAR_DIR, f"{start_date.strftime('%Y-%m')}.parquet"
+        )
+
+    def daily_aggregates(self, table):
+        """
+        Aggregates pruned trips per day into the values the analyses need.
+
+        Partial aggregates, e.g. of the batches of a month, are merged by concatenating them
+        and aggregating again, since every column is a sum.
+
+        Parameters:
+        - table (pa.Table): Pruned trips with a date column, or partial daily aggregates.
+
+        Returns:
+        - pa.Table: One row per date with count and, for each of DAILY_METRICS, `<metric>_sum`
+          and `<metric>_sumsq`, sorted by date.
+        """
+        if "count" in table.column_names:
+            values = table
+        else:
+            values = {
+                "date": table["date"],
+                "count": pa.array(np.ones(table.num_rows, dtype=np.int64)),
+            }
+            for metric in DAILY_METRICS:
+                column = pc.cast(table[metric], pa.float64())
+                values[f"{metric}_sum"] = column
+                values[f"{metric}_sumsq"] = pc.multiply(column, column)
+            values = pa.table(values)
+
+        sums = [name for name in values.column_names if name != "date"]
+        aggregated = values.group_by("date").aggregate([(name, "sum") for name in sums])
+        return pa.table(
+            {
+                "date": aggregated["date"],
+                **{name: aggregated[f"{name}_sum"] for name in sums},
+            }
+        ).sort_by("date")
+
+    def sketch_path(self, start_date):
+        """Returns the path of a month's quantile sketches, `sketches/YYYY-MM.npz`."""
+        return os.path.join(
+            self.config.root_dir, SKETCH_DIR, f"{start_date.strftime('%Y-%m')}.npz"
+        )
+
+    def daily_sketches(self, table, start_date_str, end_date_str):
+        """
+        Builds one quantile sketch per day of the month for each of SKETCH_METRICS.
+
+        Sketches are bucket counts and merge by addition, see `QuantileSketch`, so the
+        sketches of the batches of a month simply add up.
+
+        Parameters:
+        - table (pa.Table): Pruned trips with a date column.
+        - start_date_str (str): First day of the file's month, "YYYY-MM-DD".
+        - end_date_str (str): First day of the following month, "YYYY-MM-DD".
+
+        Returns:
+        - dict: Metric -> bucket counts of shape (days in month, number of buckets).
+        """
+        start = np.datetime64(start_date_str, "D")
+        num_days = int((np.datetime64(end_date_str, "D") - start).astype(np.int64))
+        dates = table["date"].to_numpy().astype("datetime64[D]")
+        days = (dates - start).astype(np.int64)
+        return {
+            metric: self.sketch.counts(
+                pc.cast(table[metric], pa.float64()).to_numpy(zero_copy_only=False),
+                days,
+                num_days,
+            )
+            for metric in SKETCH_METRICS
+        }
+
+    def write_sketches(self, sketches, start_date_str, end_date_str, sketch_path):
+        """Writes a month's daily sketches, with their days and parameters, through a hidden temporary file."""
+        os.makedirs(os.path.dirname(sketch_path), exist_ok=True)
+        tmp_path = temporary_path(sketch_path)
+        with open(tmp_path, "wb") as file:
+            np.savez_compressed(
+                file,
+                dates=np.arange(start_date_str, end_date_str, dtype="datetime64[D]"),
+                **self.sketch.params(),
+                **sketches,
+            )
+        os.replace(tmp_path, sketch_path)
+
+    def write_sidecar(self, daily, sidecar_path):
+        """Writes a month's daily aggregates through a hidden temporary file."""
+        os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+        tmp_path = temporary_path(sidecar_path)
+        pq.write_table(daily, tmp_path)
+        os.replace(tmp_path, sidecar_path)
+
+    def writer_options(self):
+        """Returns the codec keyword arguments shared by every Parquet write of the stage."""
+        return {
+            "compression": self.config.compression,
+            "compression_level": self.config.compression_level,
+        }
+
+    def sort_for_layout(self, table):
+        """
+        Sorts the rows by pickup time for the partitioned layout, so the row-group statistics
+        of `pickup_datetime` are narrow and date-range readers can skip row groups.
+        """
+        if self.config.output_layout == "partitioned" and table.num_rows:
+            return table.sort_by("pickup_datetime")
+        return table
+
+    def write_pruned(self, table, output_path):
+        """
+        Writes a pruned table with the configured codec and row-group size, through a hidden
+        temporary file so readers of the output directory never see a partial file.
+
+        Parameters:
+        - table (pa.Table): The pruned data.
+        - output_path (str): The file to write, from `output_path`.
+        """
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = temporary_path(output_path)
+        pq.write_table(
+            self.sort_for_layout(table),
+            tmp_path,
+            row_group_size=self.config.row_group_size,
+            **self.writer_options(),
+        )
+        os.replace(tmp_path, output_path)
+
+    def clean_file_streaming(
+        self, input_path, output_path, columns, filters, start_date_str, end_date_str
+    ):
+        """
+        Cleans a file one record batch at a time and appends each pruned batch to a ParquetWriter,
+        so peak memory depends on the batch size rather than on the file size.
+
+        In the partitioned layout each batch is sorted by pickup time before it is written; the
+        month as a whole is not re-sorted, as that would need it in memory at once.
+
+        Parameters:
+        - input_path (str): The raw Parquet file.
+        - output_path (str): The pruned Parquet file to write.
+        - columns (dict): Source column name -> output column name, from `resolve_columns`.
+        - filters (ds.Expression): Predicates pushed down into the scan, from `pushdown_filter`.
+        - start_date_str (str): First day of the file's month, "YYYY-MM-DD".
+        - end_date_str (str): First day of the following month, "YYYY-MM-DD".
+
+        Returns:
+        - tuple: In-memory bytes of the pruned data before and after the canonical cast, and
+          the month's daily aggregates and daily sketches merged from those of the batches.
+        """
+        batch_size = self.streaming_batch_size(
+            pq.ParquetFile(input_path), list(columns)
+        )
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = temporary_path(output_path)
+
+        bytes_before = bytes_after = 0
+        daily = [self.daily_aggregates(self.output_schema.empty_table())]
+        sketches = self.daily_sketches(
+            self.output_schema.empty_table(), start_date_str, end_date_str
+        )
+        # Every batch is cast to the same schema, and a month without rows still gets a file
+        with pq.ParquetWriter(
+            tmp_path, self.output_schema, **self.writer_options()
+        ) as writer:
+            for batch in ds.dataset(input_path, format="parquet").to_batches(
+                columns=list(columns),
+                filter=filters,
+                batch_size=batch_size,
+                batch_readahead=1,
+                fragment_readahead=1,
+            ):
+                pruned = self.clean_batch(batch, columns, start_date_str, end_date_str)
+                table = self.sort_for_layout(self.cast_to_canonical(pruned))
+                bytes_before += pruned.nbytes
+                bytes_after += table.nbytes
+                daily.append(self.daily_aggregates(table))
+                for metric, counts in self.daily_sketches(
+                    table, start_date_str, end_date_str
+                ).items():
+                    sketches[metric] += counts
+                writer.write_table(table, row_group_size=self.config.row_group_size)
+        os.replace(tmp_path, output_path)
+        return (
+            bytes_before,
+            bytes_after,
+            self.daily_aggregates(pa.concat_tables(daily)),
+            sketches,
+        )
+
+    def clean_file(self, filename):
+        """
+        Cleans a single monthly taxi trip file and saves the pruned result.
+
+        With `mode: streaming` the file is processed batch by batch within `memory_budget_mb`,
+        otherwise it is loaded as a whole. `engine` selects pandas (`clean_frame`) or
+        pyarrow.compute (`clean_table`) for the cleaning itself. `output_layout` selects
+        where the result goes, see `output_path`. The month's daily aggregates are written to
+        its sidecar while the data is in memory, see `daily_aggregates`, and its daily quantile
+        sketches to `sketches/`, see `daily_sketches`.
+
+        Parameters:
+        - filename (str): Name of the raw Parquet file inside the data directory.
+
+        Returns:
+        - str or None: Path of the pruned file, or None if the existing one was built from the
+          same input, settings and code version (see `cache_key`).
+        """
+        input_path = os.path.join(self.config.data_path, filename)
+
+        start_date = pd.to_datetime(
+            filename.split("_")[-1].replace(".parquet", "") + "-01"
+        )
+        output_path = self.output_path(filename, start_date)
+        sidecar_path = self.sidecar_path(start_date)
+        sketch_path = self.sketch_path(start_date)
+        end_date = start_date + relativedelta(months=1)
+
+        start_date_str = start_date.strftime("%Y-%m-%d")
+        end_date_str = end_date.strftime("%Y-%m-%d")
+
+        entry = self.raw_entry(filename)
+        cache_key = self.cache_key(entry)
+        if (
+            os.path.exists(output_path)
+            and os.path.exists(sidecar_path)
+            and os.path.exists(sketch_path)
+            and self.cache_index.get(filename, {}).get("key") == cache_key
+        ):
+            logger.info(f"Skipping up-to-date file: {output_path}")
+            return None
+
+        logger.info(f"Processing file: {filename}")
+        columns = self.resolve_columns(list(entry["columns"]))
+        # The month is read now anyway, its schema gives the exact type of the pickup column
+        filters = self.pushdown_filter(
+            pq.read_schema(input_path), columns, start_date_str, end_date_str
+        )
+
+        if self.config.mode == "streaming":
+            bytes_before, bytes_after, daily, sketches = self.clean_file_streaming(
+                input_path, output_path, columns, filters, start_date_str, end_date_str
+            )
+        else:
+            table = self.prepare_table(
+                pq.read_table(input_path, columns=list(columns), filters=filters),
+                columns,
+            )
+            pruned = self.clean_prepared(table, start_date_str, end_date_str)
+            table = self.cast_to_canonical(pruned)
+            bytes_before, bytes_after = pruned.nbytes, table.nbytes
+            daily = self.daily_aggregates(table)
+            sketches = self.daily_sketches(table, start_date_str, end_date_str)
+            self.write_pruned(table, output_path)
+        self.write_sidecar(daily, sidecar_path)
+        self.write_sketches(sketches, start_date_str, end_date_str, sketch_path)
+
+        self.cache_keys[filename] = cache_key
+        self.dtype_savings[filename] = {
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_saved": bytes_before - bytes_after,
+        }
+        logger.info(
+            f"Pruned data saved to {output_path}, canonical types saved {bytes_before - bytes_after} of {bytes_before} bytes"
+        )
+        return output_path
+
+    def month_report(self, filename, output_path):
+        """Builds the report of a month returned by `clean_file`."""
+        if output_path is None:
+            return {"file": filename, "status": "skipped"}
+        return {
+            "file": filename,
+            "status": "cleaned",
+            "output": output_path,
+            "cache_key": self.cache_keys.pop(filename),
+            **self.dtype_savings.pop(filename),
+        }
+
+    def save_cache_index(self, reports):
+        """
+        Records the cache key of the cleaned months in the cache index beside the pruned outputs.
+        Called by the parent process only, so workers never write the index concurrently.
+
+        A month rebuilt under a new path, e.g. after `output_layout` changed, has its previous
+        output removed, so the month is never listed twice.
+
+        Parameters:
+        - reports (list): Month reports from `clean_month`.
+        """
+        for report in reports:
+            if report["status"] == "cleaned":
+                self.remove_previous_output(report["file"], report["output"])
+                self.cache_index[report["file"]] = {
+                    "key": report["cache_key"],
+                    "output": report["output"],
+                }
+        tmp_path = temporary_path(self.cache_index_path)
+        with open(tmp_path, "w") as file:
+            yaml.safe_dump(self.cache_index, file)
+        os.replace(tmp_path, self.cache_index_path)
+
+    def remove_previous_output(self, filename, output_path):
+        """
+        Removes the output recorded for a month in the cache index if it differs from its new
+        output, along with the partition directories this leaves empty.
+
+        Parameters:
+        - filename (str): Name of the raw Parquet file inside the data directory.
+        - output_path (str): The month's new pruned output.
+        """
+        previous = self.cache_index.get(filename, {}).get("output")
+        if not previous or previous == output_path or not os.path.exists(previous):
+            return
+        os.remove(previous)
+        logger.info(f"Removed previous output {previous} of {filename}")
+        folder = os.path.dirname(previous)
+        root_dir = os.path.abspath(self.config.root_dir)
+        while os.path.abspath(folder) != root_dir and not os.listdir(folder):
+            os.rmdir(folder)
+            folder = os.path.dirname(folder)
+
+    def update_catalog(self):
+        """
+        Refreshes the footer catalog of the pruned outputs recorded in the cache index,
+        `catalog.json` in the output directory, see `ParquetCatalog`, so the visualization
+        stage can plan and prune its reads without opening the months. Only the footers of
+        new or rewritten outputs are read.
+
+        Returns:
+        - ParquetCatalog: The catalog, keyed by the output paths relative to the output directory.
+        """
+        outputs = sorted(
+            os.path.relpath(entry["output"], self.config.root_dir)
+            for entry in self.cache_index.values()
+            if entry.get("output") and os.path.exists(entry["output"])
+        )
+        catalog = ParquetCatalog(os.path.join(self.config.root_dir, CATALOG_FILE_NAME))
+        changed, removed = catalog.refresh(self.config.root_dir, outputs)
+        logger.info(
+            f"Catalog of {len(outputs)} pruned files updated ({len(changed)} read, {len(removed)} removed)"
+        )
+        return catalog
+
+    def save_dtype_report(self, reports):
+        """
+        Merges the byte savings of the cleaned months into `dtype_report.yaml` beside the pruned files.
+
+        Parameters:
+        - reports (list): Month reports from `clean_month`.
+        """
+        report_path = os.path.join(self.config.root_dir, DTYPE_REPORT_FILE_NAME)
+        dtype_report = {}
+        if os.path.exists(report_path):
+            dtype_report = load_yaml(report_path) or {}
+        for report in reports:
+            if report["status"] == "cleaned":
+                dtype_report[report["file"]] = {
+                    key: report[key]
+                    for key in ("bytes_before", "bytes_after", "bytes_saved")
+                }
+        with open(report_path, "w") as file:
+            yaml.safe_dump(dtype_report, file)
+
+    def clean_month(self, filename):
+        """
+        Cleans one month and reports the outcome instead of raising, so it can run in a worker process.
+
+        Parameters:
+        - filename (str): Name of the raw Parquet file inside the data directory.
+
+        Returns:
+        - dict: The month's report with "file", "status" ("cleaned", "skipped" or "failed"),
+          the canonical types' byte savings when cleaned and, on failure, "error".
+        """
+        try:
+            return self.month_report(filename, self.clean_file(filename))
+        except Exception as e:
+            logger.error(f"Error cleaning {filename}: {e}")
+            return {"file": filename, "status": "failed", "error": str(e)}
+
+    def list_raw_files(self):
+        """
+        Lists the raw monthly Parquet files in the data directory from its footer catalog,
+        refreshed first, so the footers of unchanged months are not read again and the
+        workers cleaning them find their entries, see `raw_entry`.
+        """
+        changed, removed = self.raw_catalog.refresh(self.config.data_path)
+        logger.info(
+            f"Catalog of {len(self.raw_catalog.entries)} raw files updated ({len(changed)} read, {len(removed)} removed)"
+        )
+        return list(self.raw_catalog.entries)
+
     def data_cleaning(self):
         """
         Processes and cleans the taxi trip data files stored in a specified directory.
@@ -33,71 +959,57 @@ class DataTransformation:
         This function iterates through each file in the data directory, performs cleaning and transformation operations, and saves the processed data to a new file. Cleaning operations include renaming columns, dropping rows with missing values, and calculating additional metrics like trip duration and speed.
 
         For each file:
-        - Skips processing if the pruned file already exists in the output directory.
-        - Renames columns related to pickup datetime, dropoff datetime, and total amount for consistency.
+        - Skips processing if the pruned file, its sidecar and its sketches exist and its entry in `cache_index.yaml` has the same cache key, built from the input's size and modification time as cataloged in the data directory's `catalog.json`, the thresholds and other output settings, and CODE_VERSION. A revised download or a changed threshold rebuilds only the affected months.
+        - Resolves the pickup datetime, dropoff datetime, total amount and trip distance columns from the schema in the catalog and reads only those plus the configured extra columns.
+        - Pushes the month window and the distance and cost thresholds down into the Parquet read, so row groups outside them are skipped.
+        - Renames the resolved columns for consistency and parses the pickup and dropoff timestamps once into timestamp[us].
         - Drops rows with missing values in critical columns.
         - Calculates the trip duration in seconds and the speed in miles per hour.
         - Filters the data based on predefined configuration thresholds for speed, trip distance, trip duration, and total amount.
-        - Saves the cleaned and pruned data as a new Parquet file in the output directory.
+        - Assigns the pickup and dropoff zones of 2009-2010 trips from their coordinates when `zone_file` exists, see `assign_zones`.
+        - Casts the columns once to the canonical schema of the schema registry, with the compact types of `dtype_plan` where it overrides them, and saves the cleaned and pruned data as a new Parquet file in the output directory, or as the month's partition of a Hive-partitioned dataset sorted by pickup time with `output_layout: partitioned`, using the configured codec and row-group size.
 
-        Exceptions are logged and raised as CustomException for further handling.
+        Alongside each pruned month, a small sidecar in `sidecars/` holds its daily trip count and the daily sums and sums of squares of trip duration and distance, so the analyses do not have to rescan the pruned data. A month's mergeable quantile sketches of trip duration, distance and total amount, one per day, are kept in `sketches/` for percentiles over any range of days.
 
-        Raises:
-            CustomException: If any error occurs during the data cleaning process.
-        """
-        try:
-            for filename in os.listdir(self.config.data_path):
-                input_path = os.path.join(self.config.data_path, filename)
-                output_path = os.path.join(self.config.root_dir, f"pruned-{filename}")
+        The bytes saved by the canonical types are recorded per month in `dtype_report.yaml`.
 
-                start_date = pd.to_datetime(
-                    filename.split("_")[-1].replace(".parquet", "") + "-01"
-                )
-                end_date = start_date + relativedelta(months=1)
-
-                start_date_str = start_date.strftime("%Y-%m-%d")
-                end_date_str = end_date.strftime("%Y-%m-%d")
-
-                if os.path.exists(output_path):
-                    logger.info(f"Skipping existing file: {output_path}")
-                    continue
-
-                logger.info(f"Processing file: {filename}")
-                df = pq.read_table(input_path).to_pandas().rename(columns=str.lower)
-
-                df = df.rename(
-                    columns={
-                        self.find_column_name(df.columns, "pickup"): "pickup_datetime",
-                        self.find_column_name(
-                            df.columns, "dropoff"
-                        ): "dropoff_datetime",
-                        self.find_column_name(df.columns, "total"): "total_amount",
-                    }
-                )
+        With `max_workers` above 1 the months are cleaned in a process pool. Each month then
+        reports its own outcome and a bad month does not abort the others.
 
-                df = df.dropna(
-                    subset=[
-                        "pickup_datetime",
-                        "dropoff_datetime",
-                        "total_amount",
-                        "trip_distance",
-                    ]
-                )
-                df = self.calculate_trip_duration_and_speed(df)
+        Otherwise exceptions are logged and raised as CustomException for further handling,
+        after the months cleaned before the failure are recorded.
+
+        Returns:
+            list: One report per month, see `clean_month`.
 
-                pruned_df = df.query(
-                    f"{self.config.lowest_speed} < speed < {self.config.highest_speed} and "
-                    f"trip_distance > {self.config.shortest_trip_distance} and "
-                    f"trip_duration > {self.config.shortest_trip_duration} and "
-                    f"total_amount > {self.config.least_cost} and "
-                    f"'{start_date_str}' <= pickup_datetime < '{end_date_str}'"
-                ).copy()
+        Raises:
+            CustomException: If any error occurs during sequential data cleaning.
+        """
+        filenames = self.list_raw_files()
 
-                pruned_df["date"] = pd.to_datetime(pruned_df["pickup_datetime"]).dt.date
+        if self.config.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.config.max_workers) as executor:
+                reports = list(executor.map(self.clean_month, filenames))
+            failed = [
+                report["file"] for report in reports if report["status"] == "failed"
+            ]
+            if failed:
+                logger.error(f"Data cleaning failed for: {', '.join(sorted(failed))}")
+            self.save_dtype_report(reports)
+            self.save_cache_index(reports)
+            return reports
 
-                pruned_df.to_parquet(output_path, index=False)
-                logger.info(f"Pruned data saved to {output_path}")
+        reports = []
+        try:
+            for filename in filenames:
+                reports.append(self.month_report(filename, self.clean_file(filename)))
+            return reports
 
         except Exception as e:
             logger.error(f"Error during data cleaning: {e}")
             raise CustomException(f"Data cleaning failed: {e}", sys)
+
+        finally:
+            # The months cleaned before a failure stay recorded, so a rerun skips them
+            self.save_dtype_report(reports)
+            self.save_cache_index(reports)
@@ -1,7 +1,12 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Callable
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+import pyarrow as pa
 import pyarrow.parquet as pq
 from src.utils.exception import CustomException
 from src.utils.logger import logger
@@ -11,27 +16,532 @@ import yaml
 from src.entity import DataVisualizationConfig
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
+from src.utils.daily_index import DailyIndex
+from src.utils.quantile_sketch import QuantileSketch
+from src.utils.zone_cube import ZoneCube
+from src.utils.parquet_catalog import ParquetCatalog
+import numpy as np
+
+ROLLING_STATE_FILE_NAME = "rolling_state.yaml"
+DAILY_INDEX_DIR = "daily_index"
+ZONE_CUBE_DIR = "zone_cubes"
+ZONE_COLUMNS = ("pulocationid", "dolocationid")
+
+
+@dataclass(frozen=True)
+class Analysis:
+    """
+    An analysis fed by the shared scan of `DataVisualization.run_analyses`.
+
+    Attributes:
+    - name (str): Name of the analysis; its output is `<name>_file_name` from the config, or
+      `<name>.parquet` in the output directory.
+    - columns (tuple): Trip columns read from the pruned files besides date and DAILY_METRICS.
+      Analyses that only use `MonthScan.daily` or `MonthScan.sketches` leave it empty.
+    - partial (Callable): (DataVisualization, MonthScan) -> the partial aggregate of one month.
+      Runs in a worker process when `max_workers` is above 1, so it must be a module-level function.
+    - finalize (Callable): (DataVisualization, dict of pruned file -> partial) -> the output
+      DataFrame. Not used by analyses with an `update`.
+    - plot (bool): Whether the output is plotted with `plot_interactive_trip_length`.
+    - source (Callable): Optional (DataVisualization, pruned file) -> the file the analysis
+      reads for that month, fingerprinted in its dependency manifest. `daily_source` by default.
+    - update (Callable): Optional (DataVisualization, dict of changed pruned file -> partial)
+      -> None, for analyses that maintain their output incrementally. When set, only the
+      changed months are scanned for the analysis and it writes its output itself, instead of
+      `finalize` merging the partials of every month.
+    """
+
+    name: str
+    columns: tuple
+    partial: Callable
+    finalize: Callable = None
+    plot: bool = False
+    source: Callable = None
+    update: Callable = None
+
+
+# Analyses run by `run_analyses`, by name
+ANALYSES = {}
+
+
+def register_analysis(analysis):
+    """Adds an analysis to the registry, replacing one of the same name."""
+    ANALYSES[analysis.name] = analysis
+    return analysis
+
+
+class MonthScan:
+    """
+    One pruned month as seen by the analyses of a shared scan. Each view is loaded at most
+    once, however many analyses use it.
+    """
+
+    def __init__(self, visualization, file_name, columns):
+        self.visualization = visualization
+        self.file_name = file_name
+        self.columns = columns
+
+    @cached_property
+    def trips(self):
+        """
+        The month's trips with 'date' as the index and the scan's columns the file has, as
+        older eras lack some columns, e.g. the zones.
+        """
+        file_path = os.path.join(self.visualization.config.data_path, self.file_name)
+        names = pq.read_schema(file_path).names
+        return self.visualization.load_data(
+            file_path,
+            columns=["date", *[column for column in self.columns if column in names]],
+        )
+
+    @cached_property
+    def sketches(self):
+        """The month's daily quantile sketches, see `DataVisualization.month_sketches`."""
+        return self.visualization.month_sketches(self.file_name)
+
+    @cached_property
+    def daily(self):
+        """The month's daily aggregates, from its sidecar or else from `trips`."""
+        if os.path.exists(self.visualization.sidecar_path(self.file_name)):
+            return self.visualization.load_daily(self.file_name)
+        return self.visualization.aggregate_daily(self.trips)
 
 
 class DataVisualization:
     def __init__(self, config: DataVisualizationConfig):
         self.config = config
 
-    def load_data(self, file):
+    def list_pruned_files(self):
+        """
+        Lists the pruned monthly Parquet files of either output layout, skipping the reports and
+        temporary files the transformation stage keeps beside them. A month found in both
+        layouts is listed once, with its most recently written file.
+
+        Returns:
+        - list: Paths relative to the data directory, `pruned-<file>` for the flat layout and
+          `dataset/year=YYYY/month=MM/<file>` for the partitioned one.
+        """
+        pruned_files = [
+            file_name
+            for file_name in os.listdir(self.config.data_path)
+            if file_name.startswith("pruned-") and file_name.endswith(".parquet")
+        ]
+        dataset_path = os.path.join(self.config.data_path, PARTITIONED_DATASET_DIR)
+        if os.path.isdir(dataset_path):
+            for year in sorted(os.listdir(dataset_path)):
+                if not year.startswith("year="):
+                    continue
+                for month in sorted(os.listdir(os.path.join(dataset_path, year))):
+                    if not month.startswith("month="):
+                        continue
+                    for file_name in sorted(
+                        os.listdir(os.path.join(dataset_path, year, month))
+                    ):
+                        if file_name.endswith(".parquet") and not file_name.startswith(
+                            "."
+                        ):
+                            pruned_files.append(
+                                os.path.join(
+                                    PARTITIONED_DATASET_DIR, year, month, file_name
+                                )
+                            )
+
+        # A month left over in the other layout is not counted twice: the newest file wins
+        by_month = {}
+        for file_name in pruned_files:
+            by_month.setdefault(self.pruned_file_month(file_name), []).append(file_name)
+        stale = set()
+        for file_names in by_month.values():
+            if len(file_names) > 1:
+                newest = max(
+                    file_names,
+                    key=lambda file_name: os.path.getmtime(
+                        os.path.join(self.config.data_path, file_name)
+                    ),
+                )
+                stale.update(set(file_names) - {newest})
+        if stale:
+            logger.warning(
+                f"Ignoring pruned files of months written again since: {', '.join(sorted(stale))}"
+            )
+        return [file_name for file_name in pruned_files if file_name not in stale]
+
+    def pruned_file_month(self, file_name):
+        """
+        Returns the month of a file from `list_pruned_files` as "YYYY-MM".
+
+        Parameters:
+        - file_name (str): Path relative to the data directory.
+
+        Returns:
+        - str: The month, from the file name or from the `year=`/`month=` partition.
+        """
+        parts = os.path.normpath(file_name).split(os.sep)
+        if parts[0] == PARTITIONED_DATASET_DIR:
+            year = parts[1].split("=")[1]
+            month = parts[2].split("=")[1]
+            return f"{year}-{int(month):02d}"
+        return file_name.split("_")[-1].replace(".parquet", "")
+
+    def catalog(self):
+        """
+        Returns the footer catalog of the pruned files, `catalog.json` in the data directory,
+        see `ParquetCatalog`. The transformation stage keeps it current, so usually no footer
+        is read here. Months missing between the first and the last pruned month are logged.
+
+        Returns:
+        - ParquetCatalog: The catalog, keyed like `list_pruned_files`.
+        """
+        catalog = ParquetCatalog(os.path.join(self.config.data_path, CATALOG_FILE_NAME))
+        catalog.refresh(self.config.data_path, self.list_pruned_files())
+        months = sorted(catalog.months())
+        if months:
+            expected = pd.period_range(months[0], months[-1], freq="M").strftime(
+                "%Y-%m"
+            )
+            missing = catalog.missing_months(expected)
+            if missing:
+                logger.warning(
+                    f"Months missing from the pruned data: {', '.join(missing)}"
+                )
+        return catalog
+
+    def load_range(self, start, end, columns=None):
+        """
+        Loads the trips of the days [start, end), reading only the months and row groups whose
+        'date' statistics in the catalog overlap the range.
+
+        Parameters:
+        - start (date-like): First day of the range.
+        - end (date-like): Day after the range.
+        - columns (list): Optional columns to read, including 'date'. All columns by default.
+
+        Returns:
+        - DataFrame: The trips with 'date' as the index, like `load_data`.
+        """
+        start = pd.Timestamp(start).strftime("%Y-%m-%d")
+        end = pd.Timestamp(end).strftime("%Y-%m-%d")
+        catalog = self.catalog()
+        tables = []
+        for file_name in catalog.readable():
+            row_groups = catalog.row_groups(file_name, "date", start, end)
+            # The first month is read even without a match, for the columns of an empty range
+            if row_groups or not tables:
+                tables.append(
+                    pq.ParquetFile(
+                        os.path.join(self.config.data_path, file_name)
+                    ).read_row_groups(row_groups, columns=columns)
+                )
+        if not tables:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        df = pa.concat_tables(tables).to_pandas(date_as_object=False)
+        df["date"] = pd.to_datetime(df["date"])
+        df.set_index("date", inplace=True)
+        return df[(df.index >= start) & (df.index < end)]
+
+    def load_all(self, columns=None):
+        """
+        Loads every pruned month into one Arrow table.
+
+        The transformation stage casts all eras to the canonical schema of the schema registry,
+        so the months are concatenated as they are, without renames, type promotion or copies.
+
+        Parameters:
+        - columns (list): Optional canonical columns to read, all columns by default.
+
+        Returns:
+        - pa.Table: The trips of all months, in the order of `list_pruned_files`.
+        """
+        tables = [
+            pq.read_table(
+                os.path.join(self.config.data_path, file_name), columns=columns
+            )
+            for file_name in self.list_pruned_files()
+        ]
+        return pa.concat_tables(tables)
+
+    def load_data(self, file, columns=None):
         """
         Loads data from a Parquet file, converts the 'date' column to datetime, and sets it as the index.
 
         Parameters:
         - file (str): Path to the Parquet file.
+        - columns (list): Optional columns to read, including 'date'. All columns by default.
 
         Returns:
         - df (DataFrame): Pandas DataFrame with 'date' as the index.
         """
-        df = pq.read_table(file).to_pandas()
+        df = pq.read_table(file, columns=columns).to_pandas(date_as_object=False)
         df["date"] = pd.to_datetime(df["date"])
         df.set_index("date", inplace=True)
         return df
 
+    def sidecar_path(self, file_name):
+        """Returns the path of the daily aggregate sidecar of a pruned file's month."""
+        return os.path.join(
+            self.config.data_path,
+            SIDECAR_DIR,
+            f"{self.pruned_file_month(file_name)}.parquet",
+        )
+
+    def load_daily(self, file_name):
+        """
+        Loads a month's daily aggregates from its sidecar, falling back to aggregating the
+        pruned file when the transformation stage has not written a sidecar for it.
+
+        Parameters:
+        - file_name (str): Pruned file from `list_pruned_files`.
+
+        Returns:
+        - DataFrame: Daily count and sums of DAILY_METRICS, with a row for every day between the
+          month's first and last trip day (zero count on days without trips) and 'date' as the index.
+        """
+        sidecar_path = self.sidecar_path(file_name)
+        if os.path.exists(sidecar_path):
+            daily = pq.read_table(sidecar_path).to_pandas(date_as_object=False)
+            daily["date"] = pd.to_datetime(daily["date"])
+            daily = daily.set_index("date").asfreq("D", fill_value=0)
+            return daily[["count"] + [f"{metric}_sum" for metric in DAILY_METRICS]]
+
+        df = self.load_data(
+            os.path.join(self.config.data_path, file_name),
+            columns=["date", *DAILY_METRICS],
+        )
+        return self.aggregate_daily(df)
+
+    def sketch_path(self, file_name):
+        """Returns the path of the daily quantile sketches of a pruned file's month."""
+        return os.path.join(
+            self.config.data_path,
+            SKETCH_DIR,
+            f"{self.pruned_file_month(file_name)}.npz",
+        )
+
+    def load_sketches(self, file_name):
+        """
+        Loads a month's daily quantile sketches written by the transformation stage.
+
+        Parameters:
+        - file_name (str): Pruned file from `list_pruned_files`.
+
+        Returns:
+        - dict: "dates" (the days of the month), "params" (of the `QuantileSketch`) and the bucket
+          counts of shape (days, buckets) of each of SKETCH_METRICS, or None without sketches.
+        """
+        sketch_path = self.sketch_path(file_name)
+        if not os.path.exists(sketch_path):
+            return None
+        with np.load(sketch_path) as stored:
+            sketches = {metric: stored[metric] for metric in SKETCH_METRICS}
+            sketches["dates"] = stored["dates"]
+            sketches["params"] = {
+                key: stored[key].item() for key in QuantileSketch().params()
+            }
+        return sketches
+
+    def sketch_trips(self, df):
+        """Builds the daily sketches of `load_sketches` from date-indexed trips, with default parameters."""
+        sketch = QuantileSketch()
+        dates = df.index.values.astype("datetime64[D]")
+        first = dates.min() if len(dates) else np.datetime64("2009-01-01")
+        days = (dates - first).astype(np.int64)
+        num_days = int(days.max()) + 1 if len(days) else 0
+        sketches = {
+            metric: sketch.counts(df[metric].to_numpy(np.float64), days, num_days)
+            for metric in SKETCH_METRICS
+        }
+        sketches["dates"] = first + np.arange(num_days).astype("timedelta64[D]")
+        sketches["params"] = sketch.params()
+        return sketches
+
+    def merge_sketches(self, partials):
+        """
+        Lines up the daily sketches of several months on one calendar.
+
+        Parameters:
+        - partials (iterable): Sketches from `load_sketches`.
+
+        Returns:
+        - tuple: The `QuantileSketch` they were built with, the days from the first to the last
+          sketched day, and per metric the bucket counts of those days (zero on missing days).
+
+        Raises:
+        - ValueError: If the months were sketched with different parameters.
+        """
+        partials = [partial for partial in partials if len(partial["dates"])]
+        params = {tuple(sorted(partial["params"].items())) for partial in partials}
+        if len(params) > 1:
+            raise ValueError(
+                f"Sketches built with different parameters, rebuild them: {params}"
+            )
+        sketch = QuantileSketch(**dict(params.pop())) if params else QuantileSketch()
+        if not partials:
+            empty = np.zeros((0, sketch.num_buckets), np.int64)
+            return (
+                sketch,
+                np.array([], "datetime64[D]"),
+                {m: empty for m in SKETCH_METRICS},
+            )
+
+        first = min(partial["dates"][0] for partial in partials)
+        last = max(partial["dates"][-1] for partial in partials)
+        num_days = int((last - first).astype(np.int64)) + 1
+        counts = {
+            metric: np.zeros((num_days, sketch.num_buckets), np.int64)
+            for metric in SKETCH_METRICS
+        }
+        for partial in partials:
+            days = (partial["dates"] - first).astype(np.int64)
+            for metric in SKETCH_METRICS:
+                counts[metric][days] += partial[metric]
+        dates = first + np.arange(num_days).astype("timedelta64[D]")
+        return sketch, dates, counts
+
+    def percentile_columns(self, sketch, counts):
+        """Returns the configured percentiles of stacked sketches as `<metric>_p<percent>` columns."""
+        columns = {}
+        for metric in SKETCH_METRICS:
+            estimates = sketch.quantiles(counts[metric], self.config.percentiles)
+            for i, q in enumerate(self.config.percentiles):
+                columns[f"{metric}_p{q * 100:g}"] = estimates[..., i]
+        return columns
+
+    def range_percentiles(self, start, end):
+        """
+        Percentiles of the trip metrics over the days [start, end), merged from the daily
+        sketches of the months instead of scanning trips. Months are picked by the 'date'
+        statistics of the catalog.
+
+        Parameters:
+        - start (date-like): First day of the range.
+        - end (date-like): Day after the range.
+
+        Returns:
+        - dict: `<metric>_p<percent>` -> estimate, NaN if the range has no trips.
+        """
+        start = np.datetime64(pd.Timestamp(start), "D")
+        end = np.datetime64(pd.Timestamp(end), "D")
+        partials = []
+        catalog = self.catalog()
+        for file_name in self.list_pruned_files():
+            dates = catalog.value_range(file_name, "date")
+            if dates is None:
+                month = np.datetime64(self.pruned_file_month(file_name), "D")
+                dates = [str(month), str(month + np.timedelta64(30, "D"))]
+            if dates[0] < str(end) and dates[1] >= str(start):
+                partials.append(self.month_sketches(file_name))
+        sketch, dates, counts = self.merge_sketches(partials)
+        in_range = (dates >= start) & (dates < end)
+        return {
+            name: float(value)
+            for name, value in self.percentile_columns(
+                sketch, {m: c[in_range].sum(axis=0) for m, c in counts.items()}
+            ).items()
+        }
+
+    def month_sketches(self, file_name):
+        """Returns a month's daily sketches, built from its pruned file if it has none."""
+        sketches = self.load_sketches(file_name)
+        if sketches is None:
+            sketches = self.sketch_trips(
+                self.load_data(
+                    os.path.join(self.config.data_path, file_name),
+                    columns=["date", *SKETCH_METRICS],
+                )
+            )
+        return sketches
+
+    def zone_cube_path(self, file_name):
+        """Returns the directory of the zone cube of a pruned file's month, see `ZoneCube`."""
+        return os.path.join(
+            self.config.root_dir, ZONE_CUBE_DIR, self.pruned_file_month(file_name)
+        )
+
+    def zone_frame(self, totals):
+        """
+        Turns merged zone cube cells into one row per origin-destination pair with trips.
+
+        Parameters:
+        - totals (dict): From `ZoneCube.merge`.
+
+        Returns:
+        - DataFrame: pulocationid, dolocationid, count, average_trip_duration and
+          average_trip_distance.
+        """
+        columns = ["pulocationid", "dolocationid", "count"]
+        columns += [f"average_{metric}" for metric in DAILY_METRICS]
+        if not totals:
+            return pd.DataFrame(columns=columns)
+        pickup, dropoff = np.nonzero(totals["count"])
+        count = totals["count"][pickup, dropoff]
+        frame = {"pulocationid": pickup, "dolocationid": dropoff, "count": count}
+        for metric in DAILY_METRICS:
+            frame[f"average_{metric}"] = (
+                totals[f"{metric}_sum"][pickup, dropoff] / count
+            )
+        return pd.DataFrame(frame, columns=columns)
+
+    def zone_matrix(self, start=None, end=None):
+        """
+        Origin-destination totals over the days [start, end), merged from the zone cubes the
+        `zone_matrix` analysis keeps for every month with zones.
+
+        Parameters:
+        - start (date-like): Optional first day, all days by default.
+        - end (date-like): Optional day after the range, all days by default.
+
+        Returns:
+        - DataFrame: The rows of `zone_frame`.
+        """
+        cubes = []
+        for file_name in self.list_pruned_files():
+            cube_path = self.zone_cube_path(file_name)
+            if os.path.exists(cube_path):
+                cubes.append(ZoneCube(cube_path))
+        return self.zone_frame(ZoneCube.merge(cubes, start, end))
+
+    def aggregate_daily(self, df):
+        """Aggregates date-indexed trips into the daily count and sums of `load_daily`."""
+        days = df.resample("D")[list(DAILY_METRICS)]
+        daily = days.sum().add_suffix("_sum")
+        daily.insert(0, "count", days.size())
+        return daily
+
+    def load_daily_all(self, file_names, loaded=None):
+        """
+        Loads the daily aggregates of several months, in a process pool when `max_workers`
+        is above 1. Each month is aggregated on its own, the caller merges the partial results.
+
+        Parameters:
+        - file_names (list): Pruned files from `list_pruned_files`.
+        - loaded (dict): Optional pruned file -> daily aggregates already loaded, e.g. by the
+          shared scan of `run_analyses`. Only the other files are loaded.
+
+        Returns:
+        - list: The DataFrames of `load_daily`, in the order of `file_names`.
+        """
+        loaded = loaded or {}
+        missing = [file_name for file_name in file_names if file_name not in loaded]
+        for file_name in missing:
+            logger.info(f"Processing file: {file_name}")
+        if self.config.max_workers > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=self.config.max_workers) as executor:
+                dailies = list(executor.map(self.load_daily, missing))
+        else:
+            dailies = [self.load_daily(file_name) for file_name in missing]
+        loaded = {**loaded, **dict(zip(missing, dailies))}
+        return [loaded[file_name] for file_name in file_names]
+
+    def daily_means(self, daily):
+        """Returns the daily means of DAILY_METRICS, NaN on days without trips."""
+        return pd.DataFrame(
+            {
+                metric: daily[f"{metric}_sum"]
+                / daily["count"].where(daily["count"] > 0)
+                for metric in DAILY_METRICS
+            }
+        )
+
     def plot_static_trip_length(self, file_path):
         """
         Generates a static matplotlib plot for the average trip length of taxis.
@@ -102,33 +612,81 @@ class DataVisualization:
         )
         fig.show()
 
-    def calculate_monthly_average(self):
+    def monthly_frame(self, dailies):
         """
-        Calculates and saves the monthly average trip length for taxis to a Parquet file.
+        Builds the monthly averages from the daily aggregates of the months.
+
+        Parameters:
+        - dailies (dict): Pruned file -> its DataFrame from `load_daily`.
+
+        Returns:
+        - DataFrame: One row per month in date order, with average_trip_duration,
+          average_trip_distance and date, the first day of the month.
         """
-        try:
-            monthly_averages = []
-            for file_name in os.listdir(self.config.data_path):
-                logger.info(f"Processing file: {file_name}")
-                df = self.load_data(os.path.join(self.config.data_path, file_name))
-                monthly_avg = df[["trip_duration", "trip_distance"]].mean()
-                monthly_avg["date"] = (
-                    file_name.split("_")[-1].replace(".parquet", "") + "-01"
-                )
-                monthly_averages.append(monthly_avg)
+        monthly_averages = []
+        for file_name, daily in dailies.items():
+            totals = daily.sum()
+            monthly_avg = pd.Series(
+                {
+                    metric: totals[f"{metric}_sum"] / totals["count"]
+                    for metric in DAILY_METRICS
+                }
+            )
+            monthly_avg["date"] = self.pruned_file_month(file_name) + "-01"
+            monthly_averages.append(monthly_avg)
 
-            df_monthly = pd.DataFrame(monthly_averages).rename(
+        return (
+            pd.DataFrame(monthly_averages, columns=[*DAILY_METRICS, "date"])
+            .rename(
                 columns={
                     "trip_duration": "average_trip_duration",
                     "trip_distance": "average_trip_distance",
                 }
             )
-            df_monthly.to_parquet(
-                os.path.join(
-                    self.config.root_dir, self.config.monthly_average_file_name
-                ),
-                index=False,
+            .sort_values("date")
+            .reset_index(drop=True)
+        )
+
+    def calculate_monthly_average(self, files=None, dailies=None):
+        """
+        Calculates and saves the monthly average trip length for taxis to a Parquet file.
+
+        The averages are built from the daily sidecars of the months, see `load_daily`.
+
+        Parameters:
+        - files (list): Optional pruned files to recompute. The rows of the other months are
+          kept from the existing output, and rows of months that no longer exist are dropped.
+          All months are computed by default.
+        - dailies (dict): Optional daily aggregates already loaded, see `load_daily_all`.
+        """
+        try:
+            output_path = os.path.join(
+                self.config.root_dir, self.config.monthly_average_file_name
+            )
+            pruned_files = self.list_pruned_files()
+            kept = None
+            if files is not None and os.path.exists(output_path):
+                months = {
+                    self.pruned_file_month(file_name)
+                    for file_name in pruned_files
+                    if file_name not in files
+                }
+                kept = pd.read_parquet(output_path)
+                kept = kept[kept["date"].str[:7].isin(months)]
+                pruned_files = [
+                    file_name for file_name in pruned_files if file_name in files
+                ]
+
+            df_monthly = self.monthly_frame(
+                dict(zip(pruned_files, self.load_daily_all(pruned_files, dailies)))
             )
+            if kept is not None:
+                df_monthly = (
+                    pd.concat([kept, df_monthly], ignore_index=True)
+                    .sort_values("date")
+                    .reset_index(drop=True)
+                )
+            df_monthly.to_parquet(output_path, index=False)
             logger.info(
                 f"Monthly average trip length saved to {self.config.monthly_average_file_name}"
             )
@@ -136,36 +694,146 @@ class DataVisualization:
             logger.error(f"An error occurred during processing: {e}")
             raise CustomException(f"Processing monthly average failed: {e}", sys)
 
-    def calculate_rolling_average(self):
+    def rolling_frame(self, daily):
+        """
+        Adds the rolling averages of the daily means over `rolling_days` rows.
+
+        Parameters:
+        - daily (DataFrame): Daily means of DAILY_METRICS with 'date' as the index.
+
+        Returns:
+        - DataFrame: The daily means and their rolling averages, with 'date' as a column.
+        """
+        daily = daily.copy()
+        daily["average_trip_distance"] = (
+            daily["trip_distance"]
+            .rolling(window=self.config.rolling_days, min_periods=1)
+            .mean()
+        )
+        daily["average_trip_duration"] = (
+            daily["trip_duration"]
+            .rolling(window=self.config.rolling_days, min_periods=1)
+            .mean()
+        )
+        return daily.reset_index()
+
+    def month_fingerprints(self):
+        """
+        Fingerprints the daily source of every pruned month, see `daily_source`.
+
+        Returns:
+        - dict: Month "YYYY-MM" -> {"file", "size", "mtime_ns"}, sorted by month.
+        """
+        fingerprints = {}
+        for file_name in self.list_pruned_files():
+            stat = os.stat(self.daily_source(file_name))
+            fingerprints[self.pruned_file_month(file_name)] = {
+                "file": file_name,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+        return dict(sorted(fingerprints.items()))
+
+    def new_rolling_months(self, fingerprints, output_path, state_path):
+        """
+        Decides whether the persisted rolling average can be extended instead of recomputed.
+
+        Parameters:
+        - fingerprints (dict): Current months, from `month_fingerprints`.
+        - output_path (str): The persisted rolling average.
+        - state_path (str): The window state of the last run.
+
+        Returns:
+        - list or None: The months to append, or None if the rolling average must be recomputed
+          in full because there is no usable state, `rolling_days` changed, the output was
+          rewritten by something else, or a known month was revised,
+          removed, or precedes a new one.
+        """
+        if not (os.path.exists(output_path) and os.path.exists(state_path)):
+            return None
+        state = load_yaml(Path(state_path))
+        if state.get("rolling_days") != self.config.rolling_days:
+            return None
+        if state.get("output_mtime_ns") != os.stat(output_path).st_mtime_ns:
+            return None
+
+        known = state.get("months", {})
+        if any(fingerprints.get(month) != known[month] for month in known):
+            return None
+        new_months = [month for month in fingerprints if month not in known]
+        if known and new_months and new_months[0] < max(known):
+            return None
+        return new_months
+
+    def calculate_rolling_average(self, dailies=None):
         """
         Calculates and saves the rolling average trip length for taxis to a Parquet file.
+
+        The daily means are built from the daily sidecars of the months, see `load_daily`.
+
+        With `incremental` enabled, the fingerprints of the months, `rolling_days` and the
+        output's mtime are kept in `rolling_state.yaml` beside the output. When only new months arrived after the last
+        run, their days are appended to the persisted daily series and only the new rows are
+        computed, from the last `rolling_days - 1` days before them.
+
+        Parameters:
+        - dailies (dict): Optional daily aggregates already loaded, see `load_daily_all`.
         """
         try:
-            daily_averages = []
-            for file_name in os.listdir(self.config.data_path):
-                logger.info(f"Processing file: {file_name}")
-                df = self.load_data(os.path.join(self.config.data_path, file_name))
-                day_avg = df.resample("D")[["trip_duration", "trip_distance"]].mean()
-                daily_averages.append(day_avg)
-
-            combined_daily = pd.concat(daily_averages, ignore_index=False).sort_index()
-            combined_daily["average_trip_distance"] = (
-                combined_daily["trip_distance"]
-                .rolling(window=self.config.rolling_days, min_periods=1)
-                .mean()
-            )
-            combined_daily["average_trip_duration"] = (
-                combined_daily["trip_duration"]
-                .rolling(window=self.config.rolling_days, min_periods=1)
-                .mean()
-            )
-            combined_daily.reset_index(inplace=True)
-            combined_daily.to_parquet(
-                os.path.join(
-                    self.config.root_dir, self.config.rolling_average_file_name
-                ),
-                index=False,
+            output_path = os.path.join(
+                self.config.root_dir, self.config.rolling_average_file_name
             )
+            state_path = os.path.join(self.config.root_dir, ROLLING_STATE_FILE_NAME)
+            fingerprints = new_months = None
+            if self.config.incremental:
+                fingerprints = self.month_fingerprints()
+                new_months = self.new_rolling_months(
+                    fingerprints, output_path, state_path
+                )
+
+            if new_months is None:
+                daily_averages = [
+                    self.daily_means(daily)
+                    for daily in self.load_daily_all(self.list_pruned_files(), dailies)
+                ]
+
+                combined_daily = pd.concat(
+                    daily_averages, ignore_index=False
+                ).sort_index()
+                rolling = self.rolling_frame(combined_daily)
+            else:
+                rolling = pd.read_parquet(output_path)
+                if new_months:
+                    daily_averages = [
+                        self.daily_means(daily)
+                        for daily in self.load_daily_all(
+                            [fingerprints[month]["file"] for month in new_months],
+                            dailies,
+                        )
+                    ]
+                    new_daily = pd.concat(daily_averages).sort_index()
+
+                    # Only the last rolling_days - 1 days reach into the windows of the new days
+                    history = rolling.set_index("date")[list(DAILY_METRICS)].tail(
+                        self.config.rolling_days - 1
+                    )
+                    window = self.rolling_frame(pd.concat([history, new_daily]))
+                    rolling = pd.concat(
+                        [rolling, window.tail(len(new_daily))], ignore_index=True
+                    )
+
+            if new_months != []:
+                rolling.to_parquet(output_path, index=False)
+            if self.config.incremental:
+                with open(state_path, "w") as file:
+                    yaml.safe_dump(
+                        {
+                            "rolling_days": self.config.rolling_days,
+                            "output_mtime_ns": os.stat(output_path).st_mtime_ns,
+                            "months": fingerprints,
+                        },
+                        file,
+                    )
             logger.info(
                 f"Rolling average trip length saved to {self.config.rolling_average_file_name}"
             )
@@ -173,40 +841,390 @@ class DataVisualization:
             logger.error(f"An error occurred during processing: {e}")
             raise CustomException(f"Processing rolling average failed: {e}", sys)
 
+    def daily_source(self, file_name):
+        """Returns the file the daily aggregates of a month are read from, see `load_daily`."""
+        sidecar_path = self.sidecar_path(file_name)
+        if os.path.exists(sidecar_path):
+            return sidecar_path
+        return os.path.join(self.config.data_path, file_name)
+
+    def sketch_source(self, file_name):
+        """Returns the file the quantile sketches of a month are read from, see `load_sketches`."""
+        sketch_path = self.sketch_path(file_name)
+        if os.path.exists(sketch_path):
+            return sketch_path
+        return os.path.join(self.config.data_path, file_name)
+
+    def pruned_source(self, file_name):
+        """Returns the pruned file of a month, for analyses that read its trips."""
+        return os.path.join(self.config.data_path, file_name)
+
+    def input_changes(self, manifest_path, source=None):
+        """
+        Compares the per-month inputs of an analysis with its dependency manifest.
+
+        Parameters:
+        - manifest_path (str): Manifest of the last run, mapping pruned files to the
+          fingerprints of `get_file_fingerprint`.
+        - source (Callable): Optional pruned file -> the file fingerprinted for its month,
+          `daily_source` by default.
+
+        Returns:
+        - tuple: The previous and current manifests, the files added or revised since the
+          last run, and the files removed since then.
+        """
+        previous = {}
+        if os.path.exists(manifest_path):
+            previous = load_yaml(Path(manifest_path)) or {}
+        source = source or self.daily_source
+        current = {
+            file_name: get_file_fingerprint(source(file_name), previous.get(file_name))
+            for file_name in self.list_pruned_files()
+        }
+        changed = [
+            file_name
+            for file_name, fingerprint in current.items()
+            if previous.get(file_name, {}).get("sha256") != fingerprint["sha256"]
+        ]
+        removed = set(previous) - set(current)
+        return previous, current, changed, removed
+
+    def build_daily_index(self):
+        """
+        Builds the memory-mapped prefix-sum daily index of the trip metrics, see `DailyIndex`,
+        from the daily aggregates of all months. The index is rebuilt only when a month was
+        added, revised or removed since the last build.
+
+        Returns:
+        - DailyIndex: The index, for O(1) rolling-window and date-range averages.
+        """
+        index_path = os.path.join(self.config.root_dir, DAILY_INDEX_DIR)
+        manifest_path = os.path.join(
+            self.config.root_dir, "daily_index_dependencies.yaml"
+        )
+        previous, current, changed, removed = self.input_changes(manifest_path)
+
+        if changed or removed or not os.path.exists(index_path):
+            daily = self.load_daily_all(self.list_pruned_files())
+            if not daily:
+                daily = [
+                    pd.DataFrame(
+                        columns=["count"] + [f"{m}_sum" for m in DAILY_METRICS],
+                        index=pd.DatetimeIndex([], name="date"),
+                    )
+                ]
+            DailyIndex.build(index_path, pd.concat(daily).sort_index(), DAILY_METRICS)
+            logger.info(f"Daily index built in {index_path}")
+        if current != previous:
+            with open(manifest_path, "w") as file:
+                yaml.safe_dump(current, file)
+        return DailyIndex(index_path)
+
+    def analysis_output_path(self, name):
+        """Returns the output of a registered analysis, see `Analysis`."""
+        file_name = getattr(self.config, f"{name}_file_name", f"{name}.parquet")
+        return os.path.join(self.config.root_dir, file_name)
+
+    def scan_month(self, file_name, names):
+        """
+        Scans one pruned month for several analyses at once.
+
+        Parameters:
+        - file_name (str): Pruned file from `list_pruned_files`.
+        - names (list): Registered analyses to feed.
+
+        Returns:
+        - dict: Analysis name -> its partial aggregate of the month.
+        """
+        columns = list(DAILY_METRICS)
+        for name in names:
+            columns += [c for c in ANALYSES[name].columns if c not in columns]
+        scan = MonthScan(self, file_name, columns)
+        return {name: ANALYSES[name].partial(self, scan) for name in names}
+
+    def run_analyses(self, names=None):
+        """
+        Runs registered analyses over a single shared scan of the pruned data.
+
+        Each analysis keeps its dependency manifest, `<name>_dependencies.yaml`, like
+        `execute_analysis`, over the per-month input it declares as its `source`. The analyses whose inputs changed or whose output is missing are
+        fed by one pass over the months: every month is read once, with the union of the
+        columns they declare, in a process pool when `max_workers` is above 1. Each analysis
+        then merges its partials into its output. Analyses with an `update`, the monthly and
+        rolling averages, are updated by it instead, so they keep their incremental path, see
+        `execute_analysis`.
+
+        Parameters:
+        - names (list): Analyses to run, all registered analyses by default.
+
+        Returns:
+        - list: The analyses that were recomputed.
+        """
+        names = list(ANALYSES) if names is None else names
+        stale = {}
+        for name in names:
+            manifest_path = os.path.join(
+                self.config.root_dir, f"{name}_dependencies.yaml"
+            )
+            source = ANALYSES[name].source
+            previous, current, changed, removed = self.input_changes(
+                manifest_path,
+                None if source is None else lambda file_name: source(self, file_name),
+            )
+            if (
+                changed
+                or removed
+                or not os.path.exists(self.analysis_output_path(name))
+            ):
+                stale[name] = (manifest_path, current, changed)
+            elif current != previous:
+                with open(manifest_path, "w") as file:
+                    yaml.safe_dump(current, file)
+
+        scanned = [name for name in stale if ANALYSES[name].update is None]
+        if stale:
+            try:
+                # Every month feeds the scanned analyses, only the changed months feed the
+                # analyses with an update
+                wanted = {
+                    file_name: scanned
+                    + [
+                        name
+                        for name, (_, _, changed) in stale.items()
+                        if ANALYSES[name].update is not None and file_name in changed
+                    ]
+                    for file_name in self.list_pruned_files()
+                }
+                file_names = [file_name for file_name in wanted if wanted[file_name]]
+                for file_name in file_names:
+                    logger.info(f"Scanning file: {file_name}")
+                if self.config.max_workers > 1 and len(file_names) > 1:
+                    with ProcessPoolExecutor(
+                        max_workers=self.config.max_workers
+                    ) as executor:
+                        scans = list(
+                            executor.map(
+                                self.scan_month,
+                                file_names,
+                                [wanted[file_name] for file_name in file_names],
+                            )
+                        )
+                else:
+                    scans = [
+                        self.scan_month(file_name, wanted[file_name])
+                        for file_name in file_names
+                    ]
+
+                for name, (manifest_path, current, changed) in stale.items():
+                    partials = {
+                        file_name: scan[name]
+                        for file_name, scan in zip(file_names, scans)
+                        if name in scan
+                    }
+                    if ANALYSES[name].update is not None:
+                        ANALYSES[name].update(self, partials)
+                    else:
+                        output = ANALYSES[name].finalize(self, partials)
+                        output.to_parquet(self.analysis_output_path(name), index=False)
+                    with open(manifest_path, "w") as file:
+                        yaml.safe_dump(current, file)
+                    logger.info(f"{name.replace('_', ' ').title()} analysis completed.")
+            except Exception as e:
+                logger.error(f"An error occurred during processing: {e}")
+                raise CustomException(f"Running analyses failed: {e}", sys)
+
+        for name in names:
+            if ANALYSES[name].plot:
+                self.plot_interactive_trip_length(self.analysis_output_path(name))
+        return list(stale)
+
     def execute_analysis(self, analysis_type):
         """
-        The method checks if the count of data files has increased since the last run or if the summary
-        file for the analysis does not exist. If so, it performs the analysis, saves the updated file count,
-        and generates a new interactive plot. Otherwise, it displays the existing plot.
+        The method compares the inputs of the analysis with its dependency manifest,
+        `<analysis_type>_dependencies.yaml`, which keeps a (size, mtime, hash) fingerprint of
+        the daily source of every month used by the last run. Only inputs whose size or mtime
+        changed are hashed again. If a month was added, revised or removed, or the summary file
+        for the analysis does not exist, it performs the analysis, saves the manifest and
+        generates a new interactive plot. Otherwise, it displays the existing plot.
+
+        The monthly average recomputes only the changed months. The rolling average extends
+        its persisted output when `incremental` allows it, see `calculate_rolling_average`.
 
         Parameters:
         - analysis_type (str): The type of analysis to perform, either 'monthly_average' or 'rolling_average'.
         """
-        file_path = os.path.join(self.config.root_dir, "existing_file_count.yaml")
-        current_count = 0
-        if os.path.exists(file_path):
-            current_count = load_yaml(Path(file_path)).get("file_count", 0)
-        file_count = len(os.listdir(self.config.data_path))
-
-        if current_count < file_count or not os.path.exists(
-            os.path.join(self.config.root_dir, f"{analysis_type}_trip_length.parquet")
-        ):
-            analysis_method = getattr(self, f"calculate_{analysis_type}")
-            analysis_method()
-            with open(file_path, "w") as file:
-                yaml.dump({"file_count": file_count}, file)
+        manifest_path = os.path.join(
+            self.config.root_dir, f"{analysis_type}_dependencies.yaml"
+        )
+        analysis_file = os.path.join(
+            self.config.root_dir, f"{analysis_type}_trip_length.parquet"
+        )
+        previous, current, changed, removed = self.input_changes(manifest_path)
+
+        if changed or removed or not os.path.exists(analysis_file):
+            if analysis_type == "monthly_average":
+                self.calculate_monthly_average(files=changed)
+            else:
+                getattr(self, f"calculate_{analysis_type}")()
+            with open(manifest_path, "w") as file:
+                yaml.safe_dump(current, file)
             logger.info(
                 f"{analysis_type.replace('_', ' ').title()} analysis completed and plotted."
             )
-            self.plot_interactive_trip_length(
-                os.path.join(
-                    self.config.root_dir, f"{analysis_type}_trip_length.parquet"
-                )
-            )
+        elif current != previous:
+            # Touched but unchanged inputs: keep their new size and mtime to skip hashing them
+            with open(manifest_path, "w") as file:
+                yaml.safe_dump(current, file)
 
-        else:
-            self.plot_interactive_trip_length(
-                os.path.join(
-                    self.config.root_dir, f"{analysis_type}_trip_length.parquet"
-                )
-            )
+        self.plot_interactive_trip_length(analysis_file)
+
+
+def daily_partial(visualization, scan):
+    """Partial of the trip length analyses: the month's daily aggregates."""
+    return scan.daily
+
+
+def rolling_average_update(visualization, partials):
+    """
+    Extends the rolling average when `incremental` allows it, see `calculate_rolling_average`,
+    from the scanned daily aggregates of the changed months.
+    """
+    visualization.calculate_rolling_average(dailies=partials)
+
+
+def monthly_average_update(visualization, partials):
+    """Recomputes the monthly averages of the changed months from their scanned daily aggregates."""
+    visualization.calculate_monthly_average(files=list(partials), dailies=partials)
+
+
+register_analysis(
+    Analysis(
+        "rolling_average",
+        (),
+        daily_partial,
+        plot=True,
+        update=rolling_average_update,
+    )
+)
+register_analysis(
+    Analysis(
+        "monthly_average",
+        (),
+        daily_partial,
+        plot=True,
+        update=monthly_average_update,
+    )
+)
+
+
+def sketches_partial(visualization, scan):
+    """Partial of the percentile analyses: the month's daily quantile sketches."""
+    return scan.sketches
+
+
+def sketch_source(visualization, file_name):
+    """Input of the percentile analyses: the month's sketch file, see `sketch_source`."""
+    return visualization.sketch_source(file_name)
+
+
+def monthly_percentiles_finalize(visualization, partials):
+    """Monthly percentiles of the trip metrics, merged from the daily sketches of each month."""
+    rows = []
+    for file_name, partial in sorted(
+        partials.items(), key=lambda item: visualization.pruned_file_month(item[0])
+    ):
+        sketch, dates, counts = visualization.merge_sketches([partial])
+        row = {
+            name: float(value)
+            for name, value in visualization.percentile_columns(
+                sketch, {metric: c.sum(axis=0) for metric, c in counts.items()}
+            ).items()
+        }
+        row["date"] = visualization.pruned_file_month(file_name) + "-01"
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def rolling_percentiles_finalize(visualization, partials):
+    """
+    Percentiles of the trip metrics over the last `rolling_days` calendar days of every day,
+    merged from the daily sketches with a sliding window sum.
+    """
+    sketch, dates, counts = visualization.merge_sketches(partials.values())
+    window_days = visualization.config.rolling_days
+    windows = {}
+    for metric, daily in counts.items():
+        cumulative = np.cumsum(daily, axis=0)
+        windows[metric] = cumulative.copy()
+        windows[metric][window_days:] -= cumulative[:-window_days]
+    rolling = pd.DataFrame(visualization.percentile_columns(sketch, windows))
+    rolling.insert(0, "date", pd.DatetimeIndex(dates))
+    return rolling
+
+
+register_analysis(
+    Analysis(
+        "monthly_percentiles",
+        (),
+        sketches_partial,
+        monthly_percentiles_finalize,
+        source=sketch_source,
+    )
+)
+register_analysis(
+    Analysis(
+        "rolling_percentiles",
+        (),
+        sketches_partial,
+        rolling_percentiles_finalize,
+        source=sketch_source,
+    )
+)
+
+
+def zone_cube_partial(visualization, scan):
+    """
+    Partial of the zone matrix: the directory of the month's zone cube, None for months
+    without zones. The cube is built again only if the pruned file changed since, so a rerun
+    after other months changed merely merges the existing cubes.
+    """
+    file_path = visualization.pruned_source(scan.file_name)
+    if not set(ZONE_COLUMNS) <= set(pq.read_schema(file_path).names):
+        return None
+    cube_path = visualization.zone_cube_path(scan.file_name)
+    stat = os.stat(file_path)
+    source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if ZoneCube.is_current(cube_path, source, DAILY_METRICS):
+        return cube_path
+    trips = scan.trips
+    built = ZoneCube.build(
+        cube_path,
+        trips.index.values,
+        trips["pulocationid"].to_numpy(np.float64, na_value=np.nan),
+        trips["dolocationid"].to_numpy(np.float64, na_value=np.nan),
+        {metric: trips[metric].to_numpy(np.float64) for metric in DAILY_METRICS},
+        source,
+    )
+    return cube_path if built else None
+
+
+def pruned_source(visualization, file_name):
+    """Input of the zone matrix: the pruned file its cube is built from, see `zone_cube_partial`."""
+    return visualization.pruned_source(file_name)
+
+
+def zone_matrix_finalize(visualization, partials):
+    """Trips and average trip length per origin-destination pair, merged from the zone cubes."""
+    cubes = [ZoneCube(path) for path in partials.values() if path is not None]
+    return visualization.zone_frame(ZoneCube.merge(cubes))
+
+
+register_analysis(
+    Analysis(
+        "zone_matrix",
+        ZONE_COLUMNS,
+        zone_cube_partial,
+        zone_matrix_finalize,
+        source=pruned_source,
+    )
+)
@@ -6,6 +6,7 @@ from src.constants import *
 from src.entity import DataIngestionConfig
 from src.entity import DataTransformationConfig
 from src.entity import DataVisualizationConfig
+from src.entity import PipelineConfig
 
 
 class ConfigurationManager:
@@ -28,6 +29,16 @@ class ConfigurationManager:
             source_URL=config["source_URL"],
             local_data_name=config["local_data_name"],
             max_retries=params["max_retries"],
+            max_workers=params["max_workers"],
+            max_connections_per_host=params["max_connections_per_host"],
+            chunk_size=params["chunk_size"],
+            request_timeout=params["request_timeout"],
+            backoff_factor=params["backoff_factor"],
+            max_backoff=params["max_backoff"],
+            breaker_failure_threshold=params["breaker_failure_threshold"],
+            breaker_cooldown=params["breaker_cooldown"],
+            revalidate=params["revalidate"],
+            manifest_file_name=config["manifest_file_name"],
         )
 
         return data_ingestion_config
@@ -46,6 +57,19 @@ class ConfigurationManager:
             shortest_trip_distance=params["shortest_trip_distance"],
             shortest_trip_duration=params["shortest_trip_duration"],
             least_cost=params["least_cost"],
+            extra_columns=tuple(params["extra_columns"]),
+            mode=params["mode"],
+            memory_budget_mb=params["memory_budget_mb"],
+            max_workers=params["max_workers"],
+            engine=params["engine"],
+            dtype_plan=params["dtype_plan"],
+            output_layout=params["output_layout"],
+            row_group_size=params["row_group_size"],
+            compression=params["compression"],
+            compression_level=params["compression_level"],
+            sketch_relative_accuracy=params["sketch_relative_accuracy"],
+            zone_file=config["zone_file"],
+            zone_grid_size=params["zone_grid_size"],
         )
 
         return data_transformation_config
@@ -62,6 +86,20 @@ class ConfigurationManager:
             rolling_days=params["rolling_days"],
             monthly_average_file_name=config["monthly_average_file_name"],
             rolling_average_file_name=config["rolling_average_file_name"],
+            incremental=params["incremental"],
+            max_workers=params["max_workers"],
+            percentiles=tuple(params["percentiles"]),
         )
 
         return data_visualization_config
+
+    def get_pipeline_config(self) -> PipelineConfig:
+        params = self.params["pipeline"]
+
+        pipeline_config = PipelineConfig(
+            mode=params["mode"],
+            queue_size=params["queue_size"],
+            transform_workers=params["transform_workers"],
+        )
+
+        return pipeline_config
@@ -2,3 +2,14 @@ from pathlib import Path
 
 CONFIG_FILE_PATH = Path("config/config.yaml")
 PARAMS_FILE_PATH = Path("params.yaml")
+PARQUET_MAGIC = b"PAR1"
+PARTITIONED_DATASET_DIR = "dataset"
+PARTITION_FILE_NAME = "part-0.parquet"
+SIDECAR_DIR = "sidecars"
+# Metrics whose daily count, sum and sum of squares are kept in the sidecars
+DAILY_METRICS = ("trip_duration", "trip_distance")
+SKETCH_DIR = "sketches"
+# Metrics with daily quantile sketches
+SKETCH_METRICS = ("trip_duration", "trip_distance", "total_amount")
+# Footer catalog kept in each directory of monthly Parquet files
+CATALOG_FILE_NAME = "catalog.json"
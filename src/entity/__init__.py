@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 
 
@@ -8,6 +8,16 @@ class DataIngestionConfig:
     source_URL: str
     local_data_name: str
     max_retries: int
+    max_workers: int = 1
+    max_connections_per_host: int = 4
+    chunk_size: int = 1048576
+    request_timeout: int = 60
+    backoff_factor: float = 0.3
+    max_backoff: float = 60
+    breaker_failure_threshold: int = 5
+    breaker_cooldown: float = 120
+    revalidate: bool = False
+    manifest_file_name: str = "manifest.yaml"
 
 
 @dataclass(frozen=True)
@@ -19,6 +29,19 @@ class DataTransformationConfig:
     shortest_trip_distance: float
     shortest_trip_duration: int
     least_cost: float
+    extra_columns: tuple = ()
+    mode: str = "table"
+    memory_budget_mb: int = 512
+    max_workers: int = 1
+    engine: str = "pandas"
+    dtype_plan: dict = field(default_factory=dict)
+    output_layout: str = "flat"
+    row_group_size: int = 1048576
+    compression: str = "snappy"
+    compression_level: int = None
+    sketch_relative_accuracy: float = 0.01
+    zone_file: Path = None
+    zone_grid_size: int = 1024
 
 
 @dataclass(frozen=True)
@@ -28,3 +51,13 @@ class DataVisualizationConfig:
     rolling_days: int
     monthly_average_file_name: str
     rolling_average_file_name: str
+    incremental: bool = False
+    max_workers: int = 1
+    percentiles: tuple = (0.5, 0.95)
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    mode: str
+    queue_size: int
+    transform_workers: int
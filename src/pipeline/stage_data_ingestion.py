@@ -11,3 +11,4 @@ class DataIngestionTrainingPipeline:
         data_ingestion_config = config.get_data_ingestion_config()
         data_ingestion = DataIngestion(config=data_ingestion_config)
         data_ingestion.download_missing_parquet_files()
+        data_ingestion.update_catalog()
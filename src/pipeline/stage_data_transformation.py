@@ -11,3 +11,4 @@ class DataTransformationTrainingPipeline:
         data_transformation_config = config.get_data_transformation_config()
         data_transformation = DataTransformation(config=data_transformation_config)
         data_transformation.data_cleaning()
+        data_transformation.update_catalog()
@@ -10,5 +10,5 @@ class DataVisualizationTrainingPipeline:
         config = ConfigurationManager()
         data_visualization_config = config.get_data_visualization_config()
         data_visualization = DataVisualization(config=data_visualization_config)
-        data_visualization.execute_analysis("rolling_average")
-        data_visualization.execute_analysis("monthly_average")
+        data_visualization.run_analyses()
+        data_visualization.build_daily_index()
@@ -0,0 +1,84 @@
+from src.config.config import ConfigurationManager
+from src.components.data_ingestion import DataIngestion
+from src.components.data_transformation import DataTransformation
+from src.utils.logger import logger
+
+import queue
+import threading
+
+
+class StreamingIngestionTransformationPipeline:
+    """
+    Runs ingestion and transformation together: every month that lands is put on a
+    bounded queue and cleaned by transformation workers while other downloads are
+    still in flight. A full queue blocks the download threads, which keeps the
+    number of downloaded-but-uncleaned months, and so disk and memory, bounded.
+    """
+
+    def __init__(self):
+        pass
+
+    def transform_worker(self, data_transformation, months, reports):
+        while True:
+            filename = months.get()
+            try:
+                if filename is None:
+                    return
+                reports.append(data_transformation.clean_month(filename))
+            finally:
+                months.task_done()
+
+    def main(self):
+        config = ConfigurationManager()
+        pipeline_config = config.get_pipeline_config()
+        data_ingestion = DataIngestion(config=config.get_data_ingestion_config())
+        data_transformation = DataTransformation(
+            config=config.get_data_transformation_config()
+        )
+
+        months = queue.Queue(maxsize=pipeline_config.queue_size)
+        reports = []
+        workers = [
+            threading.Thread(
+                target=self.transform_worker,
+                args=(data_transformation, months, reports),
+                daemon=True,
+            )
+            for _ in range(pipeline_config.transform_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            summary = data_ingestion.download_missing_parquet_files(
+                on_downloaded=months.put
+            )
+        finally:
+            for _ in workers:
+                months.put(None)
+            for worker in workers:
+                worker.join()
+
+        # Months downloaded by earlier runs but never cleaned. The months the workers
+        # already tried, failed ones included, are not tried again, and failures are
+        # reported below instead of raised
+        attempted = {report["file"] for report in reports}
+        reports += [
+            data_transformation.clean_month(filename)
+            for filename in data_transformation.list_raw_files()
+            if filename not in attempted
+        ]
+        data_transformation.save_dtype_report(reports)
+        data_transformation.save_cache_index(reports)
+        data_ingestion.update_catalog()
+        data_transformation.update_catalog()
+
+        errors = {
+            report["file"]: report["error"]
+            for report in reports
+            if report["status"] == "failed"
+        }
+
+        if errors:
+            logger.error(f"Months that failed cleaning: {', '.join(sorted(errors))}")
+        return summary, errors
@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import pandas as pd
+import yaml
+from src.utils.utils import load_yaml
+
+# Day 0 of the index, the first month of the TLC trip records
+EPOCH = np.datetime64("2009-01-01", "D")
+INDEX_FILE_NAME = "index.yaml"
+
+
+class DailyIndex:
+    """
+    Compact daily time-series store: one memory-mapped NumPy array per quantity, indexed by
+    the day offset from EPOCH and holding prefix sums, so element i is the total of days
+    0..i-1. The total of any day range [start, end) is then `prefix[end] - prefix[start]`,
+    and every rolling window or date-range average costs O(1) per point.
+
+    Stored per metric: `<metric>_sum` (sum over trips) and `<metric>_mean_sum` (sum of the daily
+    means), with `count` (trips) and `days` (days with trips) as the denominators.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta = load_yaml(os.path.join(path, INDEX_FILE_NAME))
+        self.metrics = meta["metrics"]
+        self.num_days = meta["num_days"]
+        self.arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in meta["arrays"]
+        }
+
+    @staticmethod
+    def build(path, daily, metrics):
+        """
+        Writes the index of a daily series.
+
+        Parameters:
+        - path (str): Directory of the index.
+        - daily (DataFrame): Daily count and `<metric>_sum` columns with a DatetimeIndex, on or
+          after EPOCH. Missing days count as days without trips.
+        - metrics (iterable): The metrics to index.
+        """
+        os.makedirs(path, exist_ok=True)
+        offsets = (daily.index.values.astype("datetime64[D]") - EPOCH).astype(np.int64)
+        if len(offsets) and offsets.min() < 0:
+            raise ValueError(f"Days before {EPOCH} cannot be indexed")
+        num_days = int(offsets.max()) + 1 if len(offsets) else 0
+
+        count = np.bincount(offsets, weights=daily["count"], minlength=num_days)
+        active = count > 0
+        values = {"count": count, "days": active.astype(np.float64)}
+        for metric in metrics:
+            total = np.bincount(
+                offsets, weights=daily[f"{metric}_sum"], minlength=num_days
+            )
+            mean = np.zeros(num_days)
+            np.divide(total, count, out=mean, where=active)
+            values[f"{metric}_sum"] = total
+            values[f"{metric}_mean_sum"] = mean
+
+        for name, value in values.items():
+            dtype = np.int64 if name in ("count", "days") else np.float64
+            tmp_path = os.path.join(path, f".{name}.npy.tmp")
+            prefix = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=dtype, shape=(num_days + 1,)
+            )
+            prefix[0] = 0
+            np.cumsum(value, out=prefix[1:], dtype=dtype)
+            prefix.flush()
+            del prefix
+            os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+        # Written last, so a reader never sees arrays without their metadata
+        with open(os.path.join(path, INDEX_FILE_NAME), "w") as file:
+            yaml.safe_dump(
+                {
+                    "epoch": str(EPOCH),
+                    "num_days": num_days,
+                    "metrics": list(metrics),
+                    "arrays": list(values),
+                },
+                file,
+            )
+
+    def offset(self, date):
+        """Returns the day offset of a date from EPOCH, clipped to the indexed days."""
+        day = (np.datetime64(pd.Timestamp(date), "D") - EPOCH).astype(np.int64)
+        return int(np.clip(day, 0, self.num_days))
+
+    def range_total(self, name, start, end):
+        """Returns the total of an array over the days [start, end)."""
+        prefix = self.arrays[name]
+        return prefix[self.offset(end)] - prefix[self.offset(start)]
+
+    def range_average(self, metric, start, end, weighting="trips"):
+        """
+        Averages a metric over the days [start, end) in O(1).
+
+        Parameters:
+        - metric (str): An indexed metric, e.g. 'trip_duration'.
+        - start (date-like): First day of the range.
+        - end (date-like): Day after the range.
+        - weighting (str): 'trips' for the mean over all trips, 'days' for the mean of the
+          daily means.
+
+        Returns:
+        - float: The average, NaN if the range has no trips.
+        """
+        if weighting == "days":
+            total, count = f"{metric}_mean_sum", "days"
+        else:
+            total, count = f"{metric}_sum", "count"
+        denominator = self.range_total(count, start, end)
+        if denominator == 0:
+            return np.nan
+        return float(self.range_total(total, start, end) / denominator)
+
+    def rolling_average(self, metric, window_days, weighting="days"):
+        """
+        Computes the rolling average of a metric over the last `window_days` calendar days of
+        every day, from the first to the last day with trips, in O(1) per day.
+
+        Parameters:
+        - metric (str): An indexed metric, e.g. 'trip_duration'.
+        - window_days (int): Window length in days.
+        - weighting (str): 'days' (default) averages the daily means like
+          `calculate_rolling_average`, 'trips' averages over all trips of the window.
+
+        Returns:
+        - Series: The rolling average indexed by date, NaN where a window has no trips.
+        """
+        if weighting == "days":
+            total, count = f"{metric}_mean_sum", "days"
+        else:
+            total, count = f"{metric}_sum", "count"
+        total, count = self.arrays[total], self.arrays[count]
+
+        active = np.flatnonzero(np.diff(self.arrays["count"]))
+        if not len(active):
+            return pd.Series(dtype=np.float64)
+        end = np.arange(active[0], active[-1] + 1) + 1
+        start = np.maximum(end - window_days, 0)
+
+        denominator = (count[end] - count[start]).astype(np.float64)
+        average = np.full(len(end), np.nan)
+        np.divide(
+            total[end] - total[start], denominator, out=average, where=denominator > 0
+        )
+        dates = EPOCH + (end - 1).astype("timedelta64[D]")
+        return pd.Series(average, index=pd.DatetimeIndex(dates, name="date"))
@@ -11,6 +11,8 @@ def error_message_detail(
     error, error_detail: sys
 ):  # error_detail is expected to be an instance of the sys module.
     _, _, exc_tb = error_detail.exc_info()
+    if exc_tb is None:  # raised outside of an except block
+        return "Error occurred error message [{0}]".format(str(error))
     file_name = exc_tb.tb_frame.f_code.co_filename
     error_message = "Error occurred in script name [{0}] line number [{1}] error message [{2}]".format(
         file_name, exc_tb.tb_lineno, str(error)
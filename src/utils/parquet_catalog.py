@@ -0,0 +1,261 @@
+import datetime
+import decimal
+import json
+import math
+import os
+import re
+import pyarrow.parquet as pq
+from src.utils.schema_registry import detect_era
+
+MONTH_PATTERN = re.compile(r"(\d{4})[-_](\d{2})\.parquet$")
+PARTITION_PATTERN = re.compile(r"year=(\d{4})[/\\]month=(\d{1,2})[/\\]")
+
+
+def file_month(file_name):
+    """
+    Returns the month of a monthly Parquet file as "YYYY-MM", from a `..._YYYY-MM.parquet` or
+    `..._YYYY_MM.parquet` name or a `year=YYYY/month=MM/` partition, or None if the path has
+    neither.
+    """
+    match = PARTITION_PATTERN.search(file_name) or MONTH_PATTERN.search(file_name)
+    if match is None:
+        return None
+    return f"{match.group(1)}-{int(match.group(2)):02d}"
+
+
+def statistic_value(value):
+    """Converts a row-group statistic to a JSON value, dates and timestamps as ISO strings."""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def read_footer(file_path):
+    """
+    Summarizes a Parquet file from its footer, without reading data pages.
+
+    Parameters:
+    - file_path (str): The Parquet file.
+
+    Returns:
+    - dict: num_rows, era (see `detect_era`), columns (name -> Arrow type), the compressed and
+      uncompressed byte sizes and, per row group, its num_rows, byte sizes and the
+      [min, max] statistics of the columns that have them. Only "error" if the footer
+      cannot be read.
+    """
+    try:
+        parquet_file = pq.ParquetFile(file_path)
+    except Exception as e:
+        return {"error": str(e)}
+    metadata = parquet_file.metadata
+    schema = parquet_file.schema_arrow
+
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        statistics = {}
+        compressed = 0
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            compressed += column.total_compressed_size
+            stats = column.statistics
+            if stats is not None and stats.has_min_max:
+                statistics[column.path_in_schema] = [
+                    statistic_value(stats.min),
+                    statistic_value(stats.max),
+                ]
+        row_groups.append(
+            {
+                "num_rows": row_group.num_rows,
+                "compressed_size": compressed,
+                "uncompressed_size": row_group.total_byte_size,
+                "statistics": statistics,
+            }
+        )
+
+    return {
+        "num_rows": metadata.num_rows,
+        "era": detect_era(schema.names),
+        "columns": {field.name: str(field.type) for field in schema},
+        "compressed_size": sum(rg["compressed_size"] for rg in row_groups),
+        "uncompressed_size": sum(rg["uncompressed_size"] for rg in row_groups),
+        "row_groups": row_groups,
+    }
+
+
+class ParquetCatalog:
+    """
+    Persistent catalog of the Parquet files of a directory, built from their footers only, so
+    a stage can plan its work, find missing months and skip months or row groups outside a
+    date range without opening data pages.
+
+    Entries are keyed by the path relative to the directory and hold the file's size,
+    mtime_ns and month besides the summary of `read_footer`. `refresh` reads the footers of
+    new or changed files only. The catalog is kept as JSON rather than YAML, since it holds
+    the statistics of every row group and is loaded on every run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries = json.load(file)
+
+    def refresh(self, directory, file_names=None):
+        """
+        Brings the catalog up to date with the files of a directory.
+
+        Parameters:
+        - directory (str): The directory the file names are relative to.
+        - file_names (list): Optional files to catalog, the non-hidden `.parquet` files of the
+          directory by default.
+
+        Returns:
+        - tuple: The files whose footer was read again, added or changed in size or mtime,
+          and the files dropped from the catalog.
+        """
+        if file_names is None:
+            file_names = sorted(
+                file_name
+                for file_name in os.listdir(directory)
+                if file_name.endswith(".parquet") and not file_name.startswith(".")
+            )
+
+        entries, changed = {}, []
+        for file_name in file_names:
+            entries[file_name], read = self.lookup(directory, file_name)
+            if read:
+                changed.append(file_name)
+        removed = sorted(set(self.entries) - set(entries))
+        self.entries = entries
+        if changed or removed:
+            self.save()
+        return changed, removed
+
+    def lookup(self, directory, file_name):
+        """
+        Returns the entry of a file without changing the catalog: the cataloged one while the
+        file's size and mtime match it, else one built from its footer.
+
+        Parameters:
+        - directory (str): The directory the file name is relative to.
+        - file_name (str): The file.
+
+        Returns:
+        - tuple: The entry and whether its footer was read.
+        """
+        file_path = os.path.join(directory, file_name)
+        stat = os.stat(file_path)
+        entry = self.entries.get(file_name)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return entry, False
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "month": file_month(file_name),
+            **read_footer(file_path),
+        }, True
+
+    def save(self):
+        """Writes the catalog through a hidden temporary file."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        folder, file_name = os.path.split(self.path)
+        tmp_path = os.path.join(folder, f".{file_name}.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_path, self.path)
+
+    def readable(self):
+        """Returns the cataloged files whose footer could be read."""
+        return [name for name, entry in self.entries.items() if "error" not in entry]
+
+    def unreadable(self):
+        """Returns the cataloged files whose footer could not be read, with the error."""
+        return {
+            name: entry["error"]
+            for name, entry in self.entries.items()
+            if "error" in entry
+        }
+
+    def months(self):
+        """Returns month "YYYY-MM" -> file for the readable files with a month."""
+        return {
+            self.entries[name]["month"]: name
+            for name in self.readable()
+            if self.entries[name]["month"] is not None
+        }
+
+    def missing_months(self, expected):
+        """
+        Returns the expected months without a readable file.
+
+        Parameters:
+        - expected (iterable): Months as "YYYY-MM".
+
+        Returns:
+        - list: The missing months, in the order of `expected`.
+        """
+        months = self.months()
+        return [month for month in expected if month not in months]
+
+    def num_rows(self, file_names=None):
+        """Returns the total rows of the given files, of every readable file by default."""
+        file_names = self.readable() if file_names is None else file_names
+        return sum(self.entries[name]["num_rows"] for name in file_names)
+
+    def value_range(self, file_name, column):
+        """
+        Returns the [min, max] of a column over a file's row groups, from their statistics.
+
+        Returns:
+        - list or None: The range, or None if a row group has no statistics for the column.
+        """
+        statistics = [
+            row_group["statistics"].get(column)
+            for row_group in self.entries[file_name].get("row_groups", [])
+        ]
+        if not statistics or any(
+            value is None or None in value for value in statistics
+        ):
+            return None
+        return [
+            min(value[0] for value in statistics),
+            max(value[1] for value in statistics),
+        ]
+
+    def row_groups(self, file_name, column, start, end):
+        """
+        Returns the row groups of a file that may hold values of a column in [start, end).
+
+        Bounds are compared with the statistics as stored: ISO strings for dates and
+        timestamps, which compare like the values they hold, e.g. "2009-04-20". Row groups
+        without statistics for the column are always kept.
+
+        Parameters:
+        - file_name (str): A cataloged file.
+        - column (str): The column whose statistics are used.
+        - start (value): Lower bound, inclusive.
+        - end (value): Upper bound, exclusive.
+
+        Returns:
+        - list: Indices of the row groups to read.
+        """
+        selected = []
+        for i, row_group in enumerate(self.entries[file_name].get("row_groups", [])):
+            value = row_group["statistics"].get(column)
+            if value is None or None in value or (value[1] >= start and value[0] < end):
+                selected.append(i)
+        return selected
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with a relative accuracy guarantee, in the manner of DDSketch.
+
+    Values are counted in logarithmic buckets: bucket i holds (gamma^(i-1), gamma^i] with
+    gamma = (1 + a) / (1 - a), so any quantile is returned within a relative error of a. The
+    sketch of a group of values is just the array of its bucket counts, of a fixed length for
+    given parameters, so sketches merge by addition: the sketch of a month is the sum of the
+    sketches of its days, and a window's is the sum over its days.
+
+    Values at or below `min_value` share the first bucket and values above `max_value` the
+    last one.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-2, max_value=1e7):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.offset = int(np.ceil(np.log(min_value) / self.log_gamma))
+        self.num_buckets = (
+            int(np.ceil(np.log(max_value) / self.log_gamma)) - self.offset + 1
+        )
+
+    def params(self):
+        """Returns the parameters a stored sketch was built with."""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "max_value": self.max_value,
+        }
+
+    def bucket(self, values):
+        """Returns the bucket of each value."""
+        values = np.clip(np.asarray(values, dtype=np.float64), self.min_value, None)
+        index = np.ceil(np.log(values) / self.log_gamma).astype(np.int64) - self.offset
+        return np.clip(index, 0, self.num_buckets - 1)
+
+    def counts(self, values, groups=None, num_groups=1):
+        """
+        Builds the sketches of groups of values.
+
+        Parameters:
+        - values (array): The values, NaN values are skipped.
+        - groups (array): Optional group of each value in [0, num_groups), e.g. the day.
+        - num_groups (int): Number of groups.
+
+        Returns:
+        - ndarray: Bucket counts of shape (num_groups, num_buckets).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        groups = np.zeros(len(values), np.int64) if groups is None else groups
+        valid = ~np.isnan(values)
+        flat = groups[valid] * self.num_buckets + self.bucket(values[valid])
+        return np.bincount(flat, minlength=num_groups * self.num_buckets).reshape(
+            num_groups, self.num_buckets
+        )
+
+    def value(self, index):
+        """Returns the value representing a bucket, within the relative accuracy of its values."""
+        return 2 * self.gamma ** (index + self.offset) / (self.gamma + 1)
+
+    def quantiles(self, counts, quantiles):
+        """
+        Estimates quantiles from sketches.
+
+        Parameters:
+        - counts (ndarray): One sketch, or sketches stacked along the first axes.
+        - quantiles (iterable): Quantiles in [0, 1].
+
+        Returns:
+        - ndarray: Shape counts.shape[:-1] + (len(quantiles),), NaN for empty sketches.
+        """
+        cumulative = np.cumsum(counts, axis=-1)
+        total = cumulative[..., -1:]
+        estimates = []
+        for q in quantiles:
+            rank = q * (total - 1)
+            index = np.argmax(cumulative > rank, axis=-1)
+            estimates.append(np.where(total[..., 0] > 0, self.value(index), np.nan))
+        return np.stack(estimates, axis=-1)
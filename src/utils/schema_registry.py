@@ -0,0 +1,184 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Codes that changed from strings (2009-2010) to integers are stored as string dictionaries,
+# the only dictionaries Parquet restores on read
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+# Canonical columns of the pruned output in file order, with the type every era is cast to
+CANONICAL_TYPES = {
+    "vendor": DICTIONARY_TYPE,
+    "pickup_datetime": pa.timestamp("us"),
+    "dropoff_datetime": pa.timestamp("us"),
+    "passenger_count": pa.int16(),
+    "trip_distance": pa.float32(),
+    "pickup_longitude": pa.float64(),
+    "pickup_latitude": pa.float64(),
+    "dropoff_longitude": pa.float64(),
+    "dropoff_latitude": pa.float64(),
+    "pulocationid": pa.int16(),
+    "dolocationid": pa.int16(),
+    "rate_code": DICTIONARY_TYPE,
+    "payment_type": DICTIONARY_TYPE,
+    "fare_amount": pa.float32(),
+    "tip_amount": pa.float32(),
+    "total_amount": pa.float32(),
+    # Derived by the transformation stage
+    "trip_duration": pa.float64(),
+    "speed": pa.float64(),
+    "date": pa.date32(),
+}
+
+# Lowercase source column name -> canonical column name, per schema era
+ERAS = {
+    "2009": {
+        "vendor_name": "vendor",
+        "trip_pickup_datetime": "pickup_datetime",
+        "trip_dropoff_datetime": "dropoff_datetime",
+        "passenger_count": "passenger_count",
+        "trip_distance": "trip_distance",
+        "start_lon": "pickup_longitude",
+        "start_lat": "pickup_latitude",
+        "end_lon": "dropoff_longitude",
+        "end_lat": "dropoff_latitude",
+        "rate_code": "rate_code",
+        "payment_type": "payment_type",
+        "fare_amt": "fare_amount",
+        "tip_amt": "tip_amount",
+        "total_amt": "total_amount",
+    },
+    "2010": {
+        "vendor_id": "vendor",
+        "pickup_datetime": "pickup_datetime",
+        "dropoff_datetime": "dropoff_datetime",
+        "passenger_count": "passenger_count",
+        "trip_distance": "trip_distance",
+        "pickup_longitude": "pickup_longitude",
+        "pickup_latitude": "pickup_latitude",
+        "dropoff_longitude": "dropoff_longitude",
+        "dropoff_latitude": "dropoff_latitude",
+        "rate_code": "rate_code",
+        "payment_type": "payment_type",
+        "fare_amount": "fare_amount",
+        "tip_amount": "tip_amount",
+        "total_amount": "total_amount",
+    },
+    "2011": {
+        "vendorid": "vendor",
+        "tpep_pickup_datetime": "pickup_datetime",
+        "tpep_dropoff_datetime": "dropoff_datetime",
+        "passenger_count": "passenger_count",
+        "trip_distance": "trip_distance",
+        "ratecodeid": "rate_code",
+        "pulocationid": "pulocationid",
+        "dolocationid": "dolocationid",
+        "payment_type": "payment_type",
+        "fare_amount": "fare_amount",
+        "tip_amount": "tip_amount",
+        "total_amount": "total_amount",
+    },
+}
+
+ALIASES = {
+    source: canonical for era in ERAS.values() for source, canonical in era.items()
+}
+
+
+def canonical_name(source_name):
+    """Returns the canonical name of a source column, or None if no era knows it."""
+    return ALIASES.get(source_name.lower())
+
+
+def detect_era(schema_names):
+    """
+    Returns the era whose source columns best match a file's schema.
+
+    Parameters:
+    - schema_names (list): Column names from the file footer.
+
+    Returns:
+    - str or None: The era, or None if no column is known to any era.
+    """
+    lowered = {name.lower() for name in schema_names}
+    matches = {era: len(lowered & set(columns)) for era, columns in ERAS.items()}
+    era = max(matches, key=matches.get)
+    return era if matches[era] else None
+
+
+def canonical_schema(columns, dtype_plan=None):
+    """
+    Builds the canonical schema of a set of output columns.
+
+    Parameters:
+    - columns (iterable): Canonical column names, ordered as in CANONICAL_TYPES in the schema.
+    - dtype_plan (dict): Optional column -> type overrides, "dictionary" or an Arrow type name.
+
+    Returns:
+    - pa.Schema: The schema every month is cast to.
+
+    Raises:
+    - ValueError: If a column or a planned column is not canonical.
+    """
+    dtype_plan = dtype_plan or {}
+    unknown = (set(columns) | set(dtype_plan)) - set(CANONICAL_TYPES)
+    if unknown:
+        raise ValueError(f"Not canonical columns: {sorted(unknown)}")
+
+    fields = []
+    for name, canonical_type in CANONICAL_TYPES.items():
+        if name not in columns:
+            continue
+        dtype = dtype_plan.get(name)
+        if dtype == "dictionary":
+            canonical_type = DICTIONARY_TYPE
+        elif dtype is not None:
+            canonical_type = pa.type_for_alias(dtype)
+        fields.append(pa.field(name, canonical_type))
+    return pa.schema(fields)
+
+
+def cast_column(column, target_type):
+    """
+    Casts a column to its canonical type. Dictionary targets encode the values as strings,
+    with float codes (integers with nulls) written without a fractional part.
+    """
+    if pa.types.is_dictionary(target_type):
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        if pa.types.is_floating(column.type):
+            column = pc.cast(column, pa.int64())
+        return pc.dictionary_encode(column.cast(pa.string()))
+    return pc.cast(column, target_type)
+
+
+def to_canonical(table, schema):
+    """
+    Casts a table to a canonical schema: columns are ordered as in the schema, cast to its
+    types, and columns this era does not have are added as nulls.
+
+    Parameters:
+    - table (pa.Table): Trips with canonical column names.
+    - schema (pa.Schema): From `canonical_schema`.
+
+    Returns:
+    - pa.Table: A table with exactly `schema`.
+
+    Raises:
+    - ValueError: If the values of a column do not fit its canonical type.
+    """
+    arrays = []
+    for field in schema:
+        if field.name not in table.column_names:
+            arrays.append(pa.nulls(table.num_rows, field.type))
+            continue
+        column = table[field.name]
+        if column.type == field.type:
+            arrays.append(column)
+            continue
+        try:
+            arrays.append(cast_column(column, field.type))
+        except pa.ArrowInvalid as e:
+            raise ValueError(
+                f"Column {field.name} ({column.type}) does not fit {field.type}: {e}"
+            )
+    return pa.Table.from_arrays(arrays, schema=schema)
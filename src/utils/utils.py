@@ -5,6 +5,7 @@ from src.utils.exception import CustomException
 from src.utils.logger import logger
 import dill
 import pickle
+import hashlib
 from ensure import ensure_annotations
 from pathlib import Path
 
@@ -100,3 +101,50 @@ def read_yaml(filename: Path, key: str) -> int:
 
     except Exception as e:
         raise CustomException(e, sys)
+
+
+@ensure_annotations
+def get_file_hash(file_path, chunk_size=1048576) -> str:
+    """get the SHA-256 hex digest of a file, read in chunks
+
+    Args:
+        file_path (str): path of the file
+        chunk_size (int, optional): bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        str: hex digest of the file content
+    """
+    try:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+@ensure_annotations
+def get_file_fingerprint(file_path, previous=None) -> dict:
+    """get the (size, mtime, hash) fingerprint of a file, hashing it only when needed
+
+    Args:
+        file_path (str): path of the file
+        previous (dict, optional): fingerprint of the file from an earlier run. Its hash is
+            reused when size and mtime are unchanged, so the file is not read again.
+
+    Returns:
+        dict: size, mtime_ns and sha256 of the file
+    """
+    try:
+        stat = os.stat(file_path)
+        fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if previous and all(
+            previous.get(key) == fingerprint[key] for key in fingerprint
+        ):
+            fingerprint["sha256"] = previous["sha256"]
+        else:
+            fingerprint["sha256"] = get_file_hash(file_path)
+        return fingerprint
+    except Exception as e:
+        raise CustomException(e, sys)
@@ -0,0 +1,175 @@
+import os
+import numpy as np
+import pandas as pd
+import yaml
+from src.utils.utils import load_yaml
+
+# TLC taxi zones are numbered 1-263, with 264 and 265 for unknown locations; the zone id is
+# used as the index directly, so index 0 stays empty
+NUM_ZONES = 266
+CUBE_FILE_NAME = "cube.yaml"
+# Bump when the stored layout changes, so cubes of an older layout are built again
+CUBE_VERSION = 2
+
+
+class ZoneCube:
+    """
+    Origin-destination cube of one month, stored sparse: only the (day, pickup zone, dropoff
+    zone) cells with trips are kept, as memory-mapped NumPy arrays sorted by the cell key
+    (day * NUM_ZONES + pickup) * NUM_ZONES + dropoff, day counted from the month's first day.
+
+    Stored are `key` (int64), `count` (trips, int32) and `<metric>_sum` (float64) per metric,
+    a few MB for a month where a dense (days, NUM_ZONES, NUM_ZONES) layout takes tens. The
+    cells of different months are totals over disjoint trips, so cubes merge by addition, see
+    `merge`. The metadata records the `source` the cube was built from, so an unchanged month
+    is not built again, see `is_current`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta = load_yaml(os.path.join(path, CUBE_FILE_NAME))
+        self.first_day = np.datetime64(meta["first_day"], "D")
+        self.num_days = meta["num_days"]
+        self.metrics = meta["metrics"]
+        self.keys = np.load(os.path.join(path, "key.npy"), mmap_mode="r")
+        self.arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in meta["arrays"]
+        }
+
+    @staticmethod
+    def is_current(path, source, metrics):
+        """
+        Tells whether the cube in `path` was built in this format from `source` with `metrics`.
+
+        Parameters:
+        - path (str): Directory of the cube.
+        - source (dict): Fingerprint of the cube's input, e.g. its size and mtime_ns.
+        - metrics (iterable): The metrics the cube must hold.
+
+        Returns:
+        - bool: False if the cube is missing, in an older format or built from other inputs.
+        """
+        meta_path = os.path.join(path, CUBE_FILE_NAME)
+        if not os.path.exists(meta_path):
+            return False
+        meta = load_yaml(meta_path) or {}
+        return (
+            meta.get("version") == CUBE_VERSION
+            and meta.get("source") == source
+            and meta.get("metrics") == list(metrics)
+        )
+
+    @staticmethod
+    def build(path, dates, pickup, dropoff, values, source=None):
+        """
+        Writes the cube of a month's trips, grouped with one `bincount` per array over the
+        occupied cells.
+
+        Parameters:
+        - path (str): Directory of the cube.
+        - dates (array): Day of each trip.
+        - pickup (array): Pickup zone of each trip, trips without a valid zone are skipped.
+        - dropoff (array): Dropoff zone of each trip, trips without a valid zone are skipped.
+        - values (dict): Metric -> value of each trip.
+        - source (dict): Optional fingerprint of the input, recorded for `is_current`.
+
+        Returns:
+        - bool: False, writing nothing, if no trip has a valid pickup and dropoff zone.
+        """
+        pickup = np.asarray(pickup, dtype=np.float64)
+        dropoff = np.asarray(dropoff, dtype=np.float64)
+        valid = (
+            (pickup >= 1)
+            & (pickup < NUM_ZONES)
+            & (dropoff >= 1)
+            & (dropoff < NUM_ZONES)
+        )
+        if not valid.any():
+            return False
+
+        days = np.asarray(dates).astype("datetime64[D]")[valid]
+        first_day = days.min()
+        offsets = (days - first_day).astype(np.int64)
+        num_days = int(offsets.max()) + 1
+        key = (
+            offsets * NUM_ZONES + pickup[valid].astype(np.int64)
+        ) * NUM_ZONES + dropoff[valid].astype(np.int64)
+        keys, cell = np.unique(key, return_inverse=True)
+
+        cells = {"count": np.bincount(cell, minlength=len(keys)).astype(np.int32)}
+        for metric, value in values.items():
+            weights = np.nan_to_num(np.asarray(value, dtype=np.float64)[valid])
+            cells[f"{metric}_sum"] = np.bincount(
+                cell, weights=weights, minlength=len(keys)
+            )
+
+        os.makedirs(path, exist_ok=True)
+        for name, array in {"key": keys, **cells}.items():
+            tmp_path = os.path.join(path, f".{name}.npy.tmp")
+            with open(tmp_path, "wb") as file:
+                np.save(file, array)
+            os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+        # Written last, so a reader never sees arrays without their metadata
+        tmp_path = os.path.join(path, f".{CUBE_FILE_NAME}.tmp")
+        with open(tmp_path, "w") as file:
+            yaml.safe_dump(
+                {
+                    "version": CUBE_VERSION,
+                    "first_day": str(first_day),
+                    "num_days": num_days,
+                    "num_zones": NUM_ZONES,
+                    "metrics": list(values),
+                    "arrays": list(cells),
+                    "source": source,
+                },
+                file,
+            )
+        os.replace(tmp_path, os.path.join(path, CUBE_FILE_NAME))
+        return True
+
+    def days(self, start=None, end=None):
+        """Returns the slice of the cube's days in [start, end), all days by default."""
+        first, last = 0, self.num_days
+        if start is not None:
+            start = np.datetime64(pd.Timestamp(start), "D")
+            first = int(np.clip((start - self.first_day).astype(np.int64), 0, last))
+        if end is not None:
+            end = np.datetime64(pd.Timestamp(end), "D")
+            last = int(np.clip((end - self.first_day).astype(np.int64), first, last))
+        return slice(first, last)
+
+    @staticmethod
+    def merge(cubes, start=None, end=None):
+        """
+        Adds up the cells of several cubes over the days [start, end).
+
+        Parameters:
+        - cubes (iterable): Cubes built with the same metrics.
+        - start (date-like): Optional first day, the first day of the cubes by default.
+        - end (date-like): Optional day after the range, the last day of the cubes by default.
+
+        Returns:
+        - dict: Array name -> (NUM_ZONES, NUM_ZONES) totals in float64, `count` in int64.
+        """
+        cells_per_day = NUM_ZONES * NUM_ZONES
+        totals = {}
+        for cube in cubes:
+            # Keys are sorted by day first, so the days in range are one run of cells
+            days = cube.days(start, end)
+            first, last = np.searchsorted(
+                cube.keys, [days.start * cells_per_day, days.stop * cells_per_day]
+            )
+            cell = cube.keys[first:last] % cells_per_day
+            for name, array in cube.arrays.items():
+                total = np.bincount(
+                    cell, weights=array[first:last], minlength=cells_per_day
+                ).reshape(NUM_ZONES, NUM_ZONES)
+                if name == "count":
+                    total = total.astype(np.int64)
+                if name in totals:
+                    totals[name] += total
+                else:
+                    totals[name] = total
+        return totals
@@ -0,0 +1,262 @@
+import json
+import numpy as np
+
+# Upper bound of the (point, edge) pairs tested at once by `ZoneIndex.contains`
+BLOCK_SIZE = 1 << 20
+
+
+class ZoneIndex:
+    """
+    Grid index that assigns taxi zones to longitude/latitude points.
+
+    The bounding box of the zones is divided into `grid_size` x `grid_size` cells. A cell no
+    zone boundary passes through lies entirely in one zone (or none), found once for its center
+    when the index is built, so its points are assigned by a table lookup. Only points in the
+    cells along the boundaries are tested exactly, with the even-odd rule, and only against the
+    zones whose boundaries pass near their cell. A horizontal ray from a point only crosses
+    edges that span the point's grid row, so each zone's edges are also bucketed by row, and a
+    test reads the edges of one row band instead of the whole boundary.
+    """
+
+    def __init__(self, zones, edges, grid_size=512):
+        """
+        Builds the index.
+
+        Parameters:
+        - zones (list): The zone id of each polygon.
+        - edges (list): For each polygon, the edges of all its rings, holes included, as an
+          (n, 4) array of (x0, y0, x1, y1) rows.
+        - grid_size (int): Cells per side of the grid.
+        """
+        self.zone_ids = np.concatenate([[0], np.asarray(zones, dtype=np.int64)])
+        self.num_polygons = len(edges)
+        all_edges = np.concatenate(edges)
+        edge_polygon = np.repeat(np.arange(len(edges)), [len(e) for e in edges])
+        x0, y0, x1, y1 = all_edges.T
+        self.x_min, self.x_max = min(x0.min(), x1.min()), max(x0.max(), x1.max())
+        self.y_min, self.y_max = min(y0.min(), y1.min()), max(y0.max(), y1.max())
+        self.grid_size = grid_size
+        self.dx = (self.x_max - self.x_min) / grid_size
+        self.dy = (self.y_max - self.y_min) / grid_size
+
+        # Row bands: every edge under each (polygon, row) it spans, sorted by that key
+        low = self.rows(np.minimum(y0, y1))
+        span = self.rows(np.maximum(y0, y1)) - low + 1
+        band_edge = np.repeat(np.arange(len(all_edges)), span)
+        band_row = np.repeat(low, span) + spread(span)
+        band_key = edge_polygon[band_edge] * grid_size + band_row
+        order = np.argsort(band_key, kind="stable")
+        self.band_key = band_key[order]
+        self.band_edges = all_edges[band_edge[order]]
+
+        # Polygon (index + 1, 0 for none) holding the center of each cell, tested for the
+        # cells within each polygon's bounding box
+        cells, polygons = [], []
+        for polygon, polygon_edges in enumerate(edges):
+            columns = np.arange(
+                self.columns(polygon_edges[:, [0, 2]].min()),
+                self.columns(polygon_edges[:, [0, 2]].max()) + 1,
+            )
+            rows = np.arange(
+                self.rows(polygon_edges[:, [1, 3]].min()),
+                self.rows(polygon_edges[:, [1, 3]].max()) + 1,
+            )
+            cells.append((rows[:, None] * grid_size + columns).ravel())
+            polygons.append(np.full(len(rows) * len(columns), polygon))
+        cells, polygons = np.concatenate(cells), np.concatenate(polygons)
+        row, column = np.divmod(cells, grid_size)
+        inside = self.contains(
+            self.x_min + (column + 0.5) * self.dx,
+            self.y_min + (row + 0.5) * self.dy,
+            row,
+            polygons,
+        )
+        self.cell_polygon = np.zeros(grid_size * grid_size, np.int32)
+        self.cell_polygon[cells[inside]] = polygons[inside] + 1
+
+        # Boundary cells: points sampled every half cell along each edge, and the 3x3 cells
+        # around them, cover every cell an edge passes through
+        steps = np.ceil(
+            2 * np.maximum(np.abs(x1 - x0) / self.dx, np.abs(y1 - y0) / self.dy)
+        ).astype(np.int64)
+        sample_edge = np.repeat(np.arange(len(all_edges)), steps + 1)
+        t = spread(steps + 1) / np.maximum(steps[sample_edge], 1)
+        column = self.columns(x0[sample_edge] + t * (x1 - x0)[sample_edge])
+        row = self.rows(y0[sample_edge] + t * (y1 - y0)[sample_edge])
+        pair_cell, pair_polygon = [], []
+        for d_row in (-1, 0, 1):
+            for d_column in (-1, 0, 1):
+                neighbour_row, neighbour_column = row + d_row, column + d_column
+                valid = (
+                    (neighbour_row >= 0)
+                    & (neighbour_row < grid_size)
+                    & (neighbour_column >= 0)
+                    & (neighbour_column < grid_size)
+                )
+                pair_cell.append(
+                    neighbour_row[valid] * grid_size + neighbour_column[valid]
+                )
+                pair_polygon.append(edge_polygon[sample_edge][valid])
+        pair_cell = np.concatenate(pair_cell)
+        pair_polygon = np.concatenate(pair_polygon)
+        # The polygon holding the cell center is a candidate as well
+        boundary_cells = np.unique(pair_cell)
+        center_polygon = self.cell_polygon[boundary_cells]
+        has_center = center_polygon > 0
+        pair_cell = np.concatenate([pair_cell, boundary_cells[has_center]])
+        pair_polygon = np.concatenate([pair_polygon, center_polygon[has_center] - 1])
+        pairs = np.unique(pair_cell * self.num_polygons + pair_polygon)
+        # Candidate polygons of each boundary cell, sorted by cell
+        self.pair_cell, self.pair_polygon = np.divmod(pairs, self.num_polygons)
+        self.boundary = np.zeros(grid_size * grid_size, bool)
+        self.boundary[boundary_cells] = True
+
+    @classmethod
+    def from_geojson(cls, path, grid_size=512):
+        """
+        Builds the index of the taxi zones in a GeoJSON FeatureCollection.
+
+        Parameters:
+        - path (str): GeoJSON of Polygon or MultiPolygon features in longitude/latitude, with
+          the zone id in a `LocationID` (or `location_id`) property.
+        - grid_size (int): Cells per side of the grid.
+
+        Returns:
+        - ZoneIndex: The index.
+
+        Raises:
+        - ValueError: If a feature has no zone id or the coordinates are not longitude/latitude.
+        """
+        with open(path) as file:
+            features = json.load(file)["features"]
+
+        zones, edges = [], []
+        for feature in features:
+            properties = {
+                key.lower().replace("_", ""): value
+                for key, value in (feature.get("properties") or {}).items()
+            }
+            if properties.get("locationid") is None:
+                raise ValueError(f"Zone feature without a LocationID in {path}")
+            geometry = feature["geometry"]
+            polygons = geometry["coordinates"]
+            if geometry["type"] == "Polygon":
+                polygons = [polygons]
+            rings = [
+                np.asarray(ring, dtype=np.float64)[:, :2]
+                for p in polygons
+                for ring in p
+            ]
+            zones.append(int(properties["locationid"]))
+            edges.append(
+                np.concatenate(
+                    [
+                        np.hstack([ring[:-1], ring[1:]])
+                        for ring in rings
+                        if len(ring) > 1
+                    ]
+                )
+            )
+
+        vertices = np.concatenate(edges).reshape(-1, 2)
+        if np.abs(vertices[:, 0]).max() > 180 or np.abs(vertices[:, 1]).max() > 90:
+            raise ValueError(f"Zones in {path} are not in longitude/latitude")
+        return cls(zones, edges, grid_size)
+
+    def columns(self, x):
+        """Returns the grid column of each longitude, clipped to the grid."""
+        return np.clip(
+            ((x - self.x_min) / self.dx).astype(np.int64), 0, self.grid_size - 1
+        )
+
+    def rows(self, y):
+        """Returns the grid row of each latitude, clipped to the grid."""
+        return np.clip(
+            ((y - self.y_min) / self.dy).astype(np.int64), 0, self.grid_size - 1
+        )
+
+    def lookup(self, longitude, latitude):
+        """
+        Assigns points to zones.
+
+        Parameters:
+        - longitude (array): Longitudes, NaN for missing points.
+        - latitude (array): Latitudes, NaN for missing points.
+
+        Returns:
+        - ndarray: The zone id of each point, 0 for points outside every zone.
+        """
+        x = np.asarray(longitude, dtype=np.float64)
+        y = np.asarray(latitude, dtype=np.float64)
+        polygon = np.zeros(len(x), np.int64)
+        with np.errstate(invalid="ignore"):
+            valid = np.flatnonzero(
+                (x >= self.x_min)
+                & (x <= self.x_max)
+                & (y >= self.y_min)
+                & (y <= self.y_max)
+            )
+        cell = self.rows(y[valid]) * self.grid_size + self.columns(x[valid])
+        polygon[valid] = self.cell_polygon[cell]
+
+        # Points near a boundary: one (point, candidate polygon) pair per candidate
+        on_boundary = self.boundary[cell]
+        points, cell = valid[on_boundary], cell[on_boundary]
+        polygon[points] = 0
+        first = np.searchsorted(self.pair_cell, cell, "left")
+        counts = np.searchsorted(self.pair_cell, cell, "right") - first
+        pair = np.repeat(first, counts) + spread(counts)
+        pair_point = np.repeat(points, counts)
+        pair_polygon = self.pair_polygon[pair]
+        inside = self.contains(
+            x[pair_point],
+            y[pair_point],
+            np.repeat(cell // self.grid_size, counts),
+            pair_polygon,
+        )
+        polygon[pair_point[inside]] = pair_polygon[inside] + 1
+        return self.zone_ids[polygon]
+
+    def contains(self, x, y, row, polygon):
+        """
+        Tests (point, polygon) pairs with the even-odd rule, against the edges of the polygon
+        in the point's row band only.
+
+        Parameters:
+        - x (ndarray): Longitude of each point.
+        - y (ndarray): Latitude of each point.
+        - row (ndarray): Grid row of each point.
+        - polygon (ndarray): Polygon index each point is tested against.
+
+        Returns:
+        - ndarray: Whether each point is inside its polygon.
+        """
+        band = polygon * self.grid_size + row
+        first = np.searchsorted(self.band_key, band, "left")
+        counts = np.searchsorted(self.band_key, band, "right") - first
+        ends = np.cumsum(counts)
+        inside = np.zeros(len(x), bool)
+        start = 0
+        while start < len(x):
+            done = ends[start - 1] if start else 0
+            stop = max(
+                start + 1, int(np.searchsorted(ends, done + BLOCK_SIZE, "right"))
+            )
+            chunk_counts = counts[start:stop]
+            pair = np.repeat(np.arange(stop - start), chunk_counts)
+            edge = np.repeat(first[start:stop], chunk_counts) + spread(chunk_counts)
+            x0, y0, x1, y1 = self.band_edges[edge].T
+            px, py = x[start:stop][pair], y[start:stop][pair]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing = ((y0 > py) != (y1 > py)) & (
+                    px < x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+                )
+            crossings = np.bincount(pair[crossing], minlength=stop - start)
+            inside[start:stop] = crossings % 2 == 1
+            start = stop
+        return inside
+
+
+def spread(counts):
+    """Returns 0..count-1 for each count, concatenated, e.g. [2, 3] -> [0, 1, 0, 1, 2]."""
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
@@ -1,5 +1,9 @@
+import hashlib
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
-from unittest.mock import Mock, patch, mock_open
+from unittest.mock import MagicMock, Mock, patch, mock_open
 from src.entity import DataIngestionConfig
 import src.components.data_ingestion as di
 
@@ -26,31 +30,283 @@ def test_initialization(data_ingestion, config):
     assert data_ingestion.config == config
 
 
-# Test download_parquet_file
-@patch("requests.get")
-@patch("builtins.open", new_callable=mock_open)
-# These decorators ensure that the actual external calls (HTTP requests and file operations) are not executed during the test.
-def test_download_parquet_file(mock_open, mock_get, data_ingestion):
-    mock_response = Mock()
+def parquet_bytes():
+    buffer = io.BytesIO()
+    pq.write_table(pa.table({"trip_distance": [1.0, 2.0, 3.0]}), buffer)
+    return buffer.getvalue()
+
+
+PARQUET_BYTES = parquet_bytes()
+# Magic bytes at both ends around a footer that does not parse
+CORRUPT_PARQUET_BYTES = b"PAR1" + b"x" * 8 + b"PAR1"
+
+
+def make_response(status_code, body=b"", headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {"Content-Length": str(len(body))}
+    response.iter_content.return_value = [body[:6], body[6:]]
+    response.__enter__.return_value = response
+    return response
 
-    # Test success case
-    mock_response.status_code = 200
-    mock_get.return_value = mock_response
 
-    data_ingestion.download_parquet_file(2018, 2, 1)
-    mock_get.assert_called_with("http://api.example.com/2018-02.parquet")
-    mock_open.assert_called_with("data/2018_02.parquet", "wb")
+# Fixture for a DataIngestion instance writing into a temporary directory
+@pytest.fixture
+def tmp_ingestion(config, tmp_path):
+    return di.DataIngestion(
+        DataIngestionConfig(
+            source_URL=config.source_URL,
+            local_data_name=config.local_data_name,
+            root_dir=str(tmp_path),
+            max_retries=1,
+        )
+    )
+
+
+# Test download_parquet_file
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file(mock_get, mock_sleep, tmp_ingestion, tmp_path):
+    # Test success case
+    mock_get.return_value = make_response(200, PARQUET_BYTES)
 
-    # Reset mocks for failure test
-    mock_open.reset_mock()
-    mock_get.reset_mock()
+    tmp_ingestion.download_parquet_file(2018, 2, 1)
+    mock_get.assert_called_with(
+        "http://api.example.com/2018-02.parquet", headers={}, stream=True, timeout=60
+    )
+    assert (tmp_path / "2018_02.parquet").read_bytes() == PARQUET_BYTES
+    assert not (tmp_path / "2018_02.parquet.part").exists()
 
     # Test failure case
-    mock_response.status_code = 404
-    mock_get.return_value = mock_response
+    mock_get.return_value = make_response(404)
     with pytest.raises(Exception):
-        data_ingestion.download_parquet_file(2018, 2, 1)
-        mock_open.assert_not_called()
+        tmp_ingestion.download_parquet_file(2018, 3, 1)
+    assert not (tmp_path / "2018_03.parquet").exists()
+
+
+# Test that an interrupted download resumes with a Range request guarded by If-Range
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_resume(mock_get, mock_sleep, tmp_ingestion, tmp_path):
+    (tmp_path / "2018_02.parquet.part").write_bytes(PARQUET_BYTES[:10])
+    (tmp_path / "2018_02.parquet.part.validator").write_text('"abc"')
+    mock_get.return_value = make_response(
+        206,
+        PARQUET_BYTES[10:],
+        {"Content-Range": f"bytes 10-{len(PARQUET_BYTES) - 1}/{len(PARQUET_BYTES)}"},
+    )
+
+    tmp_ingestion.download_parquet_file(2018, 2, 1)
+
+    assert mock_get.call_args.kwargs["headers"] == {
+        "Range": "bytes=10-",
+        "If-Range": '"abc"',
+    }
+    assert (tmp_path / "2018_02.parquet").read_bytes() == PARQUET_BYTES
+    assert not (tmp_path / "2018_02.parquet.part.validator").exists()
+
+
+# Test that a partial file of a changed remote file is replaced, not appended to
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_resume_changed(
+    mock_get, mock_sleep, tmp_ingestion, tmp_path
+):
+    (tmp_path / "2018_02.parquet.part").write_bytes(b"stale bytes")
+    (tmp_path / "2018_02.parquet.part.validator").write_text('"old"')
+    mock_get.return_value = make_response(
+        200,
+        PARQUET_BYTES,
+        {"Content-Length": str(len(PARQUET_BYTES)), "ETag": '"new"'},
+    )
+
+    tmp_ingestion.download_parquet_file(2018, 2, 1)
+
+    assert mock_get.call_args.kwargs["headers"]["If-Range"] == '"old"'
+    assert (tmp_path / "2018_02.parquet").read_bytes() == PARQUET_BYTES
+
+
+# Test that a partial file without a validator is downloaded again from the start
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_resume_without_validator(
+    mock_get, mock_sleep, tmp_ingestion, tmp_path
+):
+    (tmp_path / "2018_02.parquet.part").write_bytes(PARQUET_BYTES[:10])
+    mock_get.return_value = make_response(200, PARQUET_BYTES)
+
+    tmp_ingestion.download_parquet_file(2018, 2, 1)
+
+    assert mock_get.call_args.kwargs["headers"] == {}
+    assert (tmp_path / "2018_02.parquet").read_bytes() == PARQUET_BYTES
+
+
+# Test that a truncated transfer never lands under the final name
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_truncated(mock_get, mock_sleep, tmp_ingestion, tmp_path):
+    mock_get.return_value = make_response(
+        200, PARQUET_BYTES[:10], {"Content-Length": str(len(PARQUET_BYTES))}
+    )
+
+    with pytest.raises(Exception):
+        tmp_ingestion.download_parquet_file(2018, 2, 1)
+
+    assert not (tmp_path / "2018_02.parquet").exists()
+    assert (tmp_path / "2018_02.parquet.part").read_bytes() == PARQUET_BYTES[:10]
+
+
+# Test that retries stop at the first successful download
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_stops_on_success(
+    mock_get, mock_sleep, tmp_ingestion, tmp_path
+):
+    mock_get.side_effect = [
+        ConnectionError("reset"),
+        make_response(200, PARQUET_BYTES),
+        make_response(200, PARQUET_BYTES),
+    ]
+
+    tmp_ingestion.download_parquet_file(2018, 2, 5)
+
+    assert mock_get.call_count == 2
+    assert mock_sleep.call_count == 1
+    assert (tmp_path / "2018_02.parquet").read_bytes() == PARQUET_BYTES
+
+
+# Test that Retry-After is honored on 429/503
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_retry_after(mock_get, mock_sleep, tmp_ingestion):
+    mock_get.side_effect = [
+        make_response(429, headers={"Retry-After": "7"}),
+        make_response(503, headers={}),
+        make_response(200, PARQUET_BYTES),
+    ]
+
+    tmp_ingestion.download_parquet_file(2018, 2, 5)
+
+    assert mock_sleep.call_args_list[0].args == (7.0,)
+    assert 0 <= mock_sleep.call_args_list[1].args[0] <= 0.6
+
+
+# Test that a Retry-After delay is capped at max_backoff
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_retry_after_capped(mock_get, mock_sleep, tmp_ingestion):
+    mock_get.side_effect = [
+        make_response(503, headers={"Retry-After": "99999"}),
+        make_response(200, PARQUET_BYTES),
+    ]
+
+    tmp_ingestion.download_parquet_file(2018, 2, 5)
+
+    assert mock_sleep.call_args.args == (tmp_ingestion.config.max_backoff,)
+
+
+# Test that a refused request ends a half-open trial instead of leaving it in flight
+@patch("time.monotonic")
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_refused(
+    mock_get, mock_sleep, mock_monotonic, tmp_ingestion
+):
+    mock_monotonic.return_value = 0
+    breaker = tmp_ingestion.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    mock_monotonic.return_value = breaker.cooldown + 1
+    mock_get.return_value = make_response(403)
+
+    with pytest.raises(Exception):
+        tmp_ingestion.download_parquet_file(2018, 2, 5)
+
+    assert mock_get.call_count == 1
+    assert breaker.allow()
+
+
+# Test that 404 fails fast
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_not_published(mock_get, mock_sleep, tmp_ingestion):
+    mock_get.return_value = make_response(404)
+
+    with pytest.raises(di.MonthNotPublished):
+        tmp_ingestion.download_parquet_file(2018, 2, 5)
+
+    assert mock_get.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+# Test CircuitBreaker
+@patch("time.monotonic")
+def test_circuit_breaker(mock_monotonic):
+    mock_monotonic.return_value = 0
+    breaker = di.CircuitBreaker(failure_threshold=2, cooldown=10)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    # Half-open after the cooldown: exactly one trial request goes through
+    mock_monotonic.return_value = 11
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+# Test that a downloaded month is recorded in the manifest and revalidated conditionally
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_manifest(mock_get, mock_sleep, tmp_ingestion, tmp_path):
+    headers = {
+        "Content-Length": str(len(PARQUET_BYTES)),
+        "ETag": '"abc"',
+        "Last-Modified": "Wed, 01 May 2024 00:00:00 GMT",
+    }
+    mock_get.return_value = make_response(200, PARQUET_BYTES, headers)
+    assert tmp_ingestion.download_parquet_file(2018, 2, 1) == "downloaded"
+
+    entry = di.DataIngestion(tmp_ingestion.config).manifest["2018-02"]
+    assert entry["etag"] == '"abc"'
+    assert entry["size"] == len(PARQUET_BYTES)
+    assert entry["sha256"] == hashlib.sha256(PARQUET_BYTES).hexdigest()
+
+    # Unchanged month: one conditional request answered with 304
+    mock_get.return_value = make_response(304)
+    assert tmp_ingestion.download_parquet_file(2018, 2, 1) == "not_modified"
+    assert mock_get.call_args.kwargs["headers"] == {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Wed, 01 May 2024 00:00:00 GMT",
+    }
+
+    # Revised month: the file is replaced and reported as revised
+    buffer = io.BytesIO()
+    pq.write_table(pa.table({"trip_distance": [4.0]}), buffer)
+    revised = buffer.getvalue()
+    mock_get.return_value = make_response(200, revised, {"ETag": '"def"'})
+    assert tmp_ingestion.download_parquet_file(2018, 2, 1) == "revised"
+    assert (tmp_path / "2018_02.parquet").read_bytes() == revised
+    assert tmp_ingestion.manifest["2018-02"]["etag"] == '"def"'
+
+
+# Test is_valid_parquet
+def test_is_valid_parquet(data_ingestion, tmp_path):
+    complete = tmp_path / "complete.parquet"
+    complete.write_bytes(PARQUET_BYTES)
+    truncated = tmp_path / "truncated.parquet"
+    truncated.write_bytes(PARQUET_BYTES[:-2])
+
+    assert data_ingestion.is_valid_parquet(str(complete))
+    assert data_ingestion.is_valid_parquet(str(complete), len(PARQUET_BYTES))
+    assert not data_ingestion.is_valid_parquet(str(complete), 100)
+    assert not data_ingestion.is_valid_parquet(str(truncated))
+    corrupt = tmp_path / "corrupt.parquet"
+    corrupt.write_bytes(CORRUPT_PARQUET_BYTES)
+    assert not data_ingestion.is_valid_parquet(str(corrupt))
 
 
 # Test extract_date
@@ -61,8 +317,121 @@ def test_extract_date(data_ingestion):
 
 # Test download_missing_parquet_files
 @patch("src.components.data_ingestion.DataIngestion.download_parquet_file")
-@patch("os.listdir")
-def test_download_missing_parquet_files(mock_listdir, mock_download, data_ingestion):
-    mock_listdir.return_value = ["example_data_2007-01.parquet"]
-    data_ingestion.download_missing_parquet_files()
-    assert mock_download.call_count == 180
+def test_download_missing_parquet_files(mock_download, tmp_ingestion, tmp_path):
+    (tmp_path / "2009_01.parquet").write_bytes(PARQUET_BYTES)
+    (tmp_path / "2009_02.parquet").write_bytes(CORRUPT_PARQUET_BYTES)
+    (tmp_path / "2009_03.parquet.part").write_bytes(PARQUET_BYTES[:10])
+    full_dates = [(2009, month) for month in range(1, 4)]
+    mock_download.return_value = "downloaded"
+
+    with patch.object(tmp_ingestion, "get_full_dates", return_value=full_dates):
+        summary = tmp_ingestion.download_missing_parquet_files()
+
+        # The unreadable and partial months are fetched, from the footers read once
+        assert list(summary) == ["2009-02", "2009-03"]
+        assert summary["2009-02"] == {"status": "downloaded"}
+        with patch("src.utils.parquet_catalog.read_footer") as read_footer:
+            tmp_ingestion.download_missing_parquet_files()
+        read_footer.assert_not_called()
+    assert mock_download.call_count == 4
+
+
+# Test concurrent download_missing_parquet_files
+@patch("src.components.data_ingestion.DataIngestion.download_parquet_file")
+def test_download_missing_parquet_files_concurrent(mock_download, config, tmp_path):
+    config = DataIngestionConfig(
+        source_URL=config.source_URL,
+        local_data_name=config.local_data_name,
+        root_dir=str(tmp_path),
+        max_retries=1,
+        max_workers=4,
+    )
+    data_ingestion = di.DataIngestion(config)
+    (tmp_path / "2009_01.parquet").write_bytes(PARQUET_BYTES)
+
+    def fake_download(year, month, max_retries):
+        if (year, month) == (2009, 2):
+            raise Exception("boom")
+        return "downloaded"
+
+    mock_download.side_effect = fake_download
+
+    summary = data_ingestion.download_missing_parquet_files()
+
+    assert "2009-01" not in summary
+    assert summary["2009-02"] == {"status": "failed", "error": "boom"}
+    assert summary["2009-03"] == {"status": "downloaded"}
+    assert list(summary) == sorted(summary)
+
+
+# Test that download_month hands landed months to the callback
+@patch("src.components.data_ingestion.DataIngestion.download_parquet_file")
+def test_download_month_callback(mock_download, data_ingestion):
+    landed = []
+
+    mock_download.return_value = "downloaded"
+    assert data_ingestion.download_month((2018, 2), landed.append) == {
+        "status": "downloaded"
+    }
+    mock_download.return_value = "not_modified"
+    data_ingestion.download_month((2018, 3), landed.append)
+
+    assert landed == ["2018_02.parquet"]
+
+
+# Test host_slot
+def test_host_slot(data_ingestion):
+    slot = data_ingestion.host_slot("http://api.example.com/2018-02.parquet")
+    assert slot is data_ingestion.host_slot("http://api.example.com/2018-03.parquet")
+    assert slot is not data_ingestion.host_slot("http://other.example.com/x")
+
+
+# Test the footer catalog of the downloaded months
+def test_update_catalog(tmp_ingestion, tmp_path):
+    import os
+    from src.utils import parquet_catalog
+
+    for month in (1, 2):
+        pq.write_table(
+            pa.table({"trip_distance": [1.0, 2.0, float(month)]}),
+            tmp_path / f"2009_{month:02d}.parquet",
+        )
+    (tmp_path / "2009_03.parquet").write_bytes(CORRUPT_PARQUET_BYTES)
+    full_dates = [(2009, month) for month in range(1, 5)]
+
+    with patch.object(tmp_ingestion, "get_full_dates", return_value=full_dates):
+        assert tmp_ingestion.update_catalog() == ["2009-03", "2009-04"]
+        catalog = di.ParquetCatalog(str(tmp_path / "catalog.json"))
+        assert catalog.entries["2009_02.parquet"]["num_rows"] == 3
+        assert catalog.entries["2009_02.parquet"]["row_groups"][0]["statistics"] == {
+            "trip_distance": [1.0, 2.0]
+        }
+        assert "error" in catalog.entries["2009_03.parquet"]
+
+        # Only new or changed files are read again
+        pq.write_table(pa.table({"trip_distance": [1.0]}), tmp_path / "2009_04.parquet")
+        os.utime(tmp_path / "2009_01.parquet", ns=(0, 0))
+        with patch(
+            "src.utils.parquet_catalog.read_footer",
+            wraps=parquet_catalog.read_footer,
+        ) as read_footer:
+            assert tmp_ingestion.update_catalog() == ["2009-03"]
+        assert sorted(call.args[0] for call in read_footer.call_args_list) == [
+            str(tmp_path / "2009_01.parquet"),
+            str(tmp_path / "2009_04.parquet"),
+        ]
+
+
+# Test that a truncated local copy is fetched again instead of revalidated
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_download_parquet_file_invalid_local(
+    mock_get, mock_sleep, tmp_ingestion, tmp_path
+):
+    (tmp_path / "2019_03.parquet").write_bytes(PARQUET_BYTES[:20])
+    mock_get.return_value = make_response(200, PARQUET_BYTES)
+
+    assert tmp_ingestion.download_parquet_file(2019, 3, 1) == "downloaded"
+
+    assert mock_get.call_args.kwargs["headers"] == {}
+    assert (tmp_path / "2019_03.parquet").read_bytes() == PARQUET_BYTES
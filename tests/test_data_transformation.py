@@ -1,8 +1,14 @@
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 from src.entity import DataTransformationConfig
 import src.components.data_transformation as dt
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import dataclasses
+import os
+import yaml
 
 
 # Fixture for DataIngestionConfig
@@ -16,6 +22,7 @@ def config():
         shortest_trip_distance=1,
         shortest_trip_duration=300,
         least_cost=10,
+        extra_columns=("passenger_count", "vendor"),
     )
 
 
@@ -37,6 +44,57 @@ def test_find_column_name(data_transformation):
     assert data_transformation.find_column_name(columns, "dropoff") == "dropoff_date"
 
 
+# Test resolve_columns
+def test_resolve_columns(data_transformation):
+    # 2009 era
+    assert data_transformation.resolve_columns(
+        [
+            "vendor_name",
+            "Trip_Pickup_DateTime",
+            "Trip_Dropoff_DateTime",
+            "Passenger_Count",
+            "Trip_Distance",
+            "Start_Lon",
+            "Total_Amt",
+        ]
+    ) == {
+        "Trip_Pickup_DateTime": "pickup_datetime",
+        "Trip_Dropoff_DateTime": "dropoff_datetime",
+        "Total_Amt": "total_amount",
+        "Trip_Distance": "trip_distance",
+        "Passenger_Count": "passenger_count",
+        "vendor_name": "vendor",
+    }
+    # 2011+ era
+    assert data_transformation.resolve_columns(
+        [
+            "VendorID",
+            "tpep_pickup_datetime",
+            "tpep_dropoff_datetime",
+            "trip_distance",
+            "PULocationID",
+            "total_amount",
+        ]
+    ) == {
+        "tpep_pickup_datetime": "pickup_datetime",
+        "tpep_dropoff_datetime": "dropoff_datetime",
+        "total_amount": "total_amount",
+        "trip_distance": "trip_distance",
+        "VendorID": "vendor",
+    }
+    # Era unknown to the schema registry, found by keyword
+    assert data_transformation.resolve_columns(
+        ["lpep_pickup_ts", "lpep_dropoff_ts", "trip_distance", "total_amount"]
+    ) == {
+        "lpep_pickup_ts": "pickup_datetime",
+        "lpep_dropoff_ts": "dropoff_datetime",
+        "total_amount": "total_amount",
+        "trip_distance": "trip_distance",
+    }
+    with pytest.raises(ValueError):
+        data_transformation.resolve_columns(["trip_distance", "total_amount"])
+
+
 # Test calculate_trip_duration_and_speed
 def test_calculate_trip_duration_and_speed(data_transformation):
     df = pd.DataFrame(
@@ -53,16 +111,46 @@ def test_calculate_trip_duration_and_speed(data_transformation):
     assert result.loc[1, "speed"] == 9
 
 
+# Test normalize_datetimes
+def test_normalize_datetimes(data_transformation):
+    table = pa.table(
+        {
+            "pickup_datetime": ["2009-01-04 02:52:00", "not a date"],
+            "dropoff_datetime": pa.array(
+                [pd.Timestamp("2009-01-04 03:02:00")] * 2, pa.timestamp("ns")
+            ),
+        }
+    )
+    table = data_transformation.normalize_datetimes(table)
+
+    assert table.schema.field("pickup_datetime").type == pa.timestamp("us")
+    assert table.schema.field("dropoff_datetime").type == pa.timestamp("us")
+    assert table["pickup_datetime"].to_pylist() == [
+        pd.Timestamp("2009-01-04 02:52:00"),
+        None,
+    ]
+
+
 # Test test_data_cleaning
-@patch("pandas.DataFrame.to_parquet")
-@patch("os.listdir")
+@patch("src.components.data_transformation.DataTransformation.write_sketches")
+@patch("src.components.data_transformation.DataTransformation.save_cache_index")
+@patch("src.components.data_transformation.DataTransformation.save_dtype_report")
+@patch("os.makedirs")
+@patch("os.replace")
+@patch("pyarrow.parquet.write_table")
 @patch("os.path.exists")
 @patch("pyarrow.parquet.read_table")
+@patch("pyarrow.parquet.read_schema")
 def test_data_cleaning(
+    mock_read_schema,
     mock_read_table,
     mock_exists,
-    mock_listdir,
-    mock_to_parquet,
+    mock_write_table,
+    mock_replace,
+    mock_makedirs,
+    mock_save_dtype_report,
+    mock_save_cache_index,
+    mock_write_sketches,
     data_transformation,
     monkeypatch,
 ):
@@ -75,19 +163,36 @@ def test_data_cleaning(
             "dropoff_datetime": [
                 "2010-02-02 10:30:00",
             ],
-            "total_amount": [15],
-            "trip_distance": [10],
+            "total_amount": [15.0],
+            "trip_distance": [10.0],
         }
     )
 
-    # Create a mock PyArrow Table or similar object
-    mock_table = Mock()
-    mock_table.to_pandas.return_value = df_mock
-
     # Set up the other mocks
-    mock_listdir.return_value = ["yellow_tripdata_2010-02.parquet"]
+    list_raw_files = Mock(return_value=["yellow_tripdata_2010-02.parquet"])
+    monkeypatch.setattr(dt.DataTransformation, "list_raw_files", list_raw_files)
+    raw_entry = Mock(
+        return_value={
+            "columns": {
+                "pickup_datetime": "string",
+                "dropoff_datetime": "string",
+                "total_amount": "double",
+                "trip_distance": "double",
+            }
+        }
+    )
+    monkeypatch.setattr(dt.DataTransformation, "raw_entry", raw_entry)
+    monkeypatch.setattr(dt.DataTransformation, "cache_key", Mock(return_value="key"))
     mock_exists.return_value = False
-    mock_read_table.return_value = mock_table
+    mock_read_table.return_value = pa.Table.from_pandas(df_mock)
+    mock_read_schema.return_value = pa.schema(
+        [
+            ("pickup_datetime", pa.string()),
+            ("dropoff_datetime", pa.string()),
+            ("total_amount", pa.float64()),
+            ("trip_distance", pa.float64()),
+        ]
+    )
 
     # Mock logger to avoid side effects
     monkeypatch.setattr("src.utils.logger.logger", Mock())
@@ -96,9 +201,690 @@ def test_data_cleaning(
     data_transformation.data_cleaning()
 
     # Assertions
-    mock_listdir.assert_called_once_with(data_transformation.config.data_path)
+    list_raw_files.assert_called_once_with()
+    raw_entry.assert_called_once_with("yellow_tripdata_2010-02.parquet")
     mock_exists.assert_any_call("data/pruned-yellow_tripdata_2010-02.parquet")
-    mock_read_table.assert_called_once_with("data/yellow_tripdata_2010-02.parquet")
-    mock_to_parquet.assert_called_once_with(
-        "data/pruned-yellow_tripdata_2010-02.parquet", index=False
+    mock_read_schema.assert_called_once_with("data/yellow_tripdata_2010-02.parquet")
+    mock_read_table.assert_called_once_with(
+        "data/yellow_tripdata_2010-02.parquet",
+        columns=[
+            "pickup_datetime",
+            "dropoff_datetime",
+            "total_amount",
+            "trip_distance",
+        ],
+        filters=ANY,
+    )
+    mock_write_table.assert_any_call(
+        ANY,
+        "data/.pruned-yellow_tripdata_2010-02.parquet.tmp",
+        row_group_size=1048576,
+        compression="snappy",
+        compression_level=None,
+    )
+    mock_replace.assert_any_call(
+        "data/.pruned-yellow_tripdata_2010-02.parquet.tmp",
+        "data/pruned-yellow_tripdata_2010-02.parquet",
+    )
+    mock_replace.assert_any_call(
+        "data/sidecars/.2010-02.parquet.tmp", "data/sidecars/2010-02.parquet"
+    )
+    mock_save_dtype_report.assert_called_once()
+    mock_save_cache_index.assert_called_once()
+    mock_write_sketches.assert_called_once_with(
+        ANY, "2010-02-01", "2010-03-01", "data/sketches/2010-02.npz"
+    )
+
+
+def write_raw_month(path, rows=3000, string_timestamps=False):
+    """Write a small raw month with some rows outside the month and thresholds."""
+    rng = np.random.default_rng(0)
+    pickup = pd.Timestamp("2019-03-01") + pd.to_timedelta(
+        rng.integers(-86400, 32 * 86400, rows), unit="s"
+    )
+    df = pd.DataFrame(
+        {
+            "VendorID": rng.integers(1, 3, rows),
+            "tpep_pickup_datetime": pickup,
+            "tpep_dropoff_datetime": pickup
+            + pd.to_timedelta(rng.integers(0, 3600, rows), unit="s"),
+            "passenger_count": rng.integers(1, 5, rows).astype(float),
+            "trip_distance": rng.uniform(0, 20, rows),
+            "total_amount": rng.uniform(-5, 80, rows),
+        }
+    )
+    df.loc[::97, "total_amount"] = np.nan
+    if string_timestamps:
+        # 2009 era: string timestamps and different column names
+        df = df.rename(
+            columns={
+                "VendorID": "vendor_name",
+                "tpep_pickup_datetime": "Trip_Pickup_DateTime",
+                "tpep_dropoff_datetime": "Trip_Dropoff_DateTime",
+                "total_amount": "Total_Amt",
+            }
+        )
+        for column in ("Trip_Pickup_DateTime", "Trip_Dropoff_DateTime"):
+            df[column] = df[column].dt.strftime("%Y-%m-%d %H:%M:%S")
+    df.to_parquet(path, index=False, row_group_size=1000)
+
+
+# Test that streaming mode matches the whole-table mode
+def test_clean_file_streaming(config, tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+
+    results = {}
+    for mode in ("table", "streaming"):
+        out_dir = tmp_path / mode
+        out_dir.mkdir()
+        mode_config = dataclasses.replace(
+            config,
+            data_path=str(raw_dir),
+            root_dir=str(out_dir),
+            mode=mode,
+            memory_budget_mb=0,
+        )
+        output = dt.DataTransformation(mode_config).clean_file(
+            "yellow_tripdata_2019-03.parquet"
+        )
+        results[mode] = pd.read_parquet(output)
+
+    assert len(results["table"]) > 0
+    pd.testing.assert_frame_equal(results["table"], results["streaming"])
+    assert not list((tmp_path / "streaming").glob("*.tmp"))
+
+
+# Test the Hive-partitioned layout with the configured codec and row groups
+@pytest.mark.parametrize("mode", ["table", "streaming"])
+def test_clean_file_partitioned(config, tmp_path, mode):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    out_dir = tmp_path / "out"
+
+    partitioned_config = dataclasses.replace(
+        config,
+        data_path=str(raw_dir),
+        root_dir=str(out_dir),
+        mode=mode,
+        output_layout="partitioned",
+        row_group_size=500,
+        compression="zstd",
+        compression_level=5,
+    )
+    output = dt.DataTransformation(partitioned_config).clean_file(
+        "yellow_tripdata_2019-03.parquet"
     )
+
+    assert output == str(
+        out_dir / "dataset" / "year=2019" / "month=03" / "part-0.parquet"
+    )
+    metadata = pq.ParquetFile(output).metadata
+    assert metadata.num_rows > 500
+    assert all(
+        metadata.row_group(i).num_rows <= 500 for i in range(metadata.num_row_groups)
+    )
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+
+    table = pq.read_table(out_dir / "dataset", partitioning="hive")
+    assert set(table["year"].to_pylist()) == {2019}
+    assert set(table["month"].to_pylist()) == {3}
+    pickup = table["pickup_datetime"].to_pandas()
+    if mode == "table":
+        assert pickup.is_monotonic_increasing
+    assert not list(out_dir.rglob("*.tmp"))
+
+
+# Test that switching the output layout removes the month's previous output
+def test_data_cleaning_layout_switch(config, tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    flat_config = dataclasses.replace(
+        config, data_path=str(raw_dir), root_dir=str(out_dir)
+    )
+    partitioned_config = dataclasses.replace(flat_config, output_layout="partitioned")
+    flat = out_dir / "pruned-yellow_tripdata_2019-03.parquet"
+    partition = out_dir / "dataset" / "year=2019" / "month=03"
+
+    dt.DataTransformation(flat_config).data_cleaning()
+    assert flat.exists()
+
+    dt.DataTransformation(partitioned_config).data_cleaning()
+    assert not flat.exists()
+    assert (partition / "part-0.parquet").exists()
+
+    dt.DataTransformation(flat_config).data_cleaning()
+    assert flat.exists()
+    assert not (out_dir / "dataset").exists()
+
+
+# Test process-pool cleaning with one bad month
+def test_data_cleaning_parallel(config, tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    (raw_dir / "yellow_tripdata_2019-04.parquet").write_bytes(b"not parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    parallel_config = dataclasses.replace(
+        config, data_path=str(raw_dir), root_dir=str(out_dir), max_workers=2
+    )
+    reports = dt.DataTransformation(parallel_config).data_cleaning()
+
+    reports = {report["file"]: report for report in reports}
+    assert reports["yellow_tripdata_2019-03.parquet"]["status"] == "cleaned"
+    assert reports["yellow_tripdata_2019-04.parquet"]["status"] == "failed"
+    assert "error" in reports["yellow_tripdata_2019-04.parquet"]
+    assert (out_dir / "pruned-yellow_tripdata_2019-03.parquet").exists()
+
+
+# Test that a failing month still records the months cleaned before it
+def test_data_cleaning_failure_keeps_cache(config, tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    (raw_dir / "yellow_tripdata_2019-04.parquet").write_bytes(b"not parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: sorted(listdir(path)))
+
+    sequential_config = dataclasses.replace(
+        config, data_path=str(raw_dir), root_dir=str(out_dir)
+    )
+    with pytest.raises(dt.CustomException):
+        dt.DataTransformation(sequential_config).data_cleaning()
+
+    index = yaml.safe_load((out_dir / "cache_index.yaml").read_text())
+    assert list(index) == ["yellow_tripdata_2019-03.parquet"]
+    dtype_report = yaml.safe_load((out_dir / "dtype_report.yaml").read_text())
+    assert list(dtype_report) == ["yellow_tripdata_2019-03.parquet"]
+
+
+# Test that the arrow engine produces the same output as the pandas engine
+@pytest.mark.parametrize("string_timestamps", [False, True])
+@pytest.mark.parametrize("mode", ["table", "streaming"])
+def test_clean_file_arrow_engine(config, tmp_path, mode, string_timestamps):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(
+        raw_dir / "yellow_tripdata_2019-03.parquet", string_timestamps=string_timestamps
+    )
+
+    results = {}
+    for engine in ("pandas", "arrow"):
+        out_dir = tmp_path / engine
+        out_dir.mkdir()
+        engine_config = dataclasses.replace(
+            config,
+            data_path=str(raw_dir),
+            root_dir=str(out_dir),
+            mode=mode,
+            memory_budget_mb=0,
+            engine=engine,
+        )
+        output = dt.DataTransformation(engine_config).clean_file(
+            "yellow_tripdata_2019-03.parquet"
+        )
+        results[engine] = pd.read_parquet(output)
+
+    assert len(results["pandas"]) > 0
+    pd.testing.assert_frame_equal(results["pandas"], results["arrow"])
+
+
+# Test that the month window and thresholds are pushed down into the read
+def test_pushdown_filter(data_transformation, tmp_path):
+    path = tmp_path / "yellow_tripdata_2019-03.parquet"
+    write_raw_month(path)
+    schema = pq.read_schema(path)
+    columns = data_transformation.resolve_columns(schema.names)
+
+    filters = data_transformation.pushdown_filter(
+        schema, columns, "2019-03-01", "2019-04-01"
+    )
+    df = pq.read_table(path, filters=filters).to_pandas()
+
+    assert len(df) > 0
+    assert df["tpep_pickup_datetime"].min() >= pd.Timestamp("2019-03-01")
+    assert df["tpep_pickup_datetime"].max() < pd.Timestamp("2019-04-01")
+    assert (df["trip_distance"] > 1).all()
+    assert (df["total_amount"] > 10).all()
+
+
+# Test cast_to_canonical
+def test_cast_to_canonical(config):
+    plan_config = dataclasses.replace(
+        config,
+        extra_columns=("passenger_count", "payment_type", "pulocationid"),
+        dtype_plan={"passenger_count": "int8"},
+    )
+    data_transformation = dt.DataTransformation(plan_config)
+    table = pa.table(
+        {
+            "trip_distance": [1.5, 2.5],
+            "payment_type": [1.0, None],
+            "total_amount": [10.0, 12.0],
+            "passenger_count": [1.0, 5.0],
+        }
+    )
+
+    canonical = data_transformation.cast_to_canonical(table)
+
+    assert canonical.schema == data_transformation.output_schema
+    assert canonical.column_names[:3] == [
+        "pickup_datetime",
+        "dropoff_datetime",
+        "passenger_count",
+    ]
+    assert canonical.schema.field("trip_distance").type == pa.float32()
+    assert canonical.schema.field("passenger_count").type == pa.int8()
+    assert canonical["payment_type"].to_pylist() == ["1", None]
+    # This era has no location IDs
+    assert canonical["pulocationid"].null_count == 2
+
+    # 500 does not fit in int8
+    with pytest.raises(ValueError):
+        data_transformation.cast_to_canonical(
+            table.set_column(3, "passenger_count", pa.array([1.0, 500.0]))
+        )
+    with pytest.raises(ValueError):
+        dt.DataTransformation(dataclasses.replace(config, extra_columns=("tip",)))
+
+
+# Test that months of different eras share one schema and concatenate
+def test_clean_file_eras_share_schema(config, tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    write_raw_month(raw_dir / "yellow_tripdata_2009-03.parquet", string_timestamps=True)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    data_transformation = dt.DataTransformation(
+        dataclasses.replace(
+            config,
+            data_path=str(raw_dir),
+            root_dir=str(out_dir),
+            extra_columns=("passenger_count", "vendor", "pulocationid"),
+        )
+    )
+    tables = [
+        pq.read_table(data_transformation.clean_file(filename))
+        for filename in (
+            "yellow_tripdata_2019-03.parquet",
+            "yellow_tripdata_2009-03.parquet",
+        )
+    ]
+
+    assert tables[0].schema == tables[1].schema == data_transformation.output_schema
+    assert tables[1]["pulocationid"].null_count == tables[1].num_rows
+    assert pa.concat_tables(tables).num_rows == sum(t.num_rows for t in tables)
+
+
+# Test that data_cleaning writes the planned types and reports the bytes saved
+def test_data_cleaning_dtype_report(config, tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    plan_config = dataclasses.replace(
+        config,
+        data_path=str(raw_dir),
+        root_dir=str(out_dir),
+        extra_columns=("passenger_count", "vendor"),
+        dtype_plan={
+            "trip_distance": "float32",
+            "total_amount": "float32",
+            "passenger_count": "int8",
+            "vendor": "dictionary",
+        },
+    )
+
+    reports = dt.DataTransformation(plan_config).data_cleaning()
+
+    schema = pq.read_schema(out_dir / "pruned-yellow_tripdata_2019-03.parquet")
+    assert schema.field("trip_distance").type == pa.float32()
+    assert schema.field("passenger_count").type == pa.int8()
+    assert pa.types.is_dictionary(schema.field("vendor").type)
+    assert schema.field("date").type == pa.date32()
+    assert reports[0]["bytes_saved"] > 0
+
+    dtype_report = yaml.safe_load((out_dir / "dtype_report.yaml").read_text())
+    assert dtype_report["yellow_tripdata_2019-03.parquet"] == {
+        key: reports[0][key] for key in ("bytes_before", "bytes_after", "bytes_saved")
+    }
+
+
+# Test that only months whose input, thresholds or code version changed are rebuilt
+def test_data_cleaning_cache(config, tmp_path, monkeypatch):
+    from src.utils import parquet_catalog
+
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for month in ("03", "04"):
+        write_raw_month(raw_dir / f"yellow_tripdata_2019-{month}.parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    cache_config = dataclasses.replace(
+        config, data_path=str(raw_dir), root_dir=str(out_dir)
+    )
+
+    def statuses(run_config):
+        reports = dt.DataTransformation(run_config).data_cleaning()
+        return {report["file"][-15:-8]: report["status"] for report in reports}
+
+    assert statuses(cache_config) == {"2019-03": "cleaned", "2019-04": "cleaned"}
+
+    # Skipped months are planned from the raw catalog, without opening their files
+    with patch("src.utils.parquet_catalog.read_footer") as read_footer, patch(
+        "pyarrow.parquet.read_schema"
+    ) as read_schema:
+        assert statuses(cache_config) == {"2019-03": "skipped", "2019-04": "skipped"}
+    read_footer.assert_not_called()
+    read_schema.assert_not_called()
+
+    # Settings that do not change the output keep the cache
+    assert statuses(dataclasses.replace(cache_config, engine="arrow")) == {
+        "2019-03": "skipped",
+        "2019-04": "skipped",
+    }
+
+    # A revised download rebuilds its month only
+    write_raw_month(raw_dir / "yellow_tripdata_2019-04.parquet", rows=2000)
+    with patch(
+        "src.utils.parquet_catalog.read_footer", wraps=parquet_catalog.read_footer
+    ) as read_footer:
+        assert statuses(cache_config) == {"2019-03": "skipped", "2019-04": "cleaned"}
+    assert [call.args[0] for call in read_footer.call_args_list] == [
+        str(raw_dir / "yellow_tripdata_2019-04.parquet")
+    ]
+
+    # A changed threshold or code version rebuilds everything
+    assert statuses(dataclasses.replace(cache_config, least_cost=12)) == {
+        "2019-03": "cleaned",
+        "2019-04": "cleaned",
+    }
+    monkeypatch.setattr(dt, "CODE_VERSION", dt.CODE_VERSION + 1)
+    assert statuses(dataclasses.replace(cache_config, least_cost=12)) == {
+        "2019-03": "cleaned",
+        "2019-04": "cleaned",
+    }
+
+    index = yaml.safe_load((out_dir / "cache_index.yaml").read_text())
+    assert index["yellow_tripdata_2019-03.parquet"]["output"] == str(
+        out_dir / "pruned-yellow_tripdata_2019-03.parquet"
+    )
+
+
+# Test that the daily sidecar matches the pruned month in both modes
+@pytest.mark.parametrize("mode", ["table", "streaming"])
+def test_clean_file_sidecar(config, tmp_path, mode):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    sidecar_config = dataclasses.replace(
+        config,
+        data_path=str(raw_dir),
+        root_dir=str(out_dir),
+        mode=mode,
+        memory_budget_mb=0,
+    )
+
+    output = dt.DataTransformation(sidecar_config).clean_file(
+        "yellow_tripdata_2019-03.parquet"
+    )
+
+    df = pd.read_parquet(output)
+    df["trip_distance"] = df["trip_distance"].astype("float64")
+    expected = df.groupby("date").agg(
+        count=("trip_duration", "size"),
+        trip_duration_sum=("trip_duration", "sum"),
+        trip_distance_sum=("trip_distance", "sum"),
+    )
+    expected["trip_duration_sumsq"] = (
+        (df["trip_duration"] ** 2).groupby(df["date"]).sum()
+    )
+    sidecar = pd.read_parquet(out_dir / "sidecars" / "2019-03.parquet").set_index(
+        "date"
+    )
+
+    assert sidecar.index.is_monotonic_increasing
+    assert sidecar["count"].sum() == len(df)
+    pd.testing.assert_frame_equal(
+        sidecar[expected.columns], expected, check_index_type=False, check_names=False
+    )
+
+
+# Test that the daily sketches of both modes match the pruned month
+@pytest.mark.parametrize("mode", ["table", "streaming"])
+def test_clean_file_sketches(config, tmp_path, mode):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    data_transformation = dt.DataTransformation(
+        dataclasses.replace(
+            config,
+            data_path=str(raw_dir),
+            root_dir=str(out_dir),
+            mode=mode,
+            memory_budget_mb=0,
+        )
+    )
+
+    df = pd.read_parquet(
+        data_transformation.clean_file("yellow_tripdata_2019-03.parquet")
+    )
+    sketches = np.load(out_dir / "sketches" / "2019-03.npz")
+
+    assert len(sketches["dates"]) == 31
+    assert sketches["trip_duration"].shape == (
+        31,
+        data_transformation.sketch.num_buckets,
+    )
+    assert sketches["total_amount"].sum() == len(df)
+    first_day = sketches["trip_duration"][0]
+    assert first_day.sum() == (df["date"] == sketches["dates"][0]).sum()
+    median = data_transformation.sketch.quantiles(
+        sketches["trip_duration"].sum(axis=0), [0.5]
+    )[0]
+    assert median == pytest.approx(df["trip_duration"].median(), rel=0.02)
+
+
+def square(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+# Test that 2009-2010 coordinates are assigned to the zones of the zone file
+@pytest.mark.parametrize("mode,engine", [("table", "pandas"), ("streaming", "arrow")])
+def test_clean_file_assigns_zones(config, tmp_path, mode, engine):
+    import json
+
+    zone_file = tmp_path / "zones.geojson"
+    features = [
+        # A square with a hole, the hole is zone 2
+        (1, "Polygon", [square(0, 0, 2, 2), square(0.5, 0.5, 1.5, 1.5)]),
+        (2, "Polygon", [square(0.5, 0.5, 1.5, 1.5)]),
+        (3, "MultiPolygon", [[square(2, 0, 3, 1)], [square(2, 1.5, 3, 2)]]),
+    ]
+    zone_file.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "properties": {"location_id": str(zone)},
+                        "geometry": {"type": kind, "coordinates": coordinates},
+                    }
+                    for zone, kind, coordinates in features
+                ],
+            }
+        )
+    )
+
+    def expected_zone(x, y):
+        zone = np.zeros(len(x), int)
+        zone[(x > 0) & (x < 2) & (y > 0) & (y < 2)] = 1
+        zone[(x > 0.5) & (x < 1.5) & (y > 0.5) & (y < 1.5)] = 2
+        zone[(x > 2) & (x < 3) & (((y > 0) & (y < 1)) | ((y > 1.5) & (y < 2)))] = 3
+        return zone
+
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    raw_path = raw_dir / "yellow_tripdata_2019-03.parquet"
+    write_raw_month(raw_path, string_timestamps=True)
+    rng = np.random.default_rng(1)
+    raw = pd.read_parquet(raw_path)
+    for column, (low, high) in {
+        "Start_Lon": (-0.5, 3.5),
+        "Start_Lat": (-0.5, 2.5),
+        "End_Lon": (-0.5, 3.5),
+        "End_Lat": (-0.5, 2.5),
+    }.items():
+        raw[column] = rng.uniform(low, high, len(raw))
+    raw.loc[::50, "Start_Lon"] = np.nan
+    raw.to_parquet(raw_path, index=False)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    zone_config = dataclasses.replace(
+        config,
+        data_path=str(raw_dir),
+        root_dir=str(out_dir),
+        mode=mode,
+        engine=engine,
+        memory_budget_mb=0,
+        extra_columns=("pulocationid", "dolocationid"),
+        zone_file=str(zone_file),
+        zone_grid_size=16,
+    )
+    data_transformation = dt.DataTransformation(zone_config)
+
+    df = pd.read_parquet(
+        data_transformation.clean_file("yellow_tripdata_2019-03.parquet")
+    )
+    # The distances are unique and identify the trips that were kept
+    kept = raw.set_index(raw["trip_distance"].astype(np.float32)).loc[
+        df["trip_distance"]
+    ]
+
+    pickup = expected_zone(kept["Start_Lon"].values, kept["Start_Lat"].values)
+    dropoff = expected_zone(kept["End_Lon"].values, kept["End_Lat"].values)
+    np.testing.assert_array_equal(df["pulocationid"].fillna(0).values, pickup)
+    np.testing.assert_array_equal(df["dolocationid"].fillna(0).values, dropoff)
+    assert set(dropoff) == {0, 1, 2, 3}
+
+    # Without the zone file the zones stay null
+    data_transformation = dt.DataTransformation(
+        dataclasses.replace(zone_config, zone_file=str(tmp_path / "missing.geojson"))
+    )
+    assert data_transformation.zone_index is None
+
+
+# Test the footer catalog of the pruned outputs
+def test_update_catalog(config, tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_raw_month(raw_dir / "yellow_tripdata_2019-03.parquet")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    data_transformation = dt.DataTransformation(
+        dataclasses.replace(
+            config,
+            data_path=str(raw_dir),
+            root_dir=str(out_dir),
+            output_layout="partitioned",
+            row_group_size=200,
+        )
+    )
+    data_transformation.data_cleaning()
+
+    catalog = data_transformation.update_catalog()
+
+    file_name = os.path.join("dataset", "year=2019", "month=03", "part-0.parquet")
+    entry = catalog.entries[file_name]
+    metadata = pq.ParquetFile(out_dir / file_name).metadata
+    assert list(catalog.entries) == [file_name]
+    assert entry["month"] == "2019-03"
+    assert entry["num_rows"] == metadata.num_rows
+    assert len(entry["row_groups"]) == metadata.num_row_groups > 1
+    assert entry["columns"]["date"] == "date32[day]"
+    assert catalog.value_range(file_name, "date") == ["2019-03-01", "2019-03-31"]
+    # Sorted by pickup, a week of the month is a fraction of the row groups
+    selected = catalog.row_groups(file_name, "date", "2019-03-08", "2019-03-15")
+    assert 0 < len(selected) < metadata.num_row_groups / 2
+    assert (out_dir / "catalog.json").exists()
+
+
+# Test that the zone file only keys the months whose zones come from coordinates
+def test_cache_key_zone_file(config, tmp_path):
+    import json
+
+    zone_file = tmp_path / "zones.geojson"
+    zone_file.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "properties": {"LocationID": 1},
+                        "geometry": {
+                            "type": "Polygon",
+                            "coordinates": [square(0, 0, 1, 1)],
+                        },
+                    }
+                ],
+            }
+        )
+    )
+    coordinates_path = tmp_path / "yellow_tripdata_2009-03.parquet"
+    write_raw_month(coordinates_path, string_timestamps=True)
+    raw = pd.read_parquet(coordinates_path)
+    for column in ("Start_Lon", "Start_Lat", "End_Lon", "End_Lat"):
+        raw[column] = 0.5
+    raw.to_parquet(coordinates_path, index=False)
+    zones_path = tmp_path / "yellow_tripdata_2019-03.parquet"
+    write_raw_month(zones_path)
+    zone_config = dataclasses.replace(
+        config,
+        root_dir=str(tmp_path),
+        data_path=str(tmp_path),
+        zone_file=str(zone_file),
+        zone_grid_size=4,
+    )
+
+    def cache_keys(run_config):
+        data_transformation = dt.DataTransformation(run_config)
+        return [
+            data_transformation.cache_key(data_transformation.raw_entry(path.name))
+            for path in (coordinates_path, zones_path)
+        ]
+
+    before = cache_keys(zone_config)
+    stat = os.stat(zone_file)
+    os.utime(zone_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    after = cache_keys(zone_config)
+
+    assert after[0] != before[0]
+    assert after[1] == before[1]
+
+    # The grid size does not change the output, another zone file only keys the months
+    # that use it
+    assert cache_keys(dataclasses.replace(zone_config, zone_grid_size=8)) == after
+    moved = tmp_path / "moved.geojson"
+    moved.write_bytes(zone_file.read_bytes())
+    os.utime(moved, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    moved_keys = cache_keys(dataclasses.replace(zone_config, zone_file=str(moved)))
+    assert moved_keys[0] != after[0]
+    assert moved_keys[1] == after[1]
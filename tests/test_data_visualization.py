@@ -4,6 +4,11 @@ from src.entity import DataVisualizationConfig
 import src.components.data_visualization as dv
 import pandas as pd
 import os
+import dataclasses
+from datetime import date
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
 # Fixture for DataIngestionConfig
@@ -29,6 +34,208 @@ def test_initialization(data_visualization, config):
     assert data_visualization.config == config
 
 
+# Test listing the pruned files of both output layouts
+def test_list_pruned_files(config, tmp_path):
+    (tmp_path / "pruned-yellow_tripdata_2009-04.parquet").touch()
+    (tmp_path / "dtype_report.yaml").touch()
+    partition = tmp_path / "dataset" / "year=2019" / "month=03"
+    partition.mkdir(parents=True)
+    (partition / "part-0.parquet").touch()
+    (partition / ".part-0.parquet.tmp").touch()
+
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(config, data_path=str(tmp_path))
+    )
+    pruned_files = data_visualization.list_pruned_files()
+
+    assert sorted(pruned_files) == [
+        os.path.join("dataset", "year=2019", "month=03", "part-0.parquet"),
+        "pruned-yellow_tripdata_2009-04.parquet",
+    ]
+    assert [data_visualization.pruned_file_month(f) for f in sorted(pruned_files)] == [
+        "2019-03",
+        "2009-04",
+    ]
+
+
+# Test that a month found in both layouts is listed once, with its newest file
+def test_list_pruned_files_both_layouts(config, tmp_path):
+    flat = tmp_path / "pruned-yellow_tripdata_2019-03.parquet"
+    flat.touch()
+    os.utime(flat, (0, 0))
+    partition = tmp_path / "dataset" / "year=2019" / "month=03"
+    partition.mkdir(parents=True)
+    (partition / "part-0.parquet").touch()
+
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(config, data_path=str(tmp_path))
+    )
+
+    assert data_visualization.list_pruned_files() == [
+        os.path.join("dataset", "year=2019", "month=03", "part-0.parquet")
+    ]
+
+
+# Test loading all months of both layouts into one table
+def test_load_all(config, tmp_path):
+    schema = pa.schema([("trip_distance", pa.float32()), ("date", pa.date32())])
+    table = pa.table(
+        {"trip_distance": [1.5, 2.5], "date": [date(2009, 4, 5), date(2009, 4, 6)]},
+        schema=schema,
+    )
+    pq.write_table(table, tmp_path / "pruned-yellow_tripdata_2009-04.parquet")
+    partition = tmp_path / "dataset" / "year=2019" / "month=03"
+    partition.mkdir(parents=True)
+    pq.write_table(table, partition / "part-0.parquet")
+
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(config, data_path=str(tmp_path))
+    )
+    combined = data_visualization.load_all(columns=["trip_distance"])
+
+    assert combined.schema == pa.schema([("trip_distance", pa.float32())])
+    assert combined.num_rows == 4
+    assert combined.column("trip_distance").num_chunks == 2
+
+
+# Test that both analyses give the same result from sidecars and from the pruned files
+def test_analyses_from_sidecars(config, tmp_path):
+    df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(
+                ["2009-04-05", "2009-04-05", "2009-04-08", "2009-04-09"]
+            ).date,
+            "trip_duration": [100.0, 300.0, 200.0, 400.0],
+            "trip_distance": [1.0, 3.0, 2.0, 5.0],
+        }
+    )
+    df.to_parquet(tmp_path / "pruned-yellow_tripdata_2009-04.parquet", index=False)
+    sidecar = df.groupby("date").agg(
+        count=("trip_duration", "size"),
+        trip_duration_sum=("trip_duration", "sum"),
+        trip_distance_sum=("trip_distance", "sum"),
+    )
+    (tmp_path / "sidecars").mkdir()
+
+    results = {}
+    for source in ("pruned", "sidecar"):
+        if source == "sidecar":
+            sidecar.reset_index().to_parquet(
+                tmp_path / "sidecars" / "2009-04.parquet", index=False
+            )
+        root_dir = tmp_path / source
+        root_dir.mkdir()
+        data_visualization = dv.DataVisualization(
+            dataclasses.replace(
+                config, data_path=str(tmp_path), root_dir=str(root_dir), rolling_days=2
+            )
+        )
+        data_visualization.calculate_monthly_average()
+        data_visualization.calculate_rolling_average()
+        results[source] = [
+            pd.read_parquet(root_dir / config.monthly_average_file_name),
+            pd.read_parquet(root_dir / config.rolling_average_file_name),
+        ]
+
+    monthly, rolling = results["sidecar"]
+    assert monthly["average_trip_duration"].iloc[0] == 250.0
+    assert len(rolling) == 5
+    assert rolling["trip_duration"].isna().sum() == 2
+    for expected, actual in zip(results["pruned"], results["sidecar"]):
+        pd.testing.assert_frame_equal(expected, actual, check_freq=False)
+
+
+# Test that an incremental update appends new months and matches a full recomputation
+def test_calculate_rolling_average_incremental(config, tmp_path):
+    def write_month(month, days):
+        pd.DataFrame(
+            {
+                "date": pd.date_range(f"{month}-01", periods=days).date,
+                "trip_duration": np.arange(days) * 10.0 + 100,
+                "trip_distance": np.arange(days) * 0.5 + 1,
+            }
+        ).to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+
+    def visualization(root_dir, incremental):
+        root_dir.mkdir(exist_ok=True)
+        return dv.DataVisualization(
+            dataclasses.replace(
+                config,
+                data_path=str(tmp_path),
+                root_dir=str(root_dir),
+                rolling_days=5,
+                incremental=incremental,
+            )
+        )
+
+    write_month("2009-04", 30)
+    incremental = visualization(tmp_path / "incremental", True)
+    incremental.calculate_rolling_average()
+
+    write_month("2009-05", 31)
+    with patch.object(
+        incremental, "load_daily", wraps=incremental.load_daily
+    ) as load_daily:
+        incremental.calculate_rolling_average()
+    load_daily.assert_called_once_with("pruned-yellow_tripdata_2009-05.parquet")
+
+    full = visualization(tmp_path / "full", False)
+    full.calculate_rolling_average()
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(tmp_path / "incremental" / config.rolling_average_file_name),
+        pd.read_parquet(tmp_path / "full" / config.rolling_average_file_name),
+    )
+
+    # A month before the persisted ones forces a full recomputation
+    write_month("2009-03", 31)
+    with patch.object(
+        incremental, "load_daily", wraps=incremental.load_daily
+    ) as load_daily:
+        incremental.calculate_rolling_average()
+    assert load_daily.call_count == 3
+
+
+# Test that run_analyses keeps the incremental updates of the averages
+@patch(
+    "src.components.data_visualization.DataVisualization.plot_interactive_trip_length"
+)
+def test_run_analyses_incremental(mock_plot_interactive, config, tmp_path):
+    def write_month(month):
+        pd.DataFrame(
+            {
+                "date": pd.date_range(f"{month}-01", periods=28).date,
+                "trip_duration": np.arange(28) * 10.0 + 100,
+                "trip_distance": np.arange(28) * 0.5 + 1,
+            }
+        ).to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+
+    root_dir = tmp_path / "out"
+    root_dir.mkdir()
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(
+            config, data_path=str(tmp_path), root_dir=str(root_dir), incremental=True
+        )
+    )
+    names = ["monthly_average", "rolling_average"]
+    write_month("2009-04")
+    write_month("2009-05")
+    data_visualization.run_analyses(names)
+
+    write_month("2009-06")
+    with patch.object(
+        data_visualization, "scan_month", wraps=data_visualization.scan_month
+    ) as scan_month, patch.object(
+        data_visualization, "load_daily", wraps=data_visualization.load_daily
+    ) as load_daily:
+        assert sorted(data_visualization.run_analyses(names)) == names
+    # The new month is scanned once for both averages, which reload nothing
+    scan_month.assert_called_once_with("pruned-yellow_tripdata_2009-06.parquet", names)
+    load_daily.assert_not_called()
+    monthly = pd.read_parquet(root_dir / config.monthly_average_file_name)
+    assert monthly["date"].tolist() == ["2009-04-01", "2009-05-01", "2009-06-01"]
+    assert len(pd.read_parquet(root_dir / config.rolling_average_file_name)) == 28 * 3
+
+
 # Test calculate_monthly_average
 @patch("pandas.DataFrame.to_parquet")
 @patch("os.listdir")
@@ -60,6 +267,26 @@ def test_calculate_monthly_average(
     )
 
 
+# Test that the monthly averages are in date order whatever the order of the files
+def test_monthly_frame_order(data_visualization):
+    dailies = {
+        f"pruned-yellow_tripdata_2009-{month:02d}.parquet": pd.DataFrame(
+            {
+                "count": [2],
+                "trip_duration_sum": [100.0 * month],
+                "trip_distance_sum": [2.0 * month],
+            }
+        )
+        for month in (5, 3, 4)
+    }
+
+    df = data_visualization.monthly_frame(dailies)
+
+    assert df["date"].tolist() == ["2009-03-01", "2009-04-01", "2009-05-01"]
+    assert df["average_trip_duration"].tolist() == [150.0, 200.0, 250.0]
+    assert df.index.tolist() == [0, 1, 2]
+
+
 # Test calculate_rolling_average
 @patch("pandas.DataFrame.to_parquet")
 @patch("os.listdir")
@@ -114,7 +341,7 @@ def test_execute_analysis(
 ):
     analysis_type = "rolling_average"  # Example analysis type
     file_path = os.path.join(
-        data_visualization.config.root_dir, "existing_file_count.yaml"
+        data_visualization.config.root_dir, f"{analysis_type}_dependencies.yaml"
     )
     analysis_file = os.path.join(
         data_visualization.config.root_dir, f"{analysis_type}_trip_length.parquet"
@@ -127,7 +354,7 @@ def test_execute_analysis(
         "file1.parquet",
         "file2.parquet",
     ]  # Two files in directory
-    mock_load_yaml.return_value = {"file_count": 1}  # Current count is 1
+    mock_load_yaml.return_value = {}
 
     # Execute the method
     data_visualization.execute_analysis(analysis_type)
@@ -141,3 +368,465 @@ def test_execute_analysis(
 
     # Verify plotting is called
     mock_plot_interactive.assert_called_with(analysis_file)
+
+
+# Test that execute_analysis recomputes only the months whose inputs changed
+@patch(
+    "src.components.data_visualization.DataVisualization.plot_interactive_trip_length"
+)
+def test_execute_analysis_dependencies(mock_plot_interactive, config, tmp_path):
+    def write_month(month, trip_duration):
+        pd.DataFrame(
+            {
+                "date": pd.date_range(f"{month}-01", periods=3).date,
+                "trip_duration": [trip_duration] * 3,
+                "trip_distance": [2.0] * 3,
+            }
+        ).to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+
+    write_month("2009-04", 100.0)
+    write_month("2009-05", 200.0)
+    root_dir = tmp_path / "out"
+    root_dir.mkdir()
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(config, data_path=str(tmp_path), root_dir=str(root_dir))
+    )
+
+    def run():
+        with patch.object(
+            data_visualization, "load_daily", wraps=data_visualization.load_daily
+        ) as load_daily:
+            data_visualization.execute_analysis("monthly_average")
+        return sorted(call.args[0] for call in load_daily.call_args_list)
+
+    assert run() == [
+        "pruned-yellow_tripdata_2009-04.parquet",
+        "pruned-yellow_tripdata_2009-05.parquet",
+    ]
+    # Unchanged, and touched but unchanged, inputs are not read again
+    assert run() == []
+    os.utime(tmp_path / "pruned-yellow_tripdata_2009-04.parquet")
+    assert run() == []
+
+    # A revised month is recomputed alone, the others are kept
+    write_month("2009-05", 300.0)
+    assert run() == ["pruned-yellow_tripdata_2009-05.parquet"]
+    monthly = pd.read_parquet(root_dir / config.monthly_average_file_name)
+    assert monthly["date"].tolist() == ["2009-04-01", "2009-05-01"]
+    assert monthly["average_trip_duration"].tolist() == [100.0, 300.0]
+
+    # A removed month is dropped
+    os.remove(tmp_path / "pruned-yellow_tripdata_2009-04.parquet")
+    assert run() == []
+    monthly = pd.read_parquet(root_dir / config.monthly_average_file_name)
+    assert monthly["date"].tolist() == ["2009-05-01"]
+
+
+# Test that the process-pool aggregation matches the sequential one
+def test_analyses_parallel(config, tmp_path):
+    for month in ("2009-04", "2009-05", "2009-06"):
+        pd.DataFrame(
+            {
+                "date": pd.date_range(f"{month}-01", periods=20).date,
+                "trip_duration": np.arange(20) * 10.0,
+                "trip_distance": np.arange(20) * 0.5,
+                "total_amount": np.arange(20) * 2.0,
+            }
+        ).to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+
+    results = {}
+    for max_workers in (1, 2):
+        root_dir = tmp_path / f"workers-{max_workers}"
+        root_dir.mkdir()
+        data_visualization = dv.DataVisualization(
+            dataclasses.replace(
+                config,
+                data_path=str(tmp_path),
+                root_dir=str(root_dir),
+                max_workers=max_workers,
+            )
+        )
+        data_visualization.calculate_monthly_average()
+        data_visualization.calculate_rolling_average()
+        results[max_workers] = [
+            pd.read_parquet(root_dir / config.monthly_average_file_name),
+            pd.read_parquet(root_dir / config.rolling_average_file_name),
+        ]
+
+    for expected, actual in zip(results[1], results[2]):
+        pd.testing.assert_frame_equal(expected, actual)
+
+
+# Test that load_data reads only the requested columns
+def test_load_data_columns(data_visualization, tmp_path):
+    path = tmp_path / "pruned-yellow_tripdata_2009-04.parquet"
+    pd.DataFrame(
+        {
+            "date": pd.date_range("2009-04-01", periods=2).date,
+            "trip_duration": [100.0, 200.0],
+            "total_amount": [5.0, 6.0],
+        }
+    ).to_parquet(path, index=False)
+
+    df = data_visualization.load_data(str(path), columns=["date", "trip_duration"])
+
+    assert list(df.columns) == ["trip_duration"]
+    assert isinstance(df.index, pd.DatetimeIndex)
+
+
+# Test the prefix-sum daily index against the rolling average and direct means
+def test_build_daily_index(config, tmp_path):
+    frames = []
+    for month in ("2009-04", "2009-05"):
+        days = pd.date_range(f"{month}-01", periods=28)
+        df = pd.DataFrame(
+            {
+                "date": np.repeat(days.date, 2),
+                "trip_duration": np.arange(56) * 10.0 + 100,
+                "trip_distance": np.arange(56) * 0.5 + 1,
+            }
+        )
+        df.to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+        frames.append(df)
+    trips = pd.concat(frames)
+    root_dir = tmp_path / "out"
+    root_dir.mkdir()
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(
+            config, data_path=str(tmp_path), root_dir=str(root_dir), rolling_days=7
+        )
+    )
+
+    index = data_visualization.build_daily_index()
+
+    assert isinstance(index.arrays["count"], np.memmap)
+    assert index.range_average(
+        "trip_duration", "2009-04-10", "2009-05-03"
+    ) == pytest.approx(
+        trips.loc[
+            (trips["date"] >= date(2009, 4, 10)) & (trips["date"] < date(2009, 5, 3)),
+            "trip_duration",
+        ].mean()
+    )
+    assert np.isnan(index.range_average("trip_duration", "2010-01-01", "2010-02-01"))
+
+    data_visualization.calculate_rolling_average()
+    rolling = pd.read_parquet(root_dir / config.rolling_average_file_name)
+    # The index covers the calendar gap between the months, the rolling average does not
+    expected = rolling.set_index("date")["average_trip_duration"].loc[:"2009-04-28"]
+    actual = index.rolling_average("trip_duration", 7).loc[:"2009-04-28"]
+    np.testing.assert_allclose(actual.values, expected.values)
+
+    # Unchanged inputs do not rebuild the index
+    with patch("src.components.data_visualization.DailyIndex.build") as build:
+        data_visualization.build_daily_index()
+    build.assert_not_called()
+
+
+def fare_partial(visualization, scan):
+    return scan.trips["total_amount"].sum()
+
+
+def fare_finalize(visualization, partials):
+    return pd.DataFrame({"total_amount": [sum(partials.values())]})
+
+
+# Test that registered analyses share one scan per month
+@patch(
+    "src.components.data_visualization.DataVisualization.plot_interactive_trip_length"
+)
+def test_run_analyses(mock_plot_interactive, config, tmp_path, monkeypatch):
+    for month in ("2009-04", "2009-05"):
+        pd.DataFrame(
+            {
+                "date": np.repeat(pd.date_range(f"{month}-01", periods=10).date, 2),
+                "trip_duration": np.arange(20) * 10.0,
+                "trip_distance": np.arange(20) * 0.5,
+                "total_amount": np.full(20, 2.0),
+            }
+        ).to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+    monkeypatch.setitem(
+        dv.ANALYSES,
+        "total_fare",
+        dv.Analysis("total_fare", ("total_amount",), fare_partial, fare_finalize),
+    )
+    root_dir = tmp_path / "out"
+    root_dir.mkdir()
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(config, data_path=str(tmp_path), root_dir=str(root_dir))
+    )
+
+    with patch("pyarrow.parquet.read_table", wraps=pq.read_table) as read_table:
+        recomputed = data_visualization.run_analyses()
+
+    assert sorted(recomputed) == [
+        "monthly_average",
+        "monthly_percentiles",
+        "rolling_average",
+        "rolling_percentiles",
+        "total_fare",
+        "zone_matrix",
+    ]
+    # One read per month for all scanned analyses, and one for the sketches of each month,
+    # which has no sketch file here. The averages use the daily aggregates of the scan
+    pruned_reads = [
+        call.args[0]
+        for call in read_table.call_args_list
+        if os.path.basename(call.args[0]).startswith("pruned-")
+    ]
+    assert len(pruned_reads) == 4
+    assert len(set(pruned_reads)) == 2
+    assert pd.read_parquet(root_dir / "total_fare.parquet")["total_amount"][0] == 80.0
+    assert mock_plot_interactive.call_count == 2
+
+    results = [
+        pd.read_parquet(root_dir / config.monthly_average_file_name),
+        pd.read_parquet(root_dir / config.rolling_average_file_name),
+    ]
+    data_visualization.calculate_monthly_average()
+    data_visualization.calculate_rolling_average()
+    pd.testing.assert_frame_equal(
+        results[0].sort_values("date", ignore_index=True),
+        pd.read_parquet(root_dir / config.monthly_average_file_name).sort_values(
+            "date", ignore_index=True
+        ),
+    )
+    pd.testing.assert_frame_equal(
+        results[1], pd.read_parquet(root_dir / config.rolling_average_file_name)
+    )
+
+    assert data_visualization.run_analyses() == []
+
+
+# Test monthly, rolling and range percentiles merged from the daily sketches
+@pytest.mark.parametrize("with_sketches", [True, False])
+def test_percentiles_from_sketches(config, tmp_path, with_sketches):
+    from src.utils.quantile_sketch import QuantileSketch
+
+    rng = np.random.default_rng(0)
+    sketch = QuantileSketch()
+    frames = []
+    (tmp_path / "sketches").mkdir()
+    for month, days in (("2009-04", 30), ("2009-05", 31)):
+        dates = pd.date_range(f"{month}-01", periods=days)
+        day = rng.integers(0, days, 3000)
+        df = pd.DataFrame(
+            {
+                "date": dates.date[day],
+                "trip_duration": rng.lognormal(6, 0.5, 3000),
+                "trip_distance": rng.lognormal(1, 0.5, 3000),
+                "total_amount": rng.lognormal(2.5, 0.5, 3000),
+            }
+        )
+        df.to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+        frames.append(df)
+        if with_sketches:
+            np.savez_compressed(
+                tmp_path / "sketches" / f"{month}.npz",
+                dates=dates.values.astype("datetime64[D]"),
+                **sketch.params(),
+                **{
+                    metric: sketch.counts(df[metric].to_numpy(), day, days)
+                    for metric in ("trip_duration", "trip_distance", "total_amount")
+                },
+            )
+    trips = pd.concat(frames)
+    root_dir = tmp_path / "out"
+    root_dir.mkdir()
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(
+            config, data_path=str(tmp_path), root_dir=str(root_dir), rolling_days=10
+        )
+    )
+    data_visualization.run_analyses(["monthly_percentiles", "rolling_percentiles"])
+
+    monthly = pd.read_parquet(root_dir / "monthly_percentiles.parquet")
+    assert monthly["date"].tolist() == ["2009-04-01", "2009-05-01"]
+    assert monthly["trip_duration_p95"][1] == pytest.approx(
+        frames[1]["trip_duration"].quantile(0.95), rel=0.03
+    )
+
+    rolling = pd.read_parquet(root_dir / "rolling_percentiles.parquet")
+    assert len(rolling) == 61
+    window = trips[
+        (trips["date"] > date(2009, 5, 10) - pd.Timedelta(days=10).to_pytimedelta())
+        & (trips["date"] <= date(2009, 5, 10))
+    ]
+    assert rolling.set_index("date").loc["2009-05-10", "total_amount_p50"] == (
+        pytest.approx(window["total_amount"].median(), rel=0.03)
+    )
+
+    percentiles = data_visualization.range_percentiles("2009-04-20", "2009-05-05")
+    in_range = trips[
+        (trips["date"] >= date(2009, 4, 20)) & (trips["date"] < date(2009, 5, 5))
+    ]
+    assert percentiles["trip_distance_p50"] == pytest.approx(
+        in_range["trip_distance"].median(), rel=0.03
+    )
+
+    # Sketches rebuilt with another accuracy invalidate the percentiles, though the daily
+    # aggregates did not change
+    if with_sketches:
+        coarse = QuantileSketch(0.2)
+        for (month, days), df in zip((("2009-04", 30), ("2009-05", 31)), frames):
+            dates = pd.date_range(f"{month}-01", periods=days)
+            day = (pd.to_datetime(df["date"]) - dates[0]).dt.days.to_numpy()
+            np.savez_compressed(
+                tmp_path / "sketches" / f"{month}.npz",
+                dates=dates.values.astype("datetime64[D]"),
+                **coarse.params(),
+                **{
+                    metric: coarse.counts(df[metric].to_numpy(), day, days)
+                    for metric in ("trip_duration", "trip_distance", "total_amount")
+                },
+            )
+        assert sorted(
+            data_visualization.run_analyses(
+                ["monthly_percentiles", "rolling_percentiles"]
+            )
+        ) == ["monthly_percentiles", "rolling_percentiles"]
+
+
+# Test the origin-destination cubes against a pandas group-by
+def test_zone_matrix(config, tmp_path):
+    from src.utils.zone_cube import ZoneCube
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for month, days in (("2011-04", 30), ("2011-05", 31)):
+        day = rng.integers(0, days, 2000)
+        df = pd.DataFrame(
+            {
+                "date": pd.date_range(f"{month}-01", periods=days).date[day],
+                "trip_duration": rng.uniform(60, 3600, 2000),
+                "trip_distance": rng.uniform(0.1, 20, 2000),
+                "pulocationid": pd.array(rng.integers(1, 6, 2000), dtype="Int16"),
+                "dolocationid": pd.array(rng.integers(1, 6, 2000), dtype="Int16"),
+            }
+        )
+        df.loc[:9, "pulocationid"] = pd.NA
+        df.to_parquet(tmp_path / f"pruned-yellow_tripdata_{month}.parquet", index=False)
+        frames.append(df)
+    # An era without zones
+    pd.DataFrame(
+        {
+            "date": pd.date_range("2010-04-01", periods=4).date,
+            "trip_duration": np.full(4, 600.0),
+            "trip_distance": np.full(4, 2.0),
+        }
+    ).to_parquet(tmp_path / "pruned-yellow_tripdata_2010-04.parquet", index=False)
+    trips = (
+        pd.concat(frames).dropna().astype({"pulocationid": int, "dolocationid": int})
+    )
+    root_dir = tmp_path / "out"
+    root_dir.mkdir()
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(config, data_path=str(tmp_path), root_dir=str(root_dir))
+    )
+
+    data_visualization.run_analyses(["zone_matrix"])
+
+    assert sorted(os.listdir(root_dir / "zone_cubes")) == ["2011-04", "2011-05"]
+    cube = ZoneCube(str(root_dir / "zone_cubes" / "2011-05"))
+    assert isinstance(cube.arrays["count"], np.memmap)
+    # Sparse: one entry per (day, pickup, dropoff) cell with trips
+    assert cube.keys.shape == cube.arrays["count"].shape
+    assert np.all(np.diff(cube.keys) > 0)
+    assert cube.arrays["count"].sum() == len(trips[trips["date"] >= date(2011, 5, 1)])
+
+    expected = (
+        trips.groupby(["pulocationid", "dolocationid"])
+        .agg(
+            count=("trip_duration", "size"),
+            average_trip_duration=("trip_duration", "mean"),
+            average_trip_distance=("trip_distance", "mean"),
+        )
+        .reset_index()
+    )
+    zone_matrix = pd.read_parquet(root_dir / "zone_matrix.parquet")
+    pd.testing.assert_frame_equal(
+        zone_matrix, expected, check_dtype=False, check_exact=False, rtol=1e-5
+    )
+
+    in_range = trips[
+        (trips["date"] >= date(2011, 4, 25)) & (trips["date"] < date(2011, 5, 3))
+    ]
+    matrix = data_visualization.zone_matrix("2011-04-25", "2011-05-03")
+    assert matrix["count"].sum() == len(in_range)
+    assert matrix.set_index(["pulocationid", "dolocationid"]).loc[
+        (1, 2), "average_trip_distance"
+    ] == pytest.approx(
+        in_range.loc[
+            (in_range["pulocationid"] == 1) & (in_range["dolocationid"] == 2),
+            "trip_distance",
+        ].mean(),
+        rel=1e-5,
+    )
+
+    # A revised month rebuilds its own cube only, the others are merged as they are. The
+    # zone matrix depends on the pruned files, not on the daily sidecars, which zone
+    # assignment does not change
+    (tmp_path / "sidecars").mkdir()
+    for month in ("2010-04", "2011-04", "2011-05"):
+        (tmp_path / "sidecars" / f"{month}.parquet").write_bytes(b"unchanged")
+    data_visualization.run_analyses(["zone_matrix"])
+    april_key = root_dir / "zone_cubes" / "2011-04" / "key.npy"
+    april_mtime = april_key.stat().st_mtime_ns
+    may = pd.read_parquet(tmp_path / "pruned-yellow_tripdata_2011-05.parquet")
+    may.iloc[:1000].to_parquet(
+        tmp_path / "pruned-yellow_tripdata_2011-05.parquet", index=False
+    )
+    with patch.object(
+        dv.ZoneCube, "build", side_effect=dv.ZoneCube.build
+    ) as mock_build:
+        assert "zone_matrix" in data_visualization.run_analyses(["zone_matrix"])
+    assert mock_build.call_count == 1
+    assert april_key.stat().st_mtime_ns == april_mtime
+    zone_matrix = pd.read_parquet(root_dir / "zone_matrix.parquet")
+    assert zone_matrix["count"].sum() == len(trips) - len(
+        may.iloc[1000:].dropna(subset=["pulocationid", "dolocationid"])
+    )
+
+
+# Test that date-range reads are planned from the footer catalog
+def test_load_range(config, tmp_path):
+    frames = []
+    for month in ("2009-04", "2009-06"):
+        df = pd.DataFrame(
+            {
+                "date": np.repeat(pd.date_range(f"{month}-01", periods=30).date, 10),
+                "trip_duration": np.arange(300) * 1.0,
+            }
+        )
+        df.to_parquet(
+            tmp_path / f"pruned-yellow_tripdata_{month}.parquet",
+            index=False,
+            row_group_size=50,
+        )
+        frames.append(df)
+    trips = pd.concat(frames)
+    data_visualization = dv.DataVisualization(
+        dataclasses.replace(config, data_path=str(tmp_path))
+    )
+
+    catalog = data_visualization.catalog()
+    assert catalog.missing_months(["2009-04", "2009-05", "2009-06"]) == ["2009-05"]
+    assert catalog.row_groups(
+        "pruned-yellow_tripdata_2009-04.parquet", "date", "2009-04-11", "2009-04-16"
+    ) == [2]
+    assert (
+        catalog.row_groups(
+            "pruned-yellow_tripdata_2009-06.parquet", "date", "2009-04-11", "2009-04-16"
+        )
+        == []
+    )
+
+    with patch("src.utils.parquet_catalog.read_footer") as read_footer:
+        df = data_visualization.load_range("2009-04-11", "2009-04-16")
+    read_footer.assert_not_called()
+    expected = trips[
+        (trips["date"] >= date(2009, 4, 11)) & (trips["date"] < date(2009, 4, 16))
+    ]
+    assert df["trip_duration"].tolist() == expected["trip_duration"].tolist()
+    assert isinstance(df.index, pd.DatetimeIndex)
+    assert data_visualization.load_range("2010-01-01", "2010-02-01").empty
@@ -0,0 +1,99 @@
+import threading
+import pytest
+import pandas as pd
+import yaml
+from unittest.mock import Mock, patch
+from src.entity import DataIngestionConfig, DataTransformationConfig, PipelineConfig
+import src.components.data_transformation as dt
+import src.pipeline.stage_streaming as stage
+from tests.test_data_ingestion import make_response
+from tests.test_data_transformation import write_raw_month
+
+
+# Fixture for a configuration manager downloading into and cleaning temporary directories
+@pytest.fixture
+def config_manager(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    manager = Mock()
+    manager.get_pipeline_config.return_value = PipelineConfig(
+        mode="streaming", queue_size=1, transform_workers=2
+    )
+    manager.get_data_ingestion_config.return_value = DataIngestionConfig(
+        root_dir=str(raw_dir),
+        source_URL="http://api.example.com/{:04d}-{:02d}.parquet",
+        local_data_name="yellow_tripdata_{:04d}-{:02d}.parquet",
+        max_retries=1,
+    )
+    manager.get_data_transformation_config.return_value = DataTransformationConfig(
+        root_dir=str(out_dir),
+        data_path=str(raw_dir),
+        lowest_speed=10,
+        highest_speed=100,
+        shortest_trip_distance=1,
+        shortest_trip_duration=300,
+        least_cost=10,
+    )
+    return manager
+
+
+# Test the streaming pipeline end to end with one bad month and one left by an earlier run
+@patch("time.sleep")
+@patch("requests.Session.get")
+def test_streaming_pipeline(mock_get, mock_sleep, config_manager, tmp_path):
+    served = {}
+    for month in ("03", "04"):
+        path = tmp_path / f"served-2019-{month}.parquet"
+        write_raw_month(path)
+        served[f"http://api.example.com/2019-{month}.parquet"] = path
+    # A month whose pickup column is missing fails cleaning
+    broken = pd.read_parquet(served["http://api.example.com/2019-04.parquet"])
+    broken.drop(columns="tpep_pickup_datetime").to_parquet(
+        served["http://api.example.com/2019-04.parquet"], index=False
+    )
+    mock_get.side_effect = lambda url, **kwargs: make_response(
+        200, served[url].read_bytes()
+    )
+    # Downloaded by an earlier run but never cleaned
+    write_raw_month(tmp_path / "raw" / "yellow_tripdata_2019-05.parquet")
+
+    full_dates = [(2019, 3), (2019, 4), (2019, 5)]
+    threads = threading.active_count()
+    with patch.object(
+        stage, "ConfigurationManager", return_value=config_manager
+    ), patch.object(
+        stage.DataIngestion, "get_full_dates", return_value=full_dates
+    ), patch.object(
+        dt.DataTransformation,
+        "clean_file",
+        autospec=True,
+        side_effect=dt.DataTransformation.clean_file,
+    ) as clean_file:
+        summary, errors = stage.StreamingIngestionTransformationPipeline().main()
+
+    # Every downloaded month went through the queue, the workers stopped afterwards
+    assert summary == {
+        "2019-03": {"status": "downloaded"},
+        "2019-04": {"status": "downloaded"},
+    }
+    assert threading.active_count() == threads
+
+    # The failed month was tried once and reported, the final pass cleaned the earlier month
+    cleaned = [call.args[1] for call in clean_file.call_args_list]
+    assert sorted(cleaned) == [
+        "yellow_tripdata_2019-03.parquet",
+        "yellow_tripdata_2019-04.parquet",
+        "yellow_tripdata_2019-05.parquet",
+    ]
+    assert list(errors) == ["yellow_tripdata_2019-04.parquet"]
+
+    out_dir = tmp_path / "out"
+    index = yaml.safe_load((out_dir / "cache_index.yaml").read_text())
+    assert sorted(index) == [
+        "yellow_tripdata_2019-03.parquet",
+        "yellow_tripdata_2019-05.parquet",
+    ]
+    assert (out_dir / "catalog.json").exists()
+    assert (tmp_path / "raw" / "catalog.json").exists()